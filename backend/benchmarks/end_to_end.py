@@ -0,0 +1,270 @@
+"""Offline end-to-end benchmark of fetch -> summarize -> push against local fake services.
+
+    python -m backend.benchmarks.end_to_end
+    python -m backend.benchmarks.end_to_end --emails 300 --together-latency 0.2 \\
+        --clio-throttle-rate 0.05 --output run.json
+    python -m backend.benchmarks.end_to_end --body-sizes 800 800 800 6000 \\
+        --together-large-latency 0.15 [--no-routing]
+
+Fake Gmail, Together and Clio servers run in-process. The services are
+driven directly (EmailService, SummarizerService, ClioService), then
+through the FastAPI routes (streamed summaries and a background push
+job). Each scenario reports throughput, p50/p95/p99 latency and peak
+Python memory as JSON, so two runs can be diffed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Keep every store in a throwaway directory and away from real credentials
+_DATA_DIR = tempfile.mkdtemp(prefix="billing-benchmark-")
+os.environ.setdefault("TOGETHER_API_KEY", "benchmark")
+os.environ.setdefault("CLIO_CLIENT_ID", "benchmark")
+os.environ.setdefault("CLIO_CLIENT_SECRET", "benchmark")
+os.environ["CREDENTIAL_STORE"] = "memory"
+for _name, _file in (
+    ("EMAIL_STORE_PATH", "emails.db"),
+    ("SUMMARY_CACHE_PATH", "summary_cache.db"),
+    ("PUSH_LEDGER_PATH", "push_ledger.db"),
+    ("MATTER_INDEX_PATH", "matters.db"),
+    ("CLIO_IMPORT_DIR", "clio_imports"),
+):
+    os.environ[_name] = os.path.join(_DATA_DIR, _file)
+
+import httpx  # noqa: E402
+from .fake_gmail import FakeGmailServer  # noqa: E402
+from .fake_services import FakeClioServer, FakeTogetherServer  # noqa: E402
+from ..config import settings  # noqa: E402
+from ..main import app  # noqa: E402
+from ..models.schemas import TokenData  # noqa: E402
+from ..services.clio_service import clio_service  # noqa: E402
+from ..services.credential_store import DEFAULT_USER_ID  # noqa: E402
+from ..services.email_service import email_service  # noqa: E402
+from ..services.job_service import job_service  # noqa: E402
+from ..services.model_router import model_router  # noqa: E402
+from ..services.summarizer_service import summarizer_service  # noqa: E402
+from ..utils.rate_limiter import TokenBucket  # noqa: E402
+from ..utils.thread_iter import iterate_in_thread  # noqa: E402
+
+
+def percentile(samples: list, pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, min(len(ordered), round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+class Scenario:
+    """Collects per-item latencies, errors and peak memory for one benchmark step"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = []
+        self.items = 0
+        self.errors = 0
+
+    def __enter__(self):
+        tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self.peak_memory = tracemalloc.get_traced_memory()[1]
+
+    def since_start(self) -> float:
+        return time.perf_counter() - self.start
+
+    def report(self) -> dict:
+        ms = [latency * 1000 for latency in self.latencies]
+        return {
+            "items": self.items,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 4),
+            "throughput_per_s": round(self.items / self.seconds, 2) if self.seconds else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(ms, 50), 2),
+                "p95": round(percentile(ms, 95), 2),
+                "p99": round(percentile(ms, 99), 2),
+                "max": round(max(ms), 2) if ms else 0.0,
+            },
+            "peak_memory_mb": round(self.peak_memory / 2 ** 20, 2),
+        }
+
+
+def record_clio_requests(scenario_ref: list):
+    """Time every Clio request, including retries, into whichever scenario is current"""
+    send = clio_service._send_activity
+
+    async def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await send(*args, **kwargs)
+        finally:
+            if scenario_ref and scenario_ref[0] is not None:
+                scenario_ref[0].latencies.append(time.perf_counter() - start)
+
+    clio_service._send_activity = timed
+
+
+async def run_services(args, token: TokenData, current: list) -> list:
+    reports = []
+
+    settings.gmail_incremental_sync = False
+    with Scenario("gmail_fetch") as scenario:
+        pages = iterate_in_thread(email_service.iter_sent_emails(args.emails))
+        emails = []
+        start = time.perf_counter()
+        async for page in pages:
+            scenario.latencies.append(time.perf_counter() - start)
+            emails.extend(page)
+            start = time.perf_counter()
+        scenario.items = len(emails)
+    reports.append(scenario)
+    settings.gmail_incremental_sync = True
+
+    with Scenario("summarize") as scenario:
+        summaries = []
+        async for _, summary in summarizer_service.iter_summaries([email.body for email in emails]):
+            scenario.latencies.append(scenario.since_start())
+            if isinstance(summary, Exception):
+                scenario.errors += 1
+            else:
+                summaries.append(summary)
+        scenario.items = len(emails)
+    reports.append(scenario)
+
+    with Scenario("clio_push") as scenario:
+        current[0] = scenario
+        results = await clio_service.push_activities(summaries, token)
+        current[0] = None
+        scenario.items = len(results)
+        scenario.errors = sum(1 for _, error in results if error)
+    reports.append(scenario)
+    return reports
+
+
+async def run_api(args, current: list) -> list:
+    reports = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        with Scenario("api_summaries_stream") as scenario:
+            async with client.stream("GET", "/api/summaries/stream", params={"max_results": args.emails}) as response:
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    scenario.latencies.append(scenario.since_start())
+                    scenario.items += 1
+                    item = json.loads(line)
+                    if "error" in item or "error" in (item.get("summary") or {}):
+                        scenario.errors += 1
+        reports.append(scenario)
+
+        with Scenario("api_push_job") as scenario:
+            current[0] = scenario
+            response = await client.post("/clio/push-summary", params={"max_results": args.emails})
+            response.raise_for_status()
+            job_id = response.json()["job_id"]
+            while True:
+                job = (await client.get(f"/jobs/{job_id}")).json()
+                if job["status"] in ("completed", "failed"):
+                    break
+                await asyncio.sleep(0.01)
+            current[0] = None
+            scenario.items = job["activities_created"]
+            scenario.errors = sum(stage["failed"] for stage in job["stages"].values())
+        reports.append(scenario)
+    return reports
+
+
+async def run(args) -> dict:
+    fault = {"retry_after": args.retry_after, "seed": args.seed}
+    gmail = FakeGmailServer(args.emails, latency=args.gmail_latency, error_rate=args.gmail_error_rate,
+                            throttle_rate=args.gmail_throttle_rate, body_sizes=args.body_sizes, **fault).start()
+    together = FakeTogetherServer(latency=args.together_latency, error_rate=args.together_error_rate,
+                                  throttle_rate=args.together_throttle_rate,
+                                  model_latency={settings.together_large_model: args.together_large_latency},
+                                  **fault).start()
+    clio = FakeClioServer(latency=args.clio_latency, error_rate=args.clio_error_rate,
+                          throttle_rate=args.clio_throttle_rate, **fault).start()
+
+    email_service.services[DEFAULT_USER_ID] = gmail.build_service()
+    summarizer_service.url = together.url
+    if args.together_rps:
+        summarizer_service.rate_limiter = TokenBucket(args.together_rps, max(1, int(args.together_rps)))
+    settings.summary_cache_enabled = args.cache
+    if args.no_routing:
+        # The baseline routing replaces: every prompt on the large model
+        settings.together_routing = False
+        settings.together_model = settings.together_large_model
+    clio_service.base_url = clio.base
+    token = TokenData(access_token="benchmark")
+    clio_service.save_user_token(DEFAULT_USER_ID, token)
+
+    current = [None]
+    record_clio_requests(current)
+    tracemalloc.start()
+    job_service.start()
+    try:
+        scenarios = await run_services(args, token, current)
+        scenarios += await run_api(args, current)
+    finally:
+        await job_service.stop()
+        await summarizer_service.aclose()
+        await clio_service.aclose()
+        tracemalloc.stop()
+        for server in (gmail, together, clio):
+            server.stop()
+
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    max_rss_mb = max_rss / 2 ** 20 if sys.platform == "darwin" else max_rss / 2 ** 10
+
+    return {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "scenarios": {scenario.name: scenario.report() for scenario in scenarios},
+        "servers": {"gmail": gmail.stats(), "together": together.stats(), "clio": clio.stats()},
+        "together_prompt_tokens": together.prompt_tokens,
+        "together_models": dict(together.models),
+        "routing": model_router.stats(),
+        "max_rss_mb": round(max_rss_mb, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", action="store_true", help="leave the summary cache on between scenarios")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--together-rps", type=float, default=0, help="override the Together rate limit")
+    for service, latency in (("gmail", 0.005), ("together", 0.05), ("clio", 0.02)):
+        parser.add_argument(f"--{service}-latency", type=float, default=latency)
+        parser.add_argument(f"--{service}-error-rate", type=float, default=0.0)
+        parser.add_argument(f"--{service}-throttle-rate", type=float, default=0.0)
+    parser.add_argument("--body-sizes", type=int, nargs="+", default=[800],
+                        help="email body sizes in characters, cycled through the mailbox")
+    parser.add_argument("--together-large-latency", type=float, default=0.0,
+                        help="extra seconds per request to the large model")
+    parser.add_argument("--no-routing", action="store_true", help="send every prompt to the large model")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Local stand-in for the Gmail API, used by the offline benchmarks.
+
+Serves a trimmed discovery document so googleapiclient can build a real
+service object against it, plus the list/get/batch endpoints that
+EmailService calls. Every HTTP round trip sleeps for ``latency`` seconds,
+and FakeServer's error/throttle injection applies to everything except the
+discovery document. ``part_throttle_rate`` additionally fails single calls
+inside a batch with 429, the way Gmail throttles busy batches.
+"""
+import base64
+import json
+import random
+import urllib.parse
+from email.parser import Parser
+from typing import Dict, Any, List, Sequence
+
+from .fake_services import FakeServer
+
+WORDS = (
+    "agreement motion discovery deposition settlement counsel review draft clause indemnity "
+    "lease filing hearing court schedule client exhibit witness contract amendment invoice "
+    "deadline negotiation release waiver subpoena brief memo research precedent appeal"
+).split()
+
+
+def _method(method_id: str, path: str, http_method: str, params: List[str], response: str) -> Dict[str, Any]:
+    parameters = {
+        name: {"type": "string", "location": "path" if "{" + name + "}" in path else "query"}
+        for name in params
+    }
+    return {
+        "id": method_id,
+        "path": path,
+        "flatPath": path,
+        "httpMethod": http_method,
+        "parameters": parameters,
+        "parameterOrder": [name for name in params if "{" + name + "}" in path],
+        "response": {"$ref": response},
+    }
+
+
+def build_discovery_document(root_url: str) -> Dict[str, Any]:
+    base = "gmail/v1/users/{userId}"
+    messages = {
+        "list": _method("gmail.users.messages.list", f"{base}/messages", "GET",
+                        ["userId", "labelIds", "maxResults", "pageToken", "q"], "ListMessagesResponse"),
+        "get": _method("gmail.users.messages.get", f"{base}/messages/{{id}}", "GET",
+                       ["userId", "id", "format"], "Message"),
+    }
+    history = {
+        "list": _method("gmail.users.history.list", f"{base}/history", "GET",
+                        ["userId", "startHistoryId", "labelId", "historyTypes", "maxResults", "pageToken"],
+                        "ListHistoryResponse"),
+    }
+    history["list"]["parameters"]["historyTypes"]["repeated"] = True
+    history["list"]["parameters"]["maxResults"]["type"] = "integer"
+    users = {
+        "getProfile": _method("gmail.users.getProfile", f"{base}/profile", "GET", ["userId"], "Profile"),
+    }
+    messages["list"]["parameters"]["labelIds"]["repeated"] = True
+    messages["list"]["parameters"]["maxResults"]["type"] = "integer"
+
+    return {
+        "kind": "discovery#restDescription",
+        "discoveryVersion": "v1",
+        "id": "gmail:v1",
+        "name": "gmail",
+        "version": "v1",
+        "protocol": "rest",
+        "rootUrl": root_url,
+        "servicePath": "",
+        "batchPath": "batch",
+        "parameters": {"alt": {"type": "string", "location": "query"}},
+        "schemas": {
+            "Message": {"id": "Message", "type": "object"},
+            "ListMessagesResponse": {"id": "ListMessagesResponse", "type": "object"},
+            "ListHistoryResponse": {"id": "ListHistoryResponse", "type": "object"},
+            "Profile": {"id": "Profile", "type": "object"},
+        },
+        "resources": {
+            "users": {
+                "methods": users,
+                "resources": {"messages": {"methods": messages}, "history": {"methods": history}},
+            }
+        },
+    }
+
+
+def make_message(index: int, body_size: int = 800, id_prefix: str = "") -> Dict[str, Any]:
+    # Seeded per message so bodies are stable across runs but not near-duplicates of each other
+    rng = random.Random(f"{id_prefix}{index}")
+    words = " ".join(rng.choice(WORDS) for _ in range(body_size // 8))
+    body = f"Dear client,\n\nFollowing up on matter {index}. {words}."
+    data = base64.urlsafe_b64encode(body.encode("utf-8")).decode("ascii")
+    return {
+        "id": f"{id_prefix}m{index:08d}",
+        "threadId": f"{id_prefix}t{index // 3:08d}",
+        "labelIds": ["SENT"],
+        "internalDate": str(1700000000000 + index * 60000),
+        "payload": {
+            "mimeType": "text/plain",
+            "headers": [
+                {"name": "Subject", "value": f"Matter update #{index}"},
+                {"name": "To", "value": f"client{index % 40}@example.com"},
+                {"name": "From", "value": "attorney@example.com"},
+            ],
+            "body": {"data": data},
+        },
+    }
+
+
+def build_service(discovery_url: str):
+    """Build a googleapiclient service object against a fake server's discovery URL"""
+    import httplib2
+    from googleapiclient.discovery import build
+
+    return build(
+        "gmail", "v1",
+        http=httplib2.Http(),
+        discoveryServiceUrl=discovery_url,
+        static_discovery=False,
+        cache_discovery=False,
+    )
+
+
+class FakeGmailServer(FakeServer):
+    def __init__(self, num_messages: int = 500, latency: float = 0.02,
+                 address: str = "attorney@example.com", id_prefix: str = "",
+                 body_sizes: Sequence[int] = (800,), part_throttle_rate: float = 0.0, **kwargs):
+        super().__init__(latency=latency, **kwargs)
+        self.part_throttle_rate = part_throttle_rate
+        self.num_messages = num_messages
+        self.address = address
+        self.id_prefix = id_prefix
+        # Message i gets body_sizes[i % len(body_sizes)] characters of text
+        self.body_sizes = body_sizes
+        self.history_id = 1000
+        # historyIds older than this are reported as expired (HTTP 404)
+        self.history_floor = self.history_id
+        self._history = []
+        self._messages = {}
+        self._order = []
+        for i in range(num_messages - 1, -1, -1):
+            message = self._make_message(i)
+            self._messages[message["id"]] = message
+            self._order.append(message["id"])
+
+    @property
+    def discovery_url(self) -> str:
+        return f"{self.base_url}discovery/gmail/v1/rest"
+
+    def add_messages(self, count: int):
+        """Simulate newly sent mail, recording a history entry per message"""
+        with self._lock:
+            for _ in range(count):
+                message = self._make_message(self.num_messages)
+                self.num_messages += 1
+                self.history_id += 1
+                self._messages[message["id"]] = message
+                self._order.insert(0, message["id"])
+                self._history.append((self.history_id, message))
+
+    def expire_history(self):
+        """Drop all recorded history so older checkpoints return 404"""
+        with self._lock:
+            self._history = []
+            self.history_floor = self.history_id
+
+    def fault_exempt(self, method: str, path: str) -> bool:
+        return path.startswith("/discovery/")
+
+    def _make_message(self, index: int) -> Dict[str, Any]:
+        return make_message(index, self.body_sizes[index % len(self.body_sizes)], self.id_prefix)
+
+    def build_service(self):
+        """Build a googleapiclient service object pointed at this server"""
+        return build_service(self.discovery_url)
+
+    # Request handling -----------------------------------------------------
+
+    def _route(self, method: str, path: str, query: Dict[str, List[str]], body: bytes, headers) -> tuple:
+        parts = [p for p in path.split("/") if p]
+
+        if method == "GET" and parts == ["discovery", "gmail", "v1", "rest"]:
+            return 200, build_discovery_document(self.base_url)
+
+        if method == "POST" and parts == ["batch"]:
+            return self._batch(headers.get("content-type", ""), body)
+
+        if method == "GET" and len(parts) == 5 and parts[:3] == ["gmail", "v1", "users"]:
+            if parts[4] == "profile":
+                return 200, {"emailAddress": self.address, "historyId": str(self.history_id)}
+            if parts[4] == "history":
+                return self._list_history(query)
+
+        if len(parts) >= 5 and parts[:3] == ["gmail", "v1", "users"] and parts[4] == "messages":
+            if len(parts) == 5 and method == "GET":
+                return self._list_messages(query)
+            if len(parts) == 6 and method == "GET":
+                message = self._messages.get(parts[5])
+                if message is None:
+                    return 404, {"error": {"code": 404, "message": "Not Found"}}
+                return 200, message
+
+        return 404, {"error": {"code": 404, "message": f"No route for {method} {path}"}}
+
+    def _list_messages(self, query: Dict[str, List[str]]) -> tuple:
+        max_results = int(query.get("maxResults", ["100"])[0])
+        offset = int(query.get("pageToken", ["0"])[0])
+        page = self._order[offset:offset + max_results]
+        response = {"messages": [{"id": mid, "threadId": self._messages[mid]["threadId"]} for mid in page]}
+        if offset + max_results < len(self._order):
+            response["nextPageToken"] = str(offset + max_results)
+        return 200, response
+
+    def _list_history(self, query: Dict[str, List[str]]) -> tuple:
+        start = int(query["startHistoryId"][0])
+        if start < self.history_floor:
+            return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+
+        records = [
+            {
+                "id": str(history_id),
+                "messagesAdded": [{"message": {"id": message["id"], "threadId": message["threadId"],
+                                               "labelIds": message["labelIds"]}}],
+            }
+            for history_id, message in self._history if history_id > start
+        ]
+        return 200, {"history": records, "historyId": str(self.history_id)}
+
+    def _batch(self, content_type: str, body: bytes) -> tuple:
+        envelope = Parser().parsestr(f"Content-Type: {content_type}\r\n\r\n" + body.decode("utf-8"))
+        boundary = "batch_fake_gmail_boundary"
+        chunks = []
+
+        for part in envelope.get_payload():
+            request_line, _, rest = part.get_payload().lstrip().partition("\n")
+            method, target, _ = request_line.strip().split(" ", 2)
+            parsed = urllib.parse.urlsplit(target)
+            with self._lock:
+                throttled = self._random.random() < self.part_throttle_rate
+            if throttled:
+                status, payload = 429, {"error": {"code": 429, "message": "Too many concurrent requests for user"}}
+            else:
+                status, payload = self._route(method, parsed.path, urllib.parse.parse_qs(parsed.query), b"", {})
+            content_id = part["Content-ID"][1:-1]
+            chunks.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+
+        chunks.append(f"--{boundary}--\r\n")
+        return 200, "".join(chunks), f"multipart/mixed; boundary={boundary}"
@@ -0,0 +1,226 @@
+"""Local stand-ins for Together AI and Clio, plus the HTTP plumbing shared with fake_gmail.
+
+Every server runs in a background thread on an ephemeral port and can inject
+latency, 5xx errors and 429 throttling so the client retry and concurrency
+paths are exercised without touching real services.
+"""
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+class FakeServer:
+    """ThreadingHTTPServer with fault injection; subclasses implement _route"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: float = 0.05, seed: int = 0, host: str = "127.0.0.1"):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.request_count = 0
+        self.status_counts = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, 0), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_counters(self):
+        with self._lock:
+            self.request_count = 0
+            self.status_counts = Counter()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {"requests": self.request_count, "statuses": {str(k): v for k, v in sorted(self.status_counts.items())}}
+
+    def fault_exempt(self, method: str, path: str) -> bool:
+        """Requests that never fail, e.g. the Gmail discovery document"""
+        return False
+
+    def _route(self, method: str, path: str, query: Dict[str, List[str]], body: bytes, headers) -> tuple:
+        raise NotImplementedError
+
+    def _fault(self, method: str, path: str):
+        if self.fault_exempt(method, path):
+            return None
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.throttle_rate:
+            return 429, {"error": "rate limited"}, {"Retry-After": f"{self.retry_after:g}"}
+        if roll < self.throttle_rate + self.error_rate:
+            return 503, {"error": "injected failure"}, {}
+        return None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self, method: str):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if server.latency:
+                    time.sleep(server.latency)
+
+                parsed = urllib.parse.urlsplit(self.path)
+                extra_headers = {}
+                fault = server._fault(method, parsed.path)
+                if fault:
+                    status, payload, extra_headers = fault
+                    content_type = "application/json; charset=UTF-8"
+                else:
+                    result = server._route(method, parsed.path, urllib.parse.parse_qs(parsed.query), body, self.headers)
+                    status, payload = result[0], result[1]
+                    content_type = result[2] if len(result) > 2 else "application/json; charset=UTF-8"
+                with server._lock:
+                    server.request_count += 1
+                    server.status_counts[status] += 1
+
+                data = payload if isinstance(payload, str) else json.dumps(payload)
+                data = data.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in extra_headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PATCH(self):
+                self._handle("PATCH")
+
+        return Handler
+
+
+class FakeTogetherServer(FakeServer):
+    """Answers /v1/chat/completions with a summary object, or an array for batch prompts.
+
+    model_latency adds per-model seconds on top of latency, e.g. to make a
+    larger model slower than a small one.
+    """
+
+    BATCH_SIZE = re.compile(r"JSON array with exactly (\d+) objects")
+
+    def __init__(self, model_latency: Optional[Dict[str, float]] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.model_latency = model_latency or {}
+        self.prompt_tokens = 0
+        self.models = Counter()
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}v1/chat/completions"
+
+    def _route(self, method: str, path: str, query, body: bytes, headers) -> tuple:
+        if method != "POST" or path != "/v1/chat/completions":
+            return 404, {"error": f"No route for {method} {path}"}
+
+        request = json.loads(body)
+        prompt = request["messages"][-1]["content"]
+        model = request.get("model")
+        with self._lock:
+            self.prompt_tokens += len(prompt) // 4
+            self.models[model] += 1
+        if self.model_latency.get(model):
+            time.sleep(self.model_latency[model])
+        batch = self.BATCH_SIZE.search(prompt)
+        if batch:
+            content = json.dumps([self._summary(i) for i in range(int(batch.group(1)))])
+        else:
+            content = json.dumps(self._summary(0))
+
+        return 200, {
+            "id": "benchmark",
+            "object": "chat.completion",
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4},
+        }
+
+    @staticmethod
+    def _summary(index: int) -> Dict[str, object]:
+        return {
+            "summary": f"Reviewed correspondence and advised client on next steps ({index}).",
+            "type": "TimeEntry",
+            "rate": 200,
+            "duration": 0.5,
+        }
+
+
+class FakeClioServer(FakeServer):
+    """Clio OAuth token endpoint, activities create/update and empty matter/contact lists"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.activities: Dict[int, dict] = {}
+        self._next_id = 1
+
+    @property
+    def base(self) -> str:
+        return self.base_url.rstrip("/")
+
+    def _route(self, method: str, path: str, query, body: bytes, headers) -> tuple:
+        parts = [p for p in path.split("/") if p]
+
+        if method == "POST" and parts == ["oauth", "token"]:
+            return 200, {"access_token": "benchmark", "refresh_token": "benchmark", "expires_in": 3600}
+
+        if parts[:2] == ["api", "v4"] and len(parts) == 3 and parts[2] in ("matters.json", "contacts.json"):
+            return 200, {"data": [], "meta": {"paging": {}}}
+
+        if parts[:3] == ["api", "v4", "activities"]:
+            payload = json.loads(body or b"{}")
+            if method == "POST" and len(parts) == 3:
+                with self._lock:
+                    activity_id = self._next_id
+                    self._next_id += 1
+                    self.activities[activity_id] = payload
+                return 201, {"data": {"id": activity_id, **payload.get("data", {})}}
+            if method == "PATCH" and len(parts) == 4:
+                activity_id = int(parts[3])
+                with self._lock:
+                    if activity_id not in self.activities:
+                        return 404, {"error": "Not Found"}
+                    self.activities[activity_id] = payload
+                return 200, {"data": {"id": activity_id, **payload.get("data", {})}}
+
+        return 404, {"error": f"No route for {method} {path}"}
@@ -0,0 +1,84 @@
+"""Micro-benchmark Gmail client setup: discovery.build per request vs the client factory.
+
+    python -m backend.benchmarks.gmail_client --requests 200 --threads 4
+
+No network access is needed; clients are built but never called, so the numbers
+are pure setup cost (discovery parsing, Resource and transport construction).
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+
+os.environ.setdefault("TOGETHER_API_KEY", "benchmark")
+os.environ.setdefault("CLIO_CLIENT_ID", "benchmark")
+os.environ.setdefault("CLIO_CLIENT_SECRET", "benchmark")
+
+from google.oauth2.credentials import Credentials  # noqa: E402
+from googleapiclient.discovery import build  # noqa: E402
+from ..utils.gmail_auth import GmailClientFactory  # noqa: E402
+
+USER_ID = "benchmark"
+
+
+def summarize(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 3),
+    }
+
+
+def run_threads(setup, requests: int, threads: int) -> list:
+    samples = []
+    lock = threading.Lock()
+
+    def worker(count: int):
+        local = []
+        for _ in range(count):
+            start = time.perf_counter()
+            setup()
+            local.append(time.perf_counter() - start)
+        with lock:
+            samples.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(requests // threads,)) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    creds = Credentials(token="benchmark")
+
+    start = time.perf_counter()
+    build("gmail", "v1", credentials=creds)
+    build_cold = time.perf_counter() - start
+    per_request = run_threads(lambda: build("gmail", "v1", credentials=creds), args.requests, args.threads)
+
+    factory = GmailClientFactory()
+    factory._credentials[USER_ID] = creds
+    start = time.perf_counter()
+    factory.service(USER_ID)
+    factory_cold = time.perf_counter() - start
+    cached = run_threads(lambda: factory.service(USER_ID), args.requests, args.threads)
+
+    print(json.dumps({
+        "requests": args.requests,
+        "threads": args.threads,
+        "build_per_request": {"cold_ms": round(build_cold * 1000, 3), **summarize(per_request)},
+        "client_factory": {"cold_ms": round(factory_cold * 1000, 3), **summarize(cached)},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compare serial, batched and incremental Gmail retrieval against the local fake Gmail API.
+
+    python -m backend.benchmarks.gmail_fetch --messages 500 --latency 0.02
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+# Settings() requires these; the benchmark never talks to Together or Clio
+os.environ.setdefault("TOGETHER_API_KEY", "benchmark")
+os.environ.setdefault("CLIO_CLIENT_ID", "benchmark")
+os.environ.setdefault("CLIO_CLIENT_SECRET", "benchmark")
+
+from .fake_gmail import FakeGmailServer  # noqa: E402
+from ..config import settings  # noqa: E402
+from ..services import email_store as email_store_module  # noqa: E402
+from ..services.credential_store import DEFAULT_USER_ID  # noqa: E402
+from ..services.email_service import EmailService  # noqa: E402
+
+
+def timed_fetch(server: FakeGmailServer, service: EmailService, mode: str, max_results: int, batched: bool) -> dict:
+    server.reset_counters()
+    start = time.perf_counter()
+    emails = service.fetch_sent_emails(max_results=max_results, batched=batched)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "emails": len(emails),
+        "http_requests": server.request_count,
+        "seconds": round(elapsed, 4),
+    }
+
+
+def run_mode(server: FakeGmailServer, max_results: int, batched: bool) -> dict:
+    settings.gmail_incremental_sync = False
+    service = EmailService()
+    service.services[DEFAULT_USER_ID] = server.build_service()
+    return timed_fetch(server, service, "batched" if batched else "serial", max_results, batched)
+
+
+def run_incremental(server: FakeGmailServer, max_results: int, new_messages: int) -> list:
+    settings.gmail_incremental_sync = True
+    with tempfile.TemporaryDirectory() as tmp:
+        email_store_module.email_store.path = os.path.join(tmp, "emails.db")
+        email_store_module.email_store._conn = None
+        service = EmailService()
+        service.services[DEFAULT_USER_ID] = server.build_service()
+
+        full = timed_fetch(server, service, "incremental (first full sync)", max_results, True)
+        server.add_messages(new_messages)
+        poll = timed_fetch(server, service, f"incremental (poll, {new_messages} new)", max_results, True)
+        email_store_module.email_store._conn.close()
+        email_store_module.email_store._conn = None
+    return [full, poll]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500, help="emails to fetch")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per HTTP round trip")
+    parser.add_argument("--new-messages", type=int, default=5, help="mail sent between incremental polls")
+    args = parser.parse_args()
+
+    with FakeGmailServer(num_messages=args.messages, latency=args.latency) as server:
+        serial = run_mode(server, args.messages, batched=False)
+        batched = run_mode(server, args.messages, batched=True)
+        incremental = run_incremental(server, args.messages, args.new_messages)
+
+    print(json.dumps({
+        "messages": args.messages,
+        "latency": args.latency,
+        "results": [serial, batched] + incremental,
+        "speedup": round(serial["seconds"] / batched["seconds"], 2) if batched["seconds"] else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
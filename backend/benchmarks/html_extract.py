@@ -0,0 +1,138 @@
+"""Micro-benchmark HTML body extraction: BeautifulSoup vs the streaming extractor.
+
+    python -m backend.benchmarks.html_extract
+    python -m backend.benchmarks.html_extract --corpus ~/mail-samples --repeat 20
+
+--corpus takes a directory of real messages: .eml files, or Gmail API
+messages.get responses saved as .json. Without it a built-in corpus of
+newsletter, long-thread and marketing HTML is generated.
+"""
+import argparse
+import base64
+import email
+import json
+import os
+import statistics
+import time
+from email import policy
+
+os.environ.setdefault("TOGETHER_API_KEY", "benchmark")
+os.environ.setdefault("CLIO_CLIENT_ID", "benchmark")
+os.environ.setdefault("CLIO_CLIENT_SECRET", "benchmark")
+
+from bs4 import BeautifulSoup  # noqa: E402
+from ..utils.email_parser import strip_html_tags  # noqa: E402
+
+
+def bs4_strip_html_tags(html: str) -> str:
+    """The previous implementation, kept here as the baseline"""
+    soup = BeautifulSoup(html, "html.parser")
+    return soup.get_text(separator="\n").strip()
+
+
+def newsletter_html(sections: int = 40) -> str:
+    style = "<style>" + "".join(f".c{i}{{color:#{i:06x};padding:{i}px}}" for i in range(200)) + "</style>"
+    rows = "".join(
+        f"""<tr><td class="c{i}" style="font-family:Arial;font-size:14px">
+        <h2>Legal update {i}</h2><p>Recent rulings on <a href="https://example.com/{i}">case {i}</a>
+        affect filing deadlines &amp; disclosure duties.</p><img src="https://example.com/{i}.png" alt="">
+        </td></tr>"""
+        for i in range(sections)
+    )
+    script = "<script>" + "var tracking = {};" * 200 + "</script>"
+    return f"<html><head>{style}{script}</head><body><table>{rows}</table></body></html>"
+
+
+def thread_html(depth: int = 25) -> str:
+    html = "<p>Original engagement letter attached for review.</p>"
+    for i in range(depth):
+        html = (
+            f"<div dir='ltr'><p>Reply {i}: please see my comments on clause {i}.</p>"
+            f"<div class='gmail_quote'>On Mon, Jan {i + 1}, 2024 counsel wrote:<br>"
+            f"<blockquote style='margin:0 0 0 .8ex;border-left:1px #ccc solid'>{html}</blockquote></div></div>"
+        )
+    return f"<html><body>{html}</body></html>"
+
+
+def marketing_html(blocks: int = 150) -> str:
+    body = "".join(
+        f"<div style='display:flex'><span>&nbsp;</span><b>Offer {i}</b><i>&copy; 2024</i>"
+        f"<!-- tracking pixel {i} --><template><p>hidden {i}</p></template></div>"
+        for i in range(blocks)
+    )
+    return f"<!DOCTYPE html><html><body>{body}</body></html>"
+
+
+def builtin_corpus() -> list:
+    return [newsletter_html(), thread_html(), marketing_html(), newsletter_html(200), thread_html(60)]
+
+
+def html_parts_from_gmail(message: dict) -> list:
+    parts = []
+    stack = [message.get("payload", {})]
+    while stack:
+        part = stack.pop()
+        data = part.get("body", {}).get("data")
+        if part.get("mimeType") == "text/html" and data:
+            parts.append(base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore"))
+        stack.extend(part.get("parts", []))
+    return parts
+
+
+def load_corpus(directory: str) -> list:
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.endswith(".json"):
+            with open(path, "r", encoding="utf-8") as f:
+                corpus.extend(html_parts_from_gmail(json.load(f)))
+        elif name.endswith(".eml"):
+            with open(path, "rb") as f:
+                message = email.message_from_binary_file(f, policy=policy.default)
+            for part in message.walk():
+                if part.get_content_type() == "text/html":
+                    corpus.append(part.get_content())
+    return corpus
+
+
+def time_extractor(extract, corpus: list, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        for html in corpus:
+            start = time.perf_counter()
+            extract(html)
+            samples.append(time.perf_counter() - start)
+    return {
+        "total_seconds": round(sum(samples), 4),
+        "mean_us": round(statistics.mean(samples) * 1e6, 1),
+        "p95_us": round(sorted(samples)[int(len(samples) * 0.95) - 1] * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="directory of .eml files or Gmail API .json messages")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--max-chars", type=int, default=0, help="extraction limit for the streaming parser")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else builtin_corpus()
+    if not corpus:
+        raise SystemExit("No text/html parts found in the corpus")
+
+    identical = sum(bs4_strip_html_tags(html) == strip_html_tags(html, max_chars=0) for html in corpus)
+    baseline = time_extractor(bs4_strip_html_tags, corpus, args.repeat)
+    streaming = time_extractor(lambda html: strip_html_tags(html, max_chars=args.max_chars), corpus, args.repeat)
+
+    print(json.dumps({
+        "documents": len(corpus),
+        "total_html_bytes": sum(len(html) for html in corpus),
+        "identical_output": identical,
+        "beautifulsoup": baseline,
+        "streaming": streaming,
+        "speedup": round(baseline["total_seconds"] / streaming["total_seconds"], 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Push-job throughput with one worker process vs several, through the shared SQLite job store.
+
+    python -m backend.benchmarks.workers --users 8 --emails 200 --processes 1 4
+
+For each process count, a fresh data directory is created and one push job
+per user is queued with JOB_BACKEND=sqlite. The jobs are drained by that many
+`backend.worker` processes. Fake Gmail (one mailbox per user), Together and
+Clio servers run in a separate process so they don't compete with the
+workers for the GIL. The result is printed as JSON with each mode's speedup
+over the first one.
+
+Each job runs in a single process, so extra processes can only speed up
+several concurrent jobs, and only on a host with a core for each.
+"""
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+os.environ.setdefault("TOGETHER_API_KEY", "benchmark")
+os.environ.setdefault("CLIO_CLIENT_ID", "benchmark")
+os.environ.setdefault("CLIO_CLIENT_SECRET", "benchmark")
+
+# Backend modules read settings at import, so they are imported inside the
+# spawned processes, after each mode's environment is in place.
+
+
+def serve_fakes(conn, users: list, emails: int, latencies: dict):
+    from .fake_gmail import FakeGmailServer
+    from .fake_services import FakeClioServer, FakeTogetherServer
+
+    gmail = {
+        user: FakeGmailServer(emails, latency=latencies["gmail"], address=f"{user}@example.com",
+                              id_prefix=f"{user}-").start()
+        for user in users
+    }
+    together = FakeTogetherServer(latency=latencies["together"]).start()
+    clio = FakeClioServer(latency=latencies["clio"]).start()
+    conn.send({
+        "gmail": {user: server.discovery_url for user, server in gmail.items()},
+        "together": together.url,
+        "clio": clio.base,
+    })
+    conn.recv()
+    conn.send({"together": together.stats(), "clio": clio.stats()})
+    for server in [*gmail.values(), together, clio]:
+        server.stop()
+
+
+def configure_worker(gmail_urls: dict, together_url: str, ready_dir: str):
+    """Runs in each worker process: point the services at the fakes, then report ready"""
+    from .fake_gmail import build_service
+    from ..services.email_service import email_service
+    from ..services.summarizer_service import summarizer_service
+
+    summarizer_service.url = together_url
+    for user, url in gmail_urls.items():
+        email_service.services[user] = build_service(url)
+    open(os.path.join(ready_dir, f"ready-{os.getpid()}"), "w").close()
+
+
+def run_mode(processes: int, users: list, emails: int, urls: dict, ready_dir: str, results):
+    """Runs in a fresh process per mode: queue one job per user and time how long the workers take"""
+    from ..models.schemas import TokenData
+    from ..services.clio_service import clio_service
+    from ..services.job_service import job_service
+    from ..worker import start_processes, stop_processes
+
+    for user in users:
+        clio_service.save_user_token(user, TokenData(access_token="benchmark"))
+
+    configure = functools.partial(configure_worker, urls["gmail"], urls["together"], ready_dir)
+    workers = start_processes(processes, configure)
+    while len([name for name in os.listdir(ready_dir) if name.startswith("ready-")]) < processes:
+        time.sleep(0.05)
+
+    start = time.perf_counter()
+    jobs = [job_service.submit_push(max_results=emails, user_id=user) for user in users]
+    while True:
+        states = [job_service.get(job.job_id) for job in jobs]
+        if all(state.status in ("completed", "failed") for state in states):
+            break
+        time.sleep(0.05)
+    seconds = time.perf_counter() - start
+    stop_processes(workers)
+
+    fetched = sum(state.stages["fetch"].processed for state in states)
+    results.put({
+        "processes": processes,
+        "seconds": round(seconds, 3),
+        "emails": fetched,
+        "activities": sum(state.activities_created for state in states),
+        "emails_per_s": round(fetched / seconds, 1),
+        "failed_jobs": sum(1 for state in states if state.status == "failed"),
+        "errors": [error for state in states for error in state.errors][:5],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--emails", type=int, default=200, help="emails per user")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--job-workers", type=int, default=2, help="asyncio job workers per process")
+    parser.add_argument("--gmail-latency", type=float, default=0.0)
+    parser.add_argument("--together-latency", type=float, default=0.02)
+    parser.add_argument("--clio-latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    users = [f"user{i}" for i in range(args.users)]
+    latencies = {"gmail": args.gmail_latency, "together": args.together_latency, "clio": args.clio_latency}
+    modes = []
+
+    for processes in args.processes:
+        data_dir = tempfile.mkdtemp(prefix="billing-workers-")
+        ours, theirs = context.Pipe()
+        fakes = context.Process(target=serve_fakes, args=(theirs, users, args.emails, latencies))
+        fakes.start()
+        urls = ours.recv()
+
+        os.environ.update({
+            "JOB_BACKEND": "sqlite",
+            "JOB_WORKERS": str(args.job_workers),
+            "CREDENTIAL_STORE": "sqlite",
+            "SUMMARY_CACHE_ENABLED": "false",
+            # The Together rate limit is per process; lift it so it doesn't decide the result
+            "TOGETHER_REQUESTS_PER_SECOND": "1000",
+            "TOGETHER_BURST": "1000",
+            "CLIO_BASE_URL": urls["clio"],
+            **{
+                name: os.path.join(data_dir, file)
+                for name, file in (
+                    ("JOB_STORE_PATH", "jobs.db"), ("CREDENTIAL_STORE_PATH", "credentials.db"),
+                    ("EMAIL_STORE_PATH", "emails.db"), ("SUMMARY_CACHE_PATH", "summary_cache.db"),
+                    ("PUSH_LEDGER_PATH", "push_ledger.db"), ("MATTER_INDEX_PATH", "matters.db"),
+                    ("CLIO_IMPORT_DIR", "clio_imports"),
+                )
+            },
+        })
+        results = context.Queue()
+        coordinator = context.Process(
+            target=run_mode, args=(processes, users, args.emails, urls, data_dir, results)
+        )
+        coordinator.start()
+        mode = results.get()
+        mode["job_workers"] = processes * args.job_workers
+        coordinator.join()
+
+        ours.send("stop")
+        mode["servers"] = ours.recv()
+        fakes.join()
+        modes.append(mode)
+
+    baseline = modes[0]["emails_per_s"] or 1
+    for mode in modes:
+        mode["speedup"] = round(mode["emails_per_s"] / baseline, 2)
+    report = {
+        "host_cpus": os.cpu_count(),
+        "users": args.users,
+        "emails_per_user": args.emails,
+        "job_workers_per_process": args.job_workers,
+        "modes": modes,
+    }
+    if (os.cpu_count() or 1) < max(args.processes):
+        report["warning"] = "fewer cores than worker processes; the speedups only show contention"
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Command line entry point for long-running backfills.
+
+    python -m backend.cli import-stage summaries.jsonl
+    python -m backend.cli import-run <job_id> --access-token <clio token>
+    python -m backend.cli import-status <job_id>
+
+The access token can also be given through the CLIO_ACCESS_TOKEN environment variable.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+from .models.schemas import EmailSummary, TokenData
+from .services.clio_import_service import clio_import_service
+from .services.clio_service import clio_service
+
+
+def read_summaries(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield EmailSummary.model_validate_json(line)
+
+
+def import_stage(args) -> int:
+    job = clio_import_service.create_job(read_summaries(args.file))
+    print(job.model_dump_json(indent=2))
+    return 0
+
+
+def import_run(args) -> int:
+    access_token = args.access_token or os.environ.get("CLIO_ACCESS_TOKEN")
+    if not access_token:
+        print("A Clio access token is required (--access-token or CLIO_ACCESS_TOKEN)", file=sys.stderr)
+        return 2
+
+    async def run():
+        try:
+            return await clio_import_service.run_job(args.job_id, TokenData(access_token=access_token))
+        finally:
+            await clio_service.aclose()
+
+    job = asyncio.run(run())
+    print(job.model_dump_json(indent=2))
+    return 0 if job.failed == 0 else 1
+
+
+def import_status(args) -> int:
+    job = clio_import_service.get_job(args.job_id)
+    if job is None:
+        print(f"Unknown import job {args.job_id}", file=sys.stderr)
+        return 2
+    print(job.model_dump_json(indent=2))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend.cli", description="Billing Gmail backfill tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    stage = subparsers.add_parser("import-stage", help="stage a JSON-lines file of summaries for bulk import")
+    stage.add_argument("file", help="one EmailSummary JSON object per line")
+    stage.set_defaults(func=import_stage)
+
+    run = subparsers.add_parser("import-run", help="push a staged import, resuming from its checkpoint")
+    run.add_argument("job_id")
+    run.add_argument("--access-token", help="Clio OAuth access token")
+    run.set_defaults(func=import_run)
+
+    status = subparsers.add_parser("import-status", help="show an import's checkpoint")
+    status.add_argument("job_id")
+    status.set_defaults(func=import_status)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,19 +6,159 @@ class Settings(BaseSettings):
     google_client_secret_file: str = "client_secret.json"
     google_scopes: str = "https://www.googleapis.com/auth/gmail.readonly"
     redirect_uri: str = "http://localhost:8000/oauth2callback"
+    # Where Google sends the browser back to after /gmail/login; must be registered in the Google Console
+    gmail_redirect_uri: str = "http://127.0.0.1:8000/gmail/callback"
+
+    # Gmail
+    gmail_batch_fetch: bool = True
+    gmail_batch_size: int = 50
+    gmail_incremental_sync: bool = True
+    gmail_full_sync_size: int = 100
+    email_store_path: str = "data/emails.db"
+    # Stop HTML-to-text extraction after this many characters (0 = no limit)
+    email_html_max_chars: int = 50000
+    gmail_http_timeout: float = 30.0
+    # Messages that still fail after these retries (e.g. a 429 inside a batch) are kept
+    # as pending and fetched again by the next sync
+    gmail_max_retries: int = 3
+    gmail_backoff_base: float = 0.5
+    gmail_backoff_max: float = 30.0
 
     # Together AI
     together_api_key: str
     together_model: str = "mistralai/Mistral-7B-Instruct-v0.1"
+    together_timeout: float = 30.0
+    together_concurrency: int = 8
+    # Together's default paid tier allows 600 requests per minute. Enforced per process:
+    # divide by the process count when running several workers.
+    together_requests_per_second: float = 10.0
+    together_burst: int = 10
+    # Pack several short emails into one prompt
+    together_batch_prompts: bool = True
+    together_batch_max_emails: int = 8
+    together_batch_token_budget: int = 1500
+    together_batch_short_email_tokens: int = 300
+    together_batch_output_tokens_per_email: int = 150
+    # Route short, clear-cut emails to together_model with a tight max_tokens and long or
+    # ambiguous ones to together_large_model; unparseable small-model output is retried on the large one
+    together_routing: bool = True
+    together_large_model: str = "mistralai/Mixtral-8x7B-Instruct-v0.1"
+    together_small_max_input_tokens: int = 600
+    # max_tokens = base + input tokens * ratio, capped per tier
+    together_output_tokens_base: int = 150
+    together_output_tokens_per_input_token: float = 0.1
+    together_small_max_output_tokens: int = 250
+    together_large_max_output_tokens: int = 500
+    # USD per million tokens, for the cost counters
+    together_small_price_per_million: float = 0.2
+    together_large_price_per_million: float = 0.6
+    # Ask Together for schema-constrained JSON on single-email prompts, for models that support it
+    together_json_mode: bool = True
+    together_json_mode_models: List[str] = [
+        "mistralai/Mistral-7B-Instruct-v0.1",
+        "mistralai/Mixtral-8x7B-Instruct-v0.1",
+        "togethercomputer/CodeLlama-34b-Instruct",
+        "meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo",
+        "meta-llama/Meta-Llama-3.1-70B-Instruct-Turbo",
+        "meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo",
+    ]
+    # Drop quoted history, signatures and disclaimers, then cap what is left
+    summarizer_reduce_bodies: bool = True
+    summarizer_max_input_tokens: int = 2000
+    # Matter used when an email does not name one
+    default_matter_id: int = 12060094
+    # Bill each Gmail thread once per matter and day, with a duration computed from the messages
+    aggregate_threads: bool = True
+    aggregate_timezone: str = "UTC"
+    aggregate_words_per_minute: float = 40
+    aggregate_min_minutes_per_email: float = 3
+    # Messages sent this close together count as one sitting
+    aggregate_session_gap_minutes: float = 20
+    aggregate_billing_increment: float = 0.1
+
+    # Local pre-classifier that answers obvious emails without the LLM
+    classifier_enabled: bool = True
+    classifier_confidence_threshold: float = 0.9
+    classifier_model_path: Optional[str] = None
+    classifier_ack_max_words: int = 12
+    # Words allowed besides acknowledgement phrases, greeting and sign-off (none of them an instruction such
+    # as "settle" or "file"); each one costs confidence
+    classifier_ack_max_leftover_words: int = 3
+    classifier_ack_leftover_penalty: float = 0.02
+    classifier_ack_duration: float = 0.1
+    classifier_default_duration: float = 1.0
+    classifier_default_rate: float = 200
+
+    # Summary cache
+    summary_cache_enabled: bool = True
+    summary_cache_path: str = "data/summary_cache.db"
+    summary_cache_memory_size: int = 1024
+    summary_cache_max_entries: int = 50000
+    summary_cache_ttl_seconds: float = 30 * 24 * 3600
+    # Summarize one email per cluster of near-identical bodies (SimHash similarity)
+    summary_dedup_enabled: bool = True
+    summary_dedup_similarity: float = 0.9
 
     # Clio
     clio_client_id: str
     clio_client_secret: str
     clio_redirect_uri: str = "http://127.0.0.1:8000/api/clio/callback"
     clio_base_url: str = "https://eu.app.clio.com"
+    clio_timeout: float = 30.0
+    clio_concurrency: int = 8
+    # HTTP/2 is only used when the optional h2 package is installed
+    clio_http2: bool = True
+    clio_max_retries: int = 5
+    clio_backoff_base: float = 0.5
+    clio_backoff_max: float = 30.0
+    clio_import_dir: str = "data/clio_imports"
+    clio_import_chunk_size: int = 200
+    # Local index of Clio matters and contacts used to pick each entry's matter
+    matter_index_path: str = "data/matters.db"
+    matter_sync_interval_seconds: float = 3600
+    matter_public_domains: List[str] = [
+        "gmail.com", "googlemail.com", "yahoo.com", "outlook.com", "hotmail.com",
+        "live.com", "msn.com", "icloud.com", "me.com", "aol.com", "proton.me", "protonmail.com"
+    ]
+    push_ledger_path: str = "data/push_ledger.db"
+
+    # Background jobs
+    job_workers: int = 2
+    job_summarize_workers: int = 2
+    job_stage_queue_size: int = 4
+    job_history_size: int = 200
+    # memory: in-process queue. sqlite: queue and job state in job_store_path, shared with
+    # `python -m backend.worker` processes (set JOB_WORKERS=0 on the web process to only submit)
+    job_backend: str = "memory"
+    job_store_path: str = "data/jobs.db"
+    job_poll_interval_seconds: float = 0.5
+    # A running job not updated for this long is assumed lost with its worker and failed
+    job_stale_seconds: float = 600
+    # Background polling of every connected mailbox; the UI then reads precomputed summaries
+    scheduler_enabled: bool = True
+    scheduler_interval_seconds: float = 900
+    scheduler_jitter_seconds: float = 60
+    scheduler_workers: int = 2
+    scheduler_poll_depth: int = 50
+    # Longer than any single poll, so a crashed worker's lock expires on its own
+    scheduler_lock_seconds: float = 600
+    scheduler_drain_seconds: float = 30
+
+    # Users and credentials
+    credential_store: str = "sqlite"  # sqlite, redis or memory
+    credential_store_path: str = "data/credentials.db"
+    redis_url: str = "redis://localhost:6379/0"
+    # Refresh OAuth tokens this long before they expire
+    token_refresh_margin_seconds: float = 300
+    token_refresh_lock_seconds: float = 30
+    session_cookie_name: str = "billing_user"
+    # Signs the session cookie; falls back to the Clio client secret so all workers agree
+    session_secret: Optional[str] = None
 
     # Application
     debug: bool = False
+    # Per-stage timers and token counts, served at /metrics in Prometheus text format
+    metrics_enabled: bool = True
     environment: str = "development"
 
     class Config:
@@ -1,12 +1,19 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import logging
 
-from .routers import emails, clio
+from .routers import emails, clio, gmail, jobs, session
 from .config import settings
+from .services.summarizer_service import summarizer_service
+from .services.clio_service import clio_service
+from .services.job_service import job_service
+from .services.scheduler import poll_scheduler
+from .utils.gmail_auth import GmailAuthRequired
+from .utils.metrics import CONTENT_TYPE, metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,8 +21,15 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting up Billing Gmail application...")
+    job_service.start()
+    if settings.scheduler_enabled:
+        poll_scheduler.start()
     yield
     logger.info("Shutting down Billing Gmail application...")
+    await poll_scheduler.stop()
+    await job_service.stop()
+    await summarizer_service.aclose()
+    await clio_service.aclose()
 
 app = FastAPI(
     title="Billing Gmail Summarizer",
@@ -37,6 +51,10 @@ app.add_middleware(
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+@app.exception_handler(GmailAuthRequired)
+async def gmail_auth_required(request: Request, exc: GmailAuthRequired):
+    return JSONResponse(status_code=401, content={"detail": "User not authenticated with Gmail", "login_url": "/gmail/login"})
+
 @app.get("/")
 async def home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
@@ -45,9 +63,18 @@ async def home(request: Request):
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def get_metrics():
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
+
 # Include routers
 app.include_router(emails.router, prefix="/api", tags=["emails"])
 app.include_router(clio.router, tags=["clio"])
+app.include_router(gmail.router, tags=["gmail"])
+app.include_router(jobs.router, tags=["jobs"])
+app.include_router(session.router, prefix="/api", tags=["session"])
 
 if __name__ == "__main__":
     import uvicorn
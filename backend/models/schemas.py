@@ -1,11 +1,17 @@
 from pydantic import BaseModel
-from typing import Optional, List, Literal
-from datetime import datetime
+from typing import Optional, List, Dict, Literal
+from datetime import date as Date, datetime
 
 class EmailBase(BaseModel):
+    id: Optional[str] = None
+    thread_id: Optional[str] = None
+    date: Optional[datetime] = None
     subject: Optional[str] = None
     to: Optional[str] = None
+    cc: Optional[str] = None
     from_: Optional[str] = None
+    labels: List[str] = []
+    matter_id: Optional[int] = None
     body: str
 
 class EmailSummary(BaseModel):
@@ -17,6 +23,8 @@ class EmailSummary(BaseModel):
     quantity: Optional[int] = None
     expense_type: Optional[str] = None
     matter_id: int 
+    # Day the work was done; set from the emails' send date, not asked of the model
+    date: Optional[Date] = None
 
 class EmailWithSummary(EmailBase):
     summary: EmailSummary
@@ -25,8 +33,40 @@ class ClioActivityResponse(BaseModel):
     status: str
     activities_created: List[dict]
     errors: Optional[List[str]] = None
+    skipped: int = 0
 
 class TokenData(BaseModel):
     access_token: str
     refresh_token: Optional[str] = None
-    expires_at: Optional[datetime] = None
\ No newline at end of file
+    expires_at: Optional[datetime] = None
+
+class ClioImportJob(BaseModel):
+    job_id: str
+    user_id: Optional[str] = None
+    status: Literal["summarizing", "staged", "running", "completed", "interrupted"]
+    total: int = 0
+    pushed: int = 0
+    created: int = 0
+    failed: int = 0
+    # Staged entries whose emails the push ledger already had
+    skipped: int = 0
+    offset: int = 0
+    errors: List[str] = []
+    created_at: datetime
+    updated_at: datetime
+
+class JobStage(BaseModel):
+    processed: int = 0
+    failed: int = 0
+    skipped: int = 0
+
+class JobStatus(BaseModel):
+    job_id: str
+    kind: str
+    user_id: Optional[str] = None
+    status: Literal["queued", "running", "completed", "failed"]
+    stages: Dict[str, JobStage] = {}
+    activities_created: int = 0
+    errors: List[str] = []
+    created_at: datetime
+    updated_at: datetime
@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Request, HTTPException, BackgroundTasks, Depends
 from fastapi.responses import RedirectResponse
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
 import logging
 
 from ..services.clio_service import clio_service
+from ..services.clio_import_service import clio_import_service
+from ..services.job_service import job_service
 from ..services.email_service import email_service
-from ..services.summarizer_service import summarizer_service
-from ..models.schemas import ClioActivityResponse
+from ..services.matter_resolver import matter_resolver
+from ..models.schemas import ClioImportJob, EmailSummary, JobStatus
+from ..utils.session import current_user_id, set_user_cookie
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -17,7 +22,7 @@ async def clio_login():
     return RedirectResponse(url=auth_url)
 
 @router.get("/clio/callback")
-async def clio_callback(request: Request):
+async def clio_callback(request: Request, user_id: str = Depends(current_user_id)):
     """Handle Clio OAuth callback"""
     code = request.query_params.get("code")
     error = request.query_params.get("error")
@@ -29,49 +34,117 @@ async def clio_callback(request: Request):
         raise HTTPException(status_code=400, detail="Missing authorization code")
     
     try:
-        await clio_service.exchange_code_for_token(code)
-        return RedirectResponse(url="/")
+        await clio_service.exchange_code_for_token(code, user_id)
+        response = RedirectResponse(url="/")
+        set_user_cookie(response, user_id)
+        return response
     except Exception as e:
         logger.error(f"OAuth callback error: {str(e)}")
         raise HTTPException(status_code=500, detail="Authentication failed")
 
-@router.post("/clio/push-summary", response_model=ClioActivityResponse)
-async def push_summary_to_clio():
-    """Push email summaries to Clio as activities"""
+@router.post("/clio/push-summary", response_model=JobStatus, status_code=202)
+async def push_summary_to_clio(repush_changed: bool = False, max_results: int = 10,
+                               user_id: str = Depends(current_user_id)):
+    """Queue a background job that pushes email summaries to Clio as activities.
+
+    Emails recorded in the push ledger are skipped before any LLM or Clio work.
+    With repush_changed, they are re-summarized and their existing activity is
+    updated when the summary differs from the one that was pushed. Poll
+    /jobs/{job_id} for progress.
+    """
+    if not await clio_service.get_valid_token(user_id):
+        raise HTTPException(status_code=401, detail="User not authenticated with Clio")
+    await run_in_threadpool(email_service.require_connected, user_id)
+
     try:
-        # Fetch and summarize emails
-        emails = email_service.fetch_sent_emails(max_results=10)
-        summaries = []
-        
-        for email in emails:
-            try:
-                summary = summarizer_service.summarize_email(email.body)
-                summaries.append(summary)
-            except Exception as e:
-                logger.error(f"Error summarizing email: {str(e)}")
-                continue
-        
-        if not summaries:
-            return ClioActivityResponse(
-                status="error",
-                activities_created=[],
-                errors=["No summaries generated"]
-            )
-        
-        # Push to Clio
-        result = await clio_service.create_activities(summaries)
-        
-        return result
-        
+        return job_service.submit_push(max_results=max_results, repush_changed=repush_changed, user_id=user_id)
     except Exception as e:
-        logger.error(f"Error pushing to Clio: {str(e)}")
+        logger.error(f"Error queueing Clio push: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/clio/status")
-async def clio_status():
+async def clio_status(user_id: str = Depends(current_user_id)):
     """Check Clio authentication status"""
-    token = clio_service.get_user_token()
+    token = clio_service.get_user_token(user_id)
     return {
         "authenticated": token is not None,
         "has_access_token": token.access_token is not None if token else False
     }
+
+@router.post("/clio/import", response_model=ClioImportJob)
+async def start_clio_import(
+    background_tasks: BackgroundTasks,
+    summaries: Optional[List[EmailSummary]] = None,
+    max_results: int = 500,
+    user_id: str = Depends(current_user_id)
+):
+    """Stage summaries for a bulk Clio import and push them in the background.
+
+    Without a request body, the latest max_results sent emails are fetched and
+    summarized by the background job too; poll /clio/import/{job_id} while it
+    is "summarizing".
+    """
+    token = await clio_service.get_valid_token(user_id)
+    if not token:
+        raise HTTPException(status_code=401, detail="User not authenticated with Clio")
+    if summaries is None:
+        await run_in_threadpool(email_service.require_connected, user_id)
+
+    try:
+        if summaries is None:
+            job = await run_in_threadpool(clio_import_service.create_job, [], "summarizing", user_id)
+        else:
+            job = await run_in_threadpool(clio_import_service.create_job, summaries, "staged", user_id)
+    except Exception as e:
+        logger.error(f"Error staging Clio import: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if summaries is None:
+        background_tasks.add_task(clio_import_service.summarize_job, job.job_id, token, max_results, user_id)
+    else:
+        background_tasks.add_task(clio_import_service.run_job, job.job_id, token)
+    return job
+
+@router.post("/clio/import/{job_id}/resume", response_model=ClioImportJob)
+async def resume_clio_import(job_id: str, background_tasks: BackgroundTasks,
+                             user_id: str = Depends(current_user_id)):
+    """Resume an interrupted import from its last checkpoint"""
+    token = await clio_service.get_valid_token(user_id)
+    if not token:
+        raise HTTPException(status_code=401, detail="User not authenticated with Clio")
+
+    job = clio_import_service.get_job(job_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    if clio_import_service.is_running(job_id):
+        raise HTTPException(status_code=409, detail="Import job is already running")
+
+    background_tasks.add_task(clio_import_service.run_job, job_id, token)
+    return job
+
+@router.get("/clio/import/{job_id}", response_model=ClioImportJob)
+async def get_clio_import(job_id: str, user_id: str = Depends(current_user_id)):
+    """Progress of one of the current user's bulk imports"""
+    job = clio_import_service.get_job(job_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+@router.post("/clio/matters/sync")
+async def sync_clio_matters(force: bool = True, user_id: str = Depends(current_user_id)):
+    """Pull changed Clio matters and contacts into the local matter index"""
+    token = await clio_service.get_valid_token(user_id)
+    if not token:
+        raise HTTPException(status_code=401, detail="User not authenticated with Clio")
+
+    try:
+        synced = await matter_resolver.refresh(token, user_id, force=force)
+    except Exception as e:
+        logger.error(f"Error syncing Clio matters: {str(e)}")
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"synced": synced, **await run_in_threadpool(matter_resolver.stats, user_id)}
+
+@router.get("/clio/matters/index")
+async def clio_matter_index(user_id: str = Depends(current_user_id)):
+    """Size of the user's local matter index"""
+    return await run_in_threadpool(matter_resolver.stats, user_id)
@@ -1,49 +1,188 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
+from datetime import datetime
+from typing import List, Optional
+import json
 import logging
 
 from ..services.email_service import email_service
 from ..services.summarizer_service import summarizer_service
+from ..services.summary_cache import summary_cache
+from ..services.email_classifier import email_classifier
+from ..services.matter_resolver import matter_resolver
+from ..services.model_router import model_router
+from ..services.thread_aggregator import thread_aggregator
+from ..utils.body_reducer import reduction_stats
 from ..models.schemas import EmailBase, EmailWithSummary
+from ..config import settings
+from ..utils.gmail_auth import GmailAuthRequired
+from ..utils.session import current_user_id
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+def summary_result(email: EmailBase, summary, precomputed: bool = False) -> dict:
+    if isinstance(summary, Exception):
+        logger.error(f"Error summarizing email: {str(summary)}")
+        return {
+            "to": email.to,
+            "subject": email.subject,
+            "summary": {"error": f"Failed to summarize: {str(summary)}"}
+        }
+    result = {
+        "to": email.to,
+        "subject": email.subject,
+        "summary": summary.model_dump(mode="json")
+    }
+    if precomputed:
+        result["precomputed"] = True
+    return result
+
 @router.get("/emails", response_model=List[EmailBase])
-async def get_emails():
-    """Fetch sent emails from Gmail"""
+async def get_emails(user_id: str = Depends(current_user_id)):
+    """Fetch sent emails from Gmail, or from the local store once the background poller has synced it"""
     try:
-        emails = email_service.fetch_sent_emails(max_results=10)
+        if settings.scheduler_enabled:
+            stored = await run_in_threadpool(email_service.stored_summaries, 10, user_id)
+            if stored is not None:
+                return [email for email, _ in stored]
+        emails = await run_in_threadpool(email_service.fetch_sent_emails, max_results=10, user_id=user_id)
         return emails
+    except GmailAuthRequired:
+        raise
     except Exception as e:
         logger.error(f"Error fetching emails: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/emails/search", response_model=List[EmailBase])
+async def search_emails(
+    q: Optional[str] = None,
+    subject: Optional[str] = None,
+    recipient: Optional[str] = None,
+    matter_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    user_id: str = Depends(current_user_id)
+):
+    """Search locally synced sent emails by text, subject, recipient, matter and date range"""
+    try:
+        return await run_in_threadpool(
+            email_service.search_emails,
+            query=q, subject=subject, recipient=recipient, matter_id=matter_id,
+            date_from=date_from, date_to=date_to, limit=limit, offset=offset, user_id=user_id
+        )
+    except GmailAuthRequired:
+        raise
+    except Exception as e:
+        logger.error(f"Error searching emails: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/summaries", response_model=List[dict])
-async def get_email_summaries():
-    """Fetch emails and generate summaries"""
+async def get_email_summaries(user_id: str = Depends(current_user_id)):
+    """Fetch emails and generate summaries.
+
+    With the background poller on, summaries it precomputed are read from the
+    local store and only emails it hasn't reached yet are summarized now.
+    """
     try:
-        emails = email_service.fetch_sent_emails(max_results=10)
-        results = []
-        
-        for email in emails:
-            try:
-                summary = summarizer_service.summarize_email(email.body)
-                results.append({
-                    "to": email.to,
-                    "subject": email.subject,
-                    "summary": summary.dict()
-                })
-            except Exception as e:
-                logger.error(f"Error summarizing email: {str(e)}")
-                results.append({
-                    "to": email.to,
-                    "subject": email.subject,
-                    "summary": {"error": f"Failed to summarize: {str(e)}"}
-                })
-        
-        return results
+        stored = None
+        if settings.scheduler_enabled:
+            stored = await run_in_threadpool(email_service.stored_summaries, 10, user_id)
+        if stored is None:
+            emails = await run_in_threadpool(email_service.fetch_sent_emails, max_results=10, user_id=user_id)
+            summaries = [None] * len(emails)
+        else:
+            emails = [email for email, _ in stored]
+            summaries = [summary for _, summary in stored]
+
+        missing = [i for i, summary in enumerate(summaries) if summary is None]
+        if missing:
+            fresh = await summarizer_service.summarize_emails([emails[i].body for i in missing])
+            fresh = matter_resolver.apply([emails[i] for i in missing], fresh, user_id)
+            for i, summary in zip(missing, fresh):
+                summaries[i] = summary
+            email_service.record_matters([emails[i] for i in missing], fresh, user_id)
+            if stored is not None:
+                email_service.save_summaries([emails[i] for i in missing], fresh, user_id)
+        return [summary_result(email, summary) for email, summary in zip(emails, summaries)]
         
+    except GmailAuthRequired:
+        raise
     except Exception as e:
         logger.error(f"Error generating summaries: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/summaries/stream")
+async def stream_email_summaries(max_results: int = 10, user_id: str = Depends(current_user_id)):
+    """Stream each email's summary as newline-delimited JSON as soon as it is ready.
+
+    With the background poller on, summaries it precomputed are sent first,
+    straight from the local store, and only the emails it hasn't reached yet
+    are summarized while the response streams.
+    """
+    # Checked before streaming starts, so a missing Gmail connection is still a 401
+    await run_in_threadpool(email_service.require_connected, user_id)
+
+    async def summarize_page(page: List[EmailBase], save: bool):
+        summaries = [None] * len(page)
+        async for i, summary in summarizer_service.iter_summaries([email.body for email in page]):
+            summary = matter_resolver.apply([page[i]], [summary], user_id)[0]
+            summaries[i] = summary
+            yield json.dumps(summary_result(page[i], summary)) + "\n"
+        email_service.record_matters(page, summaries, user_id)
+        if save:
+            email_service.save_summaries(page, summaries, user_id)
+
+    async def generate():
+        try:
+            stored = None
+            if settings.scheduler_enabled:
+                stored = await run_in_threadpool(email_service.stored_summaries, max_results, user_id)
+            if stored is not None:
+                missing = []
+                for email, summary in stored:
+                    if summary is None:
+                        missing.append(email)
+                    else:
+                        yield json.dumps(summary_result(email, summary, precomputed=True)) + "\n"
+                if missing:
+                    async for line in summarize_page(missing, save=True):
+                        yield line
+                return
+
+            async for page in iterate_in_threadpool(email_service.iter_sent_emails(max_results, user_id=user_id)):
+                async for line in summarize_page(page, save=False):
+                    yield line
+        except Exception as e:
+            logger.error(f"Error streaming summaries: {str(e)}")
+            yield json.dumps({"error": f"Failed to generate summaries: {str(e)}"}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@router.get("/summaries/cache")
+async def get_summary_cache_stats():
+    """Summary cache hit/miss counters"""
+    return summary_cache.stats()
+
+@router.get("/summaries/reduction")
+async def get_body_reduction_stats():
+    """Bytes kept away from the model by body reduction"""
+    return reduction_stats.stats()
+
+@router.get("/summaries/classifier")
+async def get_classifier_stats():
+    """How often the local classifier answered instead of the LLM, per path"""
+    return email_classifier.stats()
+
+@router.get("/summaries/aggregation")
+async def get_aggregation_stats():
+    """How many emails were billed together as one entry per thread, matter and day"""
+    return thread_aggregator.stats()
+
+@router.get("/summaries/routing")
+async def get_routing_stats():
+    """Prompts per model tier and reason, with each tier's latency, tokens and cost"""
+    return model_router.stats()
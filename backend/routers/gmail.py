@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Request, HTTPException, Depends
+from fastapi.responses import RedirectResponse
+from starlette.concurrency import run_in_threadpool
+import logging
+
+from ..services.credential_store import credential_store
+from ..utils.gmail_auth import authorization_url, exchange_code
+from ..utils.session import current_user_id, set_user_cookie
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.get("/gmail/login")
+async def gmail_login(user_id: str = Depends(current_user_id)):
+    """Redirect to Google OAuth authorization for the session's user"""
+    try:
+        auth_url = await run_in_threadpool(authorization_url, user_id)
+    except Exception as e:
+        logger.error(f"Error starting Gmail login: {str(e)}")
+        raise HTTPException(status_code=500, detail="Could not start Gmail login")
+    response = RedirectResponse(url=auth_url)
+    # The callback must resolve to the same user, so make sure the browser carries the cookie
+    set_user_cookie(response, user_id)
+    return response
+
+@router.get("/gmail/callback")
+async def gmail_callback(request: Request, user_id: str = Depends(current_user_id)):
+    """Handle Google OAuth callback and store the user's Gmail tokens"""
+    code = request.query_params.get("code")
+    state = request.query_params.get("state")
+    error = request.query_params.get("error")
+
+    if error:
+        raise HTTPException(status_code=400, detail=f"Authorization error: {error}")
+
+    if not code or not state:
+        raise HTTPException(status_code=400, detail="Missing authorization code")
+
+    try:
+        await run_in_threadpool(exchange_code, user_id, code, state)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Gmail OAuth callback error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Authentication failed")
+    return RedirectResponse(url="/")
+
+@router.get("/gmail/status")
+async def gmail_status(user_id: str = Depends(current_user_id)):
+    """Check Gmail authentication status"""
+    creds = await run_in_threadpool(credential_store.get, user_id, "gmail")
+    return {"authenticated": creds is not None}
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends, HTTPException
+import logging
+
+from ..services.job_service import job_service
+from ..services.scheduler import poll_scheduler
+from ..models.schemas import JobStatus
+from ..utils.session import current_user_id
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.get("/jobs/scheduler")
+async def get_scheduler_stats():
+    """Background mailbox polling: connected users, runs, failures and summaries precomputed"""
+    return poll_scheduler.stats()
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, user_id: str = Depends(current_user_id)):
+    """Progress, per-stage counts and errors of one of the current user's background jobs"""
+    job = job_service.get(job_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, Response
+import logging
+
+from ..utils.session import current_user_id, new_user_id, set_user_cookie
+from ..config import settings
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.get("/session")
+async def get_session(user_id: str = Depends(current_user_id)):
+    """The user this browser acts as"""
+    return {"user_id": user_id}
+
+@router.post("/session")
+async def create_session(response: Response):
+    """Start a new user so another attorney can connect their own Gmail and Clio accounts"""
+    user_id = new_user_id()
+    set_user_cookie(response, user_id)
+    logger.info(f"Created session for user {user_id}")
+    return {"user_id": user_id}
+
+@router.delete("/session")
+async def end_session(response: Response):
+    """Forget the session cookie; stored credentials are kept"""
+    response.delete_cookie(settings.session_cookie_name)
+    return {"user_id": None}
@@ -0,0 +1,222 @@
+import os
+import json
+import uuid
+import logging
+from contextlib import aclosing
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+from ..config import settings
+from ..models.schemas import EmailSummary, ClioImportJob, TokenData
+from ..utils.thread_iter import iterate_in_thread
+from .clio_service import clio_service
+from .credential_store import DEFAULT_USER_ID
+from .email_service import email_service
+from .matter_resolver import matter_resolver
+from .push_ledger import push_ledger
+from .summarizer_service import summarizer_service
+from .thread_aggregator import thread_aggregator
+
+logger = logging.getLogger(__name__)
+
+# Only the most recent errors are kept in the checkpoint; the full list is in <job>.failed.jsonl
+MAX_CHECKPOINT_ERRORS = 50
+
+
+class ClioImportService:
+    """Resumable bulk push of summaries to Clio.
+
+    Summaries are staged to <job>.jsonl and pushed in chunks. After every chunk
+    the byte offset of the next unpushed line is written to <job>.json, so a
+    crashed or interrupted run resumes from there instead of replaying the file.
+    Jobs created from the mailbox are summarized in the background first, each
+    summary appended to the staging file as soon as it is ready.
+
+    Summaries made from Gmail messages are staged with the message ids. Those
+    already in the push ledger are skipped, and every created activity is
+    recorded there before the checkpoint moves, so neither a resumed job nor a
+    later push job bills the same email twice.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._running = set()
+
+    def _path(self, job_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{job_id}{suffix}")
+
+    def create_job(self, summaries: Iterable[EmailSummary] = (), status: str = "staged",
+                   user_id: str = DEFAULT_USER_ID) -> ClioImportJob:
+        """Stream summaries to a new staging file; a "summarizing" job gets its summaries from summarize_job"""
+        os.makedirs(self.directory, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        total = 0
+
+        with open(self._path(job_id, ".jsonl"), "w", encoding="utf-8") as staging:
+            for summary in summaries:
+                staging.write(self._staged_line(summary, []))
+                total += 1
+
+        now = datetime.now(timezone.utc)
+        job = ClioImportJob(job_id=job_id, user_id=user_id, status=status, total=total, created_at=now, updated_at=now)
+        self._save(job)
+        logger.info(f"Staged Clio import {job_id} with {total} summaries")
+        return job
+
+    def get_job(self, job_id: str) -> Optional[ClioImportJob]:
+        path = self._path(job_id, ".json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return ClioImportJob.model_validate_json(f.read())
+
+    def is_running(self, job_id: str) -> bool:
+        return job_id in self._running
+
+    async def summarize_job(self, job_id: str, token: TokenData, max_results: int,
+                            user_id: str = DEFAULT_USER_ID) -> ClioImportJob:
+        """Fetch and summarize the latest sent emails into the job's staging file, then push them.
+
+        If this is interrupted, resuming the job pushes the summaries staged so far.
+        """
+        job = self.get_job(job_id)
+        if job is None:
+            raise ValueError(f"Unknown import job {job_id}")
+
+        self._running.add(job_id)
+        try:
+            pages = iterate_in_thread(email_service.iter_sent_emails(max_results, user_id=user_id))
+            async with aclosing(pages):
+                with open(self._path(job_id, ".jsonl"), "a", encoding="utf-8") as staging:
+                    async for page in pages:
+                        pushed = push_ledger.lookup(email.id for email in page if email.id)
+                        job.skipped += sum(1 for email in page if email.id in pushed)
+                        page = [email for email in page if email.id not in pushed]
+                        async for i, summary in summarizer_service.iter_summaries([email.body for email in page]):
+                            summary = matter_resolver.apply([page[i]], [summary], user_id)[0]
+                            if isinstance(summary, Exception):
+                                job.failed += 1
+                                job.errors = (job.errors + [f"Error summarizing email {page[i].id}: {str(summary)}"])[-MAX_CHECKPOINT_ERRORS:]
+                                continue
+                            summary = summary.model_copy(update={"date": thread_aggregator.local_day(page[i])})
+                            staging.write(self._staged_line(summary, [page[i].id] if page[i].id else []))
+                            staging.flush()
+                            job.total += 1
+                        self._save(job)
+
+            job.status = "staged"
+            self._save(job)
+            logger.info(f"Staged Clio import {job_id} with {job.total} summaries")
+        except BaseException:
+            job.status = "interrupted"
+            self._save(job)
+            raise
+        finally:
+            self._running.discard(job_id)
+
+        return await self.run_job(job_id, token)
+
+    async def run_job(self, job_id: str, token: TokenData) -> ClioImportJob:
+        """Push the job's remaining summaries, checkpointing after each chunk"""
+        job = self.get_job(job_id)
+        if job is None:
+            raise ValueError(f"Unknown import job {job_id}")
+        if job_id in self._running:
+            raise ValueError(f"Import job {job_id} is already running")
+        if job.status == "completed":
+            return job
+
+        self._running.add(job_id)
+        job.status = "running"
+        self._save(job)
+
+        try:
+            with open(self._path(job_id, ".jsonl"), "rb") as staging:
+                staging.seek(job.offset)
+                while True:
+                    chunk = self._read_chunk(staging, settings.clio_import_chunk_size)
+                    if not chunk:
+                        break
+
+                    entries = [self._parse_line(line) for line in chunk]
+                    pushed = push_ledger.lookup(message_id for _, message_ids in entries for message_id in message_ids)
+                    keep = [
+                        i for i, (_, message_ids) in enumerate(entries)
+                        if not message_ids or not all(message_id in pushed for message_id in message_ids)
+                    ]
+                    job.skipped += len(chunk) - len(keep)
+
+                    results = await clio_service.push_activities([entries[i][0] for i in keep], token) if keep else []
+                    self._record_failures(job, [chunk[i] for i in keep], results)
+                    push_ledger.record([
+                        (message_id, entries[i][0], clio_service.activity_id(response))
+                        for i, (response, error) in zip(keep, results) if not error
+                        for message_id in entries[i][1]
+                    ])
+
+                    job.created += sum(1 for _, error in results if not error)
+                    job.pushed += len(chunk)
+                    job.offset = staging.tell()
+                    self._save(job)
+                    logger.info(f"Clio import {job_id}: {job.pushed}/{job.total} pushed")
+
+            job.status = "completed"
+            self._save(job)
+            return job
+
+        except BaseException:
+            job.status = "interrupted"
+            self._save(job)
+            raise
+        finally:
+            self._running.discard(job_id)
+
+    @staticmethod
+    def _staged_line(summary: EmailSummary, message_ids: List[str]) -> str:
+        return json.dumps({"summary": summary.model_dump(mode="json"), "message_ids": message_ids}) + "\n"
+
+    @staticmethod
+    def _parse_line(line: bytes) -> Tuple[EmailSummary, List[str]]:
+        """A staged (summary, message_ids); files staged before message ids were kept hold bare summaries"""
+        data = json.loads(line)
+        if isinstance(data.get("summary"), dict):
+            return EmailSummary.model_validate(data["summary"]), data.get("message_ids") or []
+        return EmailSummary.model_validate(data), []
+
+    def _read_chunk(self, staging, size: int) -> List[bytes]:
+        chunk = []
+        while len(chunk) < size:
+            line = staging.readline()
+            if not line:
+                break
+            if line.strip():
+                chunk.append(line)
+        return chunk
+
+    def _record_failures(self, job: ClioImportJob, chunk: List[bytes], results):
+        failures = [(line, error) for line, (_, error) in zip(chunk, results) if error]
+        if not failures:
+            return
+
+        with open(self._path(job.job_id, ".failed.jsonl"), "a", encoding="utf-8") as failed:
+            for line, error in failures:
+                summary, message_ids = self._parse_line(line)
+                failed.write(json.dumps({
+                    "summary": summary.model_dump(mode="json"), "message_ids": message_ids, "error": error
+                }) + "\n")
+
+        job.failed += len(failures)
+        job.errors = (job.errors + [error for _, error in failures])[-MAX_CHECKPOINT_ERRORS:]
+
+    def _save(self, job: ClioImportJob):
+        """Atomically replace the checkpoint so a crash never leaves it half written"""
+        job.updated_at = datetime.now(timezone.utc)
+        path = self._path(job.job_id, ".json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(job.model_dump_json())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+clio_import_service = ClioImportService(settings.clio_import_dir)
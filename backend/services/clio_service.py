@@ -1,19 +1,38 @@
+import asyncio
 import httpx
+import importlib.util
 import logging
-from typing import Dict, List, Any, Optional
-from datetime import datetime, date
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Any, Optional, Tuple
+from datetime import datetime, date, timedelta, timezone
 from ..config import settings
 from ..models.schemas import EmailSummary, ClioActivityResponse, TokenData
+from ..utils.metrics import CLIO_REQUEST_SECONDS
+from .credential_store import DEFAULT_USER_ID, credential_store
 
 logger = logging.getLogger(__name__)
 
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Failures that happen before the request reaches Clio, so even a POST is safe to resend
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
 class ClioService:
     def __init__(self):
         self.client_id = settings.clio_client_id
         self.client_secret = settings.clio_client_secret
         self.redirect_uri = settings.clio_redirect_uri
         self.base_url = settings.clio_base_url
-        self.user_sessions = {}  # In production, use Redis or database
+        self.concurrency = max(1, settings.clio_concurrency)
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+        # When Clio throttles one request, every in-flight request waits until this loop time
+        self._throttled_until = 0.0
+        # One in-process refresh per user; the credential store lock covers other workers
+        self._refresh_locks: Dict[str, asyncio.Lock] = {}
+        self._refresh_loop = None
     
     def get_auth_url(self) -> str:
         return (
@@ -24,89 +43,280 @@ class ClioService:
             f"&scope=all"
         )
     
-    async def exchange_code_for_token(self, code: str) -> TokenData:
-        token_url = f"{self.base_url}/oauth/token"
-        
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    token_url,
-                    data={
-                        "grant_type": "authorization_code",
-                        "client_id": self.client_id,
-                        "client_secret": self.client_secret,
-                        "code": code,
-                        "redirect_uri": self.redirect_uri
-                    },
-                    timeout=30
-                )
-                
-                response.raise_for_status()
-                token_data = response.json()
-                
-                # Store token for demo user (in production, use proper user management)
-                user_id = "demo_user"
-                token = TokenData(
-                    access_token=token_data["access_token"],
-                    refresh_token=token_data.get("refresh_token")
-                )
-                
-                self.user_sessions[user_id] = token
+    async def exchange_code_for_token(self, code: str, user_id: str = DEFAULT_USER_ID) -> TokenData:
+        try:
+            token = await self._request_token({
+                "grant_type": "authorization_code",
+                "code": code,
+                "redirect_uri": self.redirect_uri
+            })
+        except httpx.HTTPError as e:
+            logger.error(f"Token exchange failed: {str(e)}")
+            raise Exception(f"Failed to exchange code for token: {str(e)}")
+
+        self.save_user_token(user_id, token)
+        return token
+    
+    def get_user_token(self, user_id: str = DEFAULT_USER_ID) -> Optional[TokenData]:
+        data = credential_store.get(user_id, "clio")
+        return TokenData.model_validate(data) if data else None
+
+    def save_user_token(self, user_id: str, token: TokenData):
+        credential_store.set(user_id, "clio", token.model_dump(mode="json"))
+
+    async def get_valid_token(self, user_id: str = DEFAULT_USER_ID) -> Optional[TokenData]:
+        """Return the user's token, refreshing it first if it expires within the refresh margin.
+
+        Concurrent callers in this process share one refresh through a per-user
+        lock, and other workers are kept out by a lock in the credential store;
+        a caller that loses that race waits for the winner's token to appear.
+        """
+        token = self.get_user_token(user_id)
+        if token is None or not token.refresh_token or not self._needs_refresh(token):
+            return token
+
+        async with self._get_refresh_lock(user_id):
+            token = self.get_user_token(user_id)
+            if not self._needs_refresh(token):
                 return token
-                
+
+            lock_name = f"clio-refresh:{user_id}"
+            owner = credential_store.acquire_lock(lock_name, settings.token_refresh_lock_seconds)
+            if owner is None:
+                return await self._wait_for_refresh(user_id, token)
+
+            try:
+                token = self.get_user_token(user_id)
+                if not self._needs_refresh(token):
+                    return token
+                refreshed = await self._request_token({
+                    "grant_type": "refresh_token",
+                    "refresh_token": token.refresh_token
+                })
+                if not refreshed.refresh_token:
+                    refreshed.refresh_token = token.refresh_token
+                self.save_user_token(user_id, refreshed)
+                logger.info(f"Refreshed Clio token for {user_id}")
+                return refreshed
             except httpx.HTTPError as e:
-                logger.error(f"Token exchange failed: {str(e)}")
-                raise Exception(f"Failed to exchange code for token: {str(e)}")
-    
-    def get_user_token(self, user_id: str = "demo_user") -> Optional[TokenData]:
-        return self.user_sessions.get(user_id)
+                logger.error(f"Clio token refresh failed for {user_id}: {str(e)}")
+                # The old token may still have a little life left; let the caller try it
+                return token
+            finally:
+                credential_store.release_lock(lock_name, owner)
+
+    async def _request_token(self, data: Dict[str, str]) -> TokenData:
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{self.base_url}/oauth/token",
+                data={"client_id": self.client_id, "client_secret": self.client_secret, **data},
+                timeout=30
+            )
+        response.raise_for_status()
+        token_data = response.json()
+        expires_in = token_data.get("expires_in")
+        return TokenData(
+            access_token=token_data["access_token"],
+            refresh_token=token_data.get("refresh_token"),
+            expires_at=datetime.now(timezone.utc) + timedelta(seconds=expires_in) if expires_in else None
+        )
+
+    async def _wait_for_refresh(self, user_id: str, token: TokenData) -> TokenData:
+        """Poll the store while another worker refreshes the token"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.token_refresh_lock_seconds
+        while loop.time() < deadline:
+            await asyncio.sleep(0.2)
+            latest = self.get_user_token(user_id)
+            if latest is not None and not self._needs_refresh(latest):
+                return latest
+        return token
+
+    def _needs_refresh(self, token: TokenData) -> bool:
+        if token.expires_at is None:
+            return False
+        expires_at = token.expires_at if token.expires_at.tzinfo else token.expires_at.replace(tzinfo=timezone.utc)
+        margin = timedelta(seconds=settings.token_refresh_margin_seconds)
+        return expires_at - margin <= datetime.now(timezone.utc)
+
+    def _get_refresh_lock(self, user_id: str) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._refresh_loop is not loop:
+            self._refresh_locks = {}
+            self._refresh_loop = loop
+        return self._refresh_locks.setdefault(user_id, asyncio.Lock())
     
-    async def create_activities(self, summaries: List[EmailSummary]) -> ClioActivityResponse:
-        user_id = "demo_user"
-        token = self.get_user_token(user_id)
+    async def create_activities(self, summaries: List[EmailSummary], user_id: str = DEFAULT_USER_ID) -> ClioActivityResponse:
+        token = await self.get_valid_token(user_id)
         
         if not token:
             raise Exception("User not authenticated with Clio")
         
-        api_url = f"{self.base_url}/api/v4/activities"
         responses = []
         errors = []
         
-        async with httpx.AsyncClient() as client:
-            for summary in summaries:
-                try:
-                    payload = self._create_activity_payload(summary)
-                    print(payload)
-                    response = await client.post(
-                        api_url,
-                        headers={
-                            "Authorization": f"Bearer {token.access_token}",
-                            "Content-Type": "application/json"
-                        },
-                        json=payload,
-                        timeout=30
-                    )
-                    
-                    if response.status_code in [200, 201]:
-                        try:
-                            responses.append(response.json())
-                        except:
-                            responses.append({"status": "created", "code": response.status_code})
-                    else:
-                        error_msg = f"HTTP {response.status_code}: {response.text}"
-                        errors.append(error_msg)
-                        logger.error(error_msg)
-                
-                except Exception as e:
-                    error_msg = f"Error creating activity: {str(e)}"
-                    errors.append(error_msg)
-                    logger.error(error_msg)
+        for response, error in await self.push_activities(summaries, token):
+            if error:
+                errors.append(error)
+            else:
+                responses.append(response)
         
         return ClioActivityResponse(
             status="success" if responses else "error",
             activities_created=responses,
             errors=errors if errors else None
         )
+
+    async def push_activities(self, summaries: List[EmailSummary], token: TokenData,
+                              activity_ids: Optional[List[Optional[str]]] = None) -> List[Tuple[Optional[dict], Optional[str]]]:
+        """Send every summary concurrently; returns (response, error) in input order.
+
+        Summaries with an entry in activity_ids update that existing activity
+        instead of creating a new one.
+        """
+        api_url = f"{self.base_url}/api/v4/activities"
+        client, semaphore = self._get_client()
+        headers = {
+            "Authorization": f"Bearer {token.access_token}",
+            "Content-Type": "application/json"
+        }
+        if activity_ids is None:
+            activity_ids = [None] * len(summaries)
+
+        async def push(summary: EmailSummary, activity_id: Optional[str]) -> Tuple[Optional[dict], Optional[str]]:
+            try:
+                payload = self._create_activity_payload(summary)
+                logger.debug(f"Sending Clio activity: {payload}")
+                async with semaphore:
+                    if activity_id:
+                        return await self._send_activity(client, "PATCH", f"{api_url}/{activity_id}", headers, payload)
+                    return await self._send_activity(client, "POST", api_url, headers, payload)
+            except Exception as e:
+                error_msg = f"Error creating activity: {str(e)}"
+                logger.error(error_msg)
+                return None, error_msg
+
+        return await asyncio.gather(*(push(summary, activity_id) for summary, activity_id in zip(summaries, activity_ids)))
+
+    async def list_records(self, token: TokenData, resource: str, params: Dict[str, Any]) -> List[dict]:
+        """Fetch every page of a Clio v4 collection such as matters or contacts"""
+        client, semaphore = self._get_client()
+        headers = {"Authorization": f"Bearer {token.access_token}"}
+        url = f"{self.base_url}/api/v4/{resource}.json?{httpx.QueryParams(params)}"
+        records = []
+
+        while url:
+            async with semaphore:
+                response, error = await self._send_activity(client, "GET", url, headers, None)
+            if error:
+                raise Exception(f"Failed to list Clio {resource}: {error}")
+            records.extend(response.get("data", []))
+            # Clio returns the next page as a complete URL carrying its own page token
+            url = ((response.get("meta") or {}).get("paging") or {}).get("next")
+
+        return records
+
+    @staticmethod
+    def activity_id(response: Optional[dict]) -> Optional[str]:
+        """Pull the activity id out of a Clio create/update response"""
+        data = (response or {}).get("data") or {}
+        activity_id = data.get("id") if isinstance(data, dict) else None
+        return str(activity_id) if activity_id is not None else None
+
+    async def _send_activity(self, client: httpx.AsyncClient, method: str, url: str,
+                             headers: Dict[str, str], payload: Dict[str, Any]) -> Tuple[Optional[dict], Optional[str]]:
+        """Send one activity request, retrying throttled and 5xx responses with backoff.
+
+        Creating an activity is not idempotent: a POST that timed out or got a
+        5xx may already exist in Clio, so POSTs are only retried on 429 and on
+        errors raised before the request was sent. Other POST failures are
+        returned for the ledger or a later run to deal with.
+        """
+        # Idempotent requests may be resent after any failure
+        resendable = method != "POST"
+        attempt = 0
+        loop = asyncio.get_running_loop()
+        while True:
+            pause = self._throttled_until - loop.time()
+            if pause > 0:
+                await asyncio.sleep(pause)
+
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, headers=headers, json=payload)
+            except httpx.TransportError as e:
+                CLIO_REQUEST_SECONDS.observe(time.perf_counter() - start, method=method, status="error")
+                if not resendable and not isinstance(e, UNSENT_ERRORS):
+                    error_msg = f"Clio {method} failed ({type(e).__name__}: {str(e)}) and was not retried, it may have been applied"
+                    logger.error(error_msg)
+                    return None, error_msg
+                if attempt >= settings.clio_max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                logger.warning(f"Clio request failed ({str(e)}), retrying in {delay:.1f}s")
+            else:
+                CLIO_REQUEST_SECONDS.observe(time.perf_counter() - start, method=method, status=response.status_code)
+                if response.status_code in [200, 201]:
+                    try:
+                        return response.json(), None
+                    except ValueError:
+                        return {"status": "created", "code": response.status_code}, None
+
+                retryable = response.status_code == 429 or (resendable and response.status_code in RETRY_STATUS_CODES)
+                if not retryable or attempt >= settings.clio_max_retries:
+                    error_msg = f"HTTP {response.status_code}: {response.text}"
+                    logger.error(error_msg)
+                    return None, error_msg
+
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff_delay(attempt)
+                if response.status_code == 429:
+                    self._throttled_until = max(self._throttled_until, loop.time() + delay)
+                logger.warning(f"Clio returned HTTP {response.status_code}, retrying in {delay:.1f}s")
+
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _retry_after(self, response: httpx.Response) -> Optional[float]:
+        """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                return None
+        return min(max(delay, 0.0), settings.clio_backoff_max)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(settings.clio_backoff_max, settings.clio_backoff_base * 2 ** attempt))
+
+    def _get_client(self):
+        """Return the long-lived pooled client and in-flight semaphore for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                http2=settings.clio_http2 and importlib.util.find_spec("h2") is not None,
+                timeout=settings.clio_timeout,
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency
+                )
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._throttled_until = 0.0
+            self._loop = loop
+        return self._client, self._semaphore
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
     
     # def _create_activity_payload(self, summary: EmailSummary) -> Dict[str, Any]:
     #     today = date.today().isoformat()
@@ -144,7 +354,8 @@ class ClioService:
     #             }
     #         }
     def _create_activity_payload(self, summary: EmailSummary) -> Dict[str, Any]:
-        today = date.today().isoformat()
+        # The day the emails were sent, when known
+        day = (summary.date or date.today()).isoformat()
         
         if summary.type == "TimeEntry":
             return {
@@ -152,7 +363,7 @@ class ClioService:
                     "type": "TimeEntry",
                     "attributes": {
                         "description": summary.summary,
-                        "date": today,
+                        "date": day,
                         "billable": True,
                         "rate": summary.rate or 200,
                         "quantity": summary.duration or 1.0,
@@ -166,7 +377,7 @@ class ClioService:
                     "type": "ExpenseEntry",
                     "attributes": {
                         "description": summary.summary,
-                        "date": today,
+                        "date": day,
                         "billable": True,
                         "price": summary.price or 100,
                         "quantity": summary.quantity or 1,
@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import fnmatch
+import uuid
+import sqlite3
+import threading
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Requests without a session cookie act as this user, as the single-user app always did
+DEFAULT_USER_ID = "demo_user"
+
+
+class CredentialStore:
+    """Per-user OAuth credentials shared by every worker process.
+
+    Credentials are JSON objects keyed by (user_id, provider), e.g. "gmail" or
+    "clio". acquire_lock/release_lock give a short-lived cross-process lock so
+    only one worker refreshes a given token at a time.
+    """
+
+    def get(self, user_id: str, provider: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def set(self, user_id: str, provider: str, data: Dict[str, Any]):
+        raise NotImplementedError
+
+    def delete(self, user_id: str, provider: str):
+        raise NotImplementedError
+
+    def users(self, provider: str) -> List[str]:
+        """Every user holding credentials for the provider"""
+        raise NotImplementedError
+
+    def acquire_lock(self, name: str, ttl_seconds: float) -> Optional[str]:
+        """Take the named lock if it is free or expired; returns an owner token or None"""
+        raise NotImplementedError
+
+    def release_lock(self, name: str, owner: str):
+        raise NotImplementedError
+
+
+class SQLiteCredentialStore(CredentialStore):
+    """Default store: a WAL-mode SQLite file every worker on the host can open"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS credentials (
+                    user_id TEXT NOT NULL,
+                    provider TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (user_id, provider)
+                );
+                CREATE TABLE IF NOT EXISTS locks (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+            """)
+            self._conn = conn
+        return self._conn
+
+    def get(self, user_id: str, provider: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT data FROM credentials WHERE user_id = ? AND provider = ?", (user_id, provider)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, user_id: str, provider: str, data: Dict[str, Any]):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO credentials (user_id, provider, data, updated_at) VALUES (?, ?, ?, ?)",
+                    (user_id, provider, json.dumps(data), datetime.now(timezone.utc).isoformat())
+                )
+
+    def delete(self, user_id: str, provider: str):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM credentials WHERE user_id = ? AND provider = ?", (user_id, provider))
+
+    def users(self, provider: str) -> List[str]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT user_id FROM credentials WHERE provider = ? ORDER BY user_id", (provider,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def acquire_lock(self, name: str, ttl_seconds: float) -> Optional[str]:
+        owner = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM locks WHERE name = ? AND expires_at < ?", (name, now))
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO locks (name, owner, expires_at) VALUES (?, ?, ?)",
+                    (name, owner, now + ttl_seconds)
+                )
+        return owner if cursor.rowcount else None
+
+    def release_lock(self, name: str, owner: str):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+
+class RedisCredentialStore(CredentialStore):
+    """Store for multi-host deployments; works with redis-py or anything exposing get/set/delete/eval"""
+
+    # Delete the lock only if we still own it
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, client, prefix: str = "billing-gmail:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, user_id: str, provider: str) -> str:
+        return f"{self.prefix}credentials:{user_id}:{provider}"
+
+    def get(self, user_id: str, provider: str) -> Optional[Dict[str, Any]]:
+        value = self.client.get(self._key(user_id, provider))
+        if value is None:
+            return None
+        return json.loads(value.decode("utf-8") if isinstance(value, bytes) else value)
+
+    def set(self, user_id: str, provider: str, data: Dict[str, Any]):
+        self.client.set(self._key(user_id, provider), json.dumps(data))
+
+    def delete(self, user_id: str, provider: str):
+        self.client.delete(self._key(user_id, provider))
+
+    def users(self, provider: str) -> List[str]:
+        head, tail = f"{self.prefix}credentials:", f":{provider}"
+        users = []
+        for key in self.client.scan_iter(match=f"{head}*{tail}"):
+            key = key.decode("utf-8") if isinstance(key, bytes) else key
+            users.append(key[len(head):-len(tail)])
+        return sorted(users)
+
+    def acquire_lock(self, name: str, ttl_seconds: float) -> Optional[str]:
+        owner = uuid.uuid4().hex
+        if self.client.set(f"{self.prefix}lock:{name}", owner, nx=True, px=int(ttl_seconds * 1000)):
+            return owner
+        return None
+
+    def release_lock(self, name: str, owner: str):
+        self.client.eval(self.RELEASE_SCRIPT, 1, f"{self.prefix}lock:{name}", owner)
+
+
+class FakeRedis:
+    """In-process stand-in for the subset of redis-py RedisCredentialStore uses"""
+
+    def __init__(self):
+        self._data: Dict[str, Any] = {}
+        self._expires: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, key: str):
+        if key in self._expires and self._expires[key] <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+
+    def get(self, key: str):
+        with self._lock:
+            self._expire(key)
+            return self._data.get(key)
+
+    def set(self, key: str, value, nx: bool = False, px: Optional[int] = None):
+        with self._lock:
+            self._expire(key)
+            if nx and key in self._data:
+                return None
+            self._data[key] = value
+            self._expires.pop(key, None)
+            if px is not None:
+                self._expires[key] = time.monotonic() + px / 1000
+            return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            removed = 0
+            for key in keys:
+                self._expires.pop(key, None)
+                removed += self._data.pop(key, None) is not None
+            return removed
+
+    def scan_iter(self, match: str = "*"):
+        with self._lock:
+            for key in list(self._data):
+                self._expire(key)
+            keys = [key for key in self._data if fnmatch.fnmatchcase(key, match)]
+        return iter(keys)
+
+    def eval(self, script: str, numkeys: int, key: str, owner: str) -> int:
+        """Only understands RedisCredentialStore.RELEASE_SCRIPT"""
+        with self._lock:
+            self._expire(key)
+            if self._data.get(key) == owner:
+                del self._data[key]
+                self._expires.pop(key, None)
+                return 1
+            return 0
+
+
+def create_credential_store() -> CredentialStore:
+    backend = settings.credential_store.lower()
+    if backend == "sqlite":
+        return SQLiteCredentialStore(settings.credential_store_path)
+    if backend == "memory":
+        return RedisCredentialStore(FakeRedis())
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise Exception("credential_store=redis needs the redis package (pip install redis)")
+        return RedisCredentialStore(redis.Redis.from_url(settings.redis_url))
+    raise ValueError(f"Unknown credential store: {settings.credential_store}")
+
+
+credential_store = create_credential_store()
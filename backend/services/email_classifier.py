@@ -0,0 +1,205 @@
+import re
+import pickle
+import logging
+import threading
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional
+from ..config import settings
+from ..models.schemas import EmailSummary
+from ..utils.body_reducer import SIGN_OFF
+
+logger = logging.getLogger(__name__)
+
+ACKNOWLEDGEMENT = re.compile(
+    r"\b(thanks|thank you|many thanks|received|got it|noted|will do|sounds good|confirmed|"
+    r"acknowledged|ok|okay|perfect|great)\b",
+    re.IGNORECASE
+)
+GREETING = re.compile(r"^\s*(hi|hello|hey|dear|good (morning|afternoon|evening))\b[^,!\n]{0,40}[,!]?", re.IGNORECASE)
+WORD = re.compile(r"[A-Za-z0-9][\w'’-]*")
+# Lines a sign-off may be followed by (name, title)
+MAX_SIGNATURE_LINES = 2
+MAX_SIGNATURE_LINE_WORDS = 4
+# Anything that suggests the short email actually asks for or transmits work
+SUBSTANTIVE = re.compile(r"\?|\b(attach\w*|enclos\w*|draft|review|please|call me|deadline)\b", re.IGNORECASE)
+# Instructions that turn a short "OK" or "thanks" into a request for work ("OK, settle.")
+ACTION = re.compile(
+    r"\b(settl\w*|file|filing|send|sign|serve|submit|prepare|revise|amend|negotiate|research|draft\w*|"
+    r"review\w*|call|email|forward|finali[sz]e|execute|proceed|approve|accept|reject|pay|invoice|bill|"
+    r"schedule|book|arrange|chase|follow|reply|respond|update|meet|withdraw|dismiss|appeal)\b",
+    re.IGNORECASE
+)
+AMOUNT = re.compile(r"(?:\$|USD\s?)\s?(\d{1,3}(?:,\d{3})+(?:\.\d{2})?|\d+(?:\.\d{2})?)")
+RECEIPT = re.compile(r"\b(receipt|invoice|paid|payment|charged|reimburse\w*)\b", re.IGNORECASE)
+EXPENSE_KEYWORDS = {
+    "filing fee": "Court filing fee",
+    "court fee": "Court fee",
+    "recording fee": "Recording fee",
+    "process server": "Process server fee",
+    "service of process": "Process server fee",
+    "courier": "Courier charge",
+    "postage": "Postage",
+    "transcript": "Transcript fee",
+    "copying": "Copying charge",
+}
+EXPENSE_KEYWORD = re.compile("|".join(re.escape(keyword) for keyword in EXPENSE_KEYWORDS), re.IGNORECASE)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+class Classification(NamedTuple):
+    path: str
+    confidence: float
+    summary: Optional[EmailSummary]
+
+
+class EmailClassifier:
+    """Cheap local classification that answers obvious emails without calling the LLM.
+
+    Keyword/regex rules run first; an optional scikit-learn style model
+    (anything pickled with predict_proba and classes_) handles the rest.
+    Results below the confidence threshold fall through to the LLM.
+    """
+
+    def __init__(self, model_path: Optional[str] = None):
+        self.model_path = model_path
+        self._model = None
+        self._model_loaded = False
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def classify(self, email_body: str) -> Optional[EmailSummary]:
+        """Return a summary for high-confidence emails, or None to use the LLM"""
+        result = self._rule_classification(email_body) or self._model_classification(email_body)
+        if result is None or result.summary is None or result.confidence < settings.classifier_confidence_threshold:
+            self._count("llm")
+            return None
+        self._count(result.path)
+        return result.summary
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        return {
+            "confidence_threshold": settings.classifier_confidence_threshold,
+            "model_loaded": self._model is not None,
+            "paths": counts,
+            "bypass_rate": 1 - counts.get("llm", 0) / total if total else 0.0,
+        }
+
+    def _count(self, path: str):
+        with self._lock:
+            self._counts[path] += 1
+
+    def _rule_classification(self, email_body: str) -> Optional[Classification]:
+        words = email_body.split()
+        leftover = self._ack_leftover_words(email_body)
+        if (len(words) <= settings.classifier_ack_max_words
+                and ACKNOWLEDGEMENT.search(email_body)
+                and len(leftover) <= settings.classifier_ack_max_leftover_words
+                and not any(ACTION.fullmatch(word) for word in leftover)
+                and not SUBSTANTIVE.search(email_body)
+                and not AMOUNT.search(email_body)):
+            confidence = 0.95 - settings.classifier_ack_leftover_penalty * len(leftover)
+            return Classification("rule:acknowledgement", confidence, EmailSummary(
+                summary="Reviewed and acknowledged correspondence.",
+                type="TimeEntry",
+                duration=settings.classifier_ack_duration,
+                rate=settings.classifier_default_rate,
+                matter_id=settings.default_matter_id
+            ))
+
+        keyword = EXPENSE_KEYWORD.search(email_body)
+        amounts = set(self._amounts(email_body))
+        if keyword and len(amounts) == 1:
+            label = EXPENSE_KEYWORDS[keyword.group(0).lower()]
+            price = amounts.pop()
+            return Classification(
+                "rule:expense_receipt",
+                0.95 if RECEIPT.search(email_body) else 0.85,
+                EmailSummary(
+                    summary=f"{label} of ${price:,.2f}.",
+                    type="ExpenseEntry",
+                    price=price,
+                    quantity=1,
+                    expense_type="Disbursement",
+                    matter_id=settings.default_matter_id
+                )
+            )
+        return None
+
+    def _ack_leftover_words(self, email_body: str) -> List[str]:
+        """Words left once acknowledgement phrases, the greeting and the sign-off are taken out"""
+        lines = [line for line in email_body.strip().split("\n") if line.strip()]
+        sign_off = max((i for i, line in enumerate(lines) if SIGN_OFF.match(line)), default=None)
+        if sign_off is not None:
+            signature = lines[sign_off + 1:]
+            if (len(signature) <= MAX_SIGNATURE_LINES
+                    and all(len(line.split()) <= MAX_SIGNATURE_LINE_WORDS for line in signature)):
+                lines = lines[:sign_off]
+        text = GREETING.sub("", "\n".join(lines), count=1)
+        return WORD.findall(ACKNOWLEDGEMENT.sub(" ", text))
+
+    def _model_classification(self, email_body: str) -> Optional[Classification]:
+        model = self._get_model()
+        if model is None:
+            return None
+
+        try:
+            probabilities = model.predict_proba([email_body])[0]
+        except Exception as e:
+            logger.warning(f"Classifier model failed: {str(e)}")
+            return None
+
+        best = max(range(len(probabilities)), key=lambda i: probabilities[i])
+        entry_type = str(model.classes_[best])
+        confidence = float(probabilities[best])
+        summary = None
+
+        if entry_type == "TimeEntry":
+            summary = EmailSummary(
+                summary=self._first_sentence(email_body),
+                type="TimeEntry",
+                duration=settings.classifier_default_duration,
+                rate=settings.classifier_default_rate,
+                matter_id=settings.default_matter_id
+            )
+        elif entry_type == "ExpenseEntry":
+            # Without exactly one amount there is no price to bill, so leave it to the LLM
+            amounts = set(self._amounts(email_body))
+            if len(amounts) == 1:
+                summary = EmailSummary(
+                    summary=self._first_sentence(email_body),
+                    type="ExpenseEntry",
+                    price=amounts.pop(),
+                    quantity=1,
+                    expense_type="Disbursement",
+                    matter_id=settings.default_matter_id
+                )
+        return Classification("model", confidence, summary)
+
+    def _get_model(self):
+        """Load the pickled model once; a missing or broken file just disables the model path"""
+        if not self._model_loaded:
+            self._model_loaded = True
+            if self.model_path:
+                try:
+                    with open(self.model_path, "rb") as f:
+                        self._model = pickle.load(f)
+                    logger.info(f"Loaded email classifier model from {self.model_path}")
+                except Exception as e:
+                    logger.warning(f"Could not load classifier model {self.model_path}: {str(e)}")
+        return self._model
+
+    @staticmethod
+    def _amounts(email_body: str) -> List[float]:
+        return [float(amount.replace(",", "")) for amount in AMOUNT.findall(email_body)]
+
+    @staticmethod
+    def _first_sentence(email_body: str) -> str:
+        text = " ".join(email_body.split())
+        sentence = SENTENCE_END.split(text, maxsplit=1)[0]
+        return sentence if len(sentence) <= 200 else sentence[:197].rstrip() + "..."
+
+
+email_classifier = EmailClassifier(settings.classifier_model_path)
@@ -1,48 +1,392 @@
+import time
+import random
 import logging
-from typing import List
-from ..utils.gmail_auth import get_gmail_service
+from datetime import datetime
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from googleapiclient.errors import HttpError
+from ..config import settings
+from ..utils.gmail_auth import GmailAuthRequired, get_gmail_credentials, get_gmail_service
 from ..utils.email_parser import parse_email
-from ..models.schemas import EmailBase
+from ..utils.metrics import EMAIL_PARSE_SECONDS, GMAIL_FETCH_SECONDS, GMAIL_REQUEST_SECONDS
+from ..models.schemas import EmailBase, EmailSummary
+from .credential_store import DEFAULT_USER_ID
+from .email_store import email_store
 
 logger = logging.getLogger(__name__)
 
+# Gmail rejects batches with more than 100 calls
+GMAIL_MAX_BATCH_SIZE = 100
+# messages.list never returns more than 500 ids per page
+GMAIL_MAX_PAGE_SIZE = 500
+# Per-message errors worth retrying; anything else (e.g. a 404 for a deleted message) is final
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
 
 class EmailService:
     def __init__(self):
-        self.service = None
+        # Fixed Gmail clients per user (e.g. a fake server); everyone else gets
+        # a per-thread client from the factory, since clients are not thread-safe
+        self.services: Dict[str, Any] = {}
+        self.mailboxes: Dict[str, str] = {}
+
+    def _get_service(self, user_id: str = DEFAULT_USER_ID):
+        if user_id in self.services:
+            return self.services[user_id]
+        return get_gmail_service(user_id)
 
-    def _get_service(self):
-        if not self.service:
-            self.service = get_gmail_service()
-        return self.service
+    def require_connected(self, user_id: str = DEFAULT_USER_ID):
+        """Raise GmailAuthRequired if the user hasn't connected Gmail"""
+        if user_id not in self.services:
+            get_gmail_credentials(user_id)
 
-    def fetch_sent_emails(self, max_results: int = 3) -> List[EmailBase]:
+    def fetch_sent_emails(self, max_results: int = 3, batched: bool = None,
+                          user_id: str = DEFAULT_USER_ID) -> List[EmailBase]:
+        if batched is None:
+            batched = settings.gmail_batch_fetch
 
         try:
-            service = self._get_service()
-            results = service.users().messages().list(
-                userId="me", labelIds=["SENT"], maxResults=3
-            ).execute()
+            with GMAIL_FETCH_SECONDS.time():
+                if settings.gmail_incremental_sync:
+                    mailbox = self.sync_sent_emails(max_results, batched=batched, user_id=user_id)
+                    return email_store.recent_emails(mailbox, max_results)
 
-            messages = results.get("messages", [])
-            parsed_emails = []
+                service = self._get_service(user_id)
+                message_ids = self._list_message_ids(service, max_results)
+                return self._fetch_emails(service, message_ids, batched)[0]
 
-            for msg in messages:
-                try:
-                    msg_detail = service.users().messages().get(
-                        userId="me", id=msg["id"]
-                    ).execute()
+        except GmailAuthRequired:
+            raise
+        except Exception as e:
+            logger.error(f"Error fetching emails: {str(e)}")
+            raise Exception(f"Failed to fetch emails: {str(e)}")
+
+    def iter_sent_emails(self, max_results: int, batched: bool = None,
+                         user_id: str = DEFAULT_USER_ID) -> Iterator[List[EmailBase]]:
+        """Yield sent emails one Gmail batch at a time so callers can start on early pages"""
+        if batched is None:
+            batched = settings.gmail_batch_fetch
+        page_size = max(1, min(settings.gmail_batch_size, GMAIL_MAX_BATCH_SIZE))
+
+        if settings.gmail_incremental_sync:
+            # New emails go out as the sync stores each batch; stored ones it didn't touch follow once it is done
+            sent = set()
+            for emails in self._sync_batches(max_results, batched, user_id):
+                page = [email for email in emails if email.id not in sent][:max_results - len(sent)]
+                if page:
+                    sent.update(email.id for email in page)
+                    yield page
+            rest = [
+                email for email in email_store.recent_emails(self.mailboxes[user_id], max_results)
+                if email.id not in sent
+            ][:max_results - len(sent)]
+            for start in range(0, len(rest), page_size):
+                yield rest[start:start + page_size]
+            return
+
+        service = self._get_service(user_id)
+        message_ids = self._list_message_ids(service, max_results)
+        for start in range(0, len(message_ids), page_size):
+            yield self._fetch_emails(service, message_ids[start:start + page_size], batched)[0]
+
+    def sync_sent_emails(self, depth: int, batched: bool = True, user_id: str = DEFAULT_USER_ID) -> str:
+        """Bring the local copy of the SENT label up to date and return the mailbox.
+
+        The first sync, or one that needs more than the stored depth, lists the
+        label from scratch. Later syncs only replay Gmail history recorded since
+        the stored historyId, and fall back to a full resync once Gmail expires
+        that checkpoint. Messages that can't be fetched even after retrying are
+        stored as pending and fetched again by the next sync, so advancing the
+        checkpoint never loses them.
+        """
+        for _ in self._sync_batches(depth, batched, user_id):
+            pass
+        return self.mailboxes[user_id]
+
+    def _sync_batches(self, depth: int, batched: bool, user_id: str) -> Iterator[List[EmailBase]]:
+        """Run sync_sent_emails, yielding each batch of fetched emails once it is stored.
+
+        The checkpoint only moves after the last batch, so a sync that stops
+        early is simply repeated by the next one.
+        """
+        service = self._get_service(user_id)
+        mailbox = self._get_mailbox(service, user_id)
+        history_id, stored_depth = email_store.get_checkpoint(mailbox)
+        depth = max(depth, settings.gmail_full_sync_size)
+
+        if history_id is None or depth > stored_depth:
+            yield from self._full_sync(service, mailbox, depth, batched)
+            return
+
+        try:
+            added_ids, deleted_ids, new_history_id = self._list_history(service, history_id)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            logger.info(f"History checkpoint {history_id} expired for {mailbox}, running full resync")
+            yield from self._full_sync(service, mailbox, depth, batched)
+            return
+
+        deleted = set(deleted_ids)
+        fetch_ids = list(dict.fromkeys(
+            added_ids + [message_id for message_id in email_store.pending_ids(mailbox) if message_id not in deleted]
+        ))
+        added = 0
+        failed = []
+        for emails, batch_failed in self._iter_fetch(service, fetch_ids, batched):
+            email_store.store_batch(mailbox, emails)
+            added += len(emails)
+            failed.extend(batch_failed)
+            yield emails
+        email_store.apply_changes(mailbox, deleted_ids, new_history_id, failed)
+        logger.info(f"Incremental sync for {mailbox}: {added} added, {len(deleted_ids)} deleted, "
+                    f"{len(failed)} pending")
+
+    def search_emails(
+        self,
+        query: Optional[str] = None,
+        subject: Optional[str] = None,
+        recipient: Optional[str] = None,
+        matter_id: Optional[int] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        limit: int = 50,
+        offset: int = 0,
+        user_id: str = DEFAULT_USER_ID
+    ) -> List[EmailBase]:
+        """Query the locally synced SENT messages without calling Gmail"""
+        mailbox = self._get_mailbox(self._get_service(user_id), user_id)
+        return email_store.search(
+            mailbox, query=query, subject=subject, recipient=recipient, matter_id=matter_id,
+            date_from=date_from, date_to=date_to, limit=limit, offset=offset
+        )
+
+    def stored_summaries(self, max_results: int,
+                         user_id: str = DEFAULT_USER_ID) -> Optional[List[Tuple[EmailBase, Optional[EmailSummary]]]]:
+        """Recent emails and their precomputed summaries straight from the local store.
+
+        Returns None until the mailbox has been synced at least once, so callers
+        can fall back to fetching from Gmail.
+        """
+        mailbox = self._get_mailbox(self._get_service(user_id), user_id)
+        history_id, _ = email_store.get_checkpoint(mailbox)
+        if history_id is None:
+            return None
+        return email_store.recent_summaries(mailbox, max_results)
+
+    def unsummarized_emails(self, limit: int, user_id: str = DEFAULT_USER_ID) -> List[EmailBase]:
+        """Synced emails among the newest `limit` that still need a summary"""
+        mailbox = self._get_mailbox(self._get_service(user_id), user_id)
+        return email_store.unsummarized_emails(mailbox, limit)
+
+    def save_summaries(self, emails: List[EmailBase], summaries: List[Any], user_id: str = DEFAULT_USER_ID):
+        """Keep successful summaries so later requests can read them without the LLM"""
+        stored = {
+            email.id: summary
+            for email, summary in zip(emails, summaries)
+            if email.id and isinstance(summary, EmailSummary)
+        }
+        if stored and user_id in self.mailboxes:
+            email_store.set_summaries(self.mailboxes[user_id], stored)
+
+    def thread_emails(self, thread_ids: List[str], user_id: str = DEFAULT_USER_ID) -> List[EmailBase]:
+        """Synced emails of the given threads; empty until the mailbox has been synced"""
+        if user_id not in self.mailboxes:
+            return []
+        return email_store.thread_emails(self.mailboxes[user_id], thread_ids)
+
+    def record_matters(self, emails: List[EmailBase], summaries: List[Any], user_id: str = DEFAULT_USER_ID):
+        """Remember which matter each summarized email was billed to, for search by matter"""
+        matters = {
+            email.id: summary.matter_id
+            for email, summary in zip(emails, summaries)
+            if email.id and isinstance(summary, EmailSummary)
+        }
+        if matters and user_id in self.mailboxes:
+            email_store.set_matters(self.mailboxes[user_id], matters)
+
+    def _full_sync(self, service, mailbox: str, depth: int, batched: bool) -> Iterator[List[EmailBase]]:
+        """List the label from scratch, storing and yielding one batch at a time.
+
+        Messages no longer listed are dropped and the checkpoint is taken only
+        once every batch is stored.
+        """
+        # Take the checkpoint before listing so nothing sent mid-sync is missed
+        history_id = self._execute(service.users().getProfile(userId="me"), "getProfile")["historyId"]
+        message_ids = self._list_message_ids(service, depth)
+        count = 0
+        failed = []
+        for emails, batch_failed in self._iter_fetch(service, message_ids, batched):
+            email_store.store_batch(mailbox, emails)
+            count += len(emails)
+            failed.extend(batch_failed)
+            yield emails
+        email_store.finish_full_sync(mailbox, message_ids, str(history_id), depth, failed)
+        logger.info(f"Full sync for {mailbox}: {count} messages, {len(failed)} pending")
+
+    def _iter_fetch(self, service, message_ids: List[str], batched: bool) -> Iterator[Tuple[List[EmailBase], List[str]]]:
+        """_fetch_emails one Gmail batch of ids at a time"""
+        page_size = max(1, min(settings.gmail_batch_size, GMAIL_MAX_BATCH_SIZE))
+        for start in range(0, len(message_ids), page_size):
+            yield self._fetch_emails(service, message_ids[start:start + page_size], batched)
+
+    def _get_mailbox(self, service, user_id: str = DEFAULT_USER_ID) -> str:
+        if user_id not in self.mailboxes:
+            self.mailboxes[user_id] = self._execute(service.users().getProfile(userId="me"), "getProfile")["emailAddress"]
+        return self.mailboxes[user_id]
+
+    @staticmethod
+    def _execute(request, call: str):
+        """Execute a Gmail request (or batch), timing the round trip"""
+        with GMAIL_REQUEST_SECONDS.time(call=call):
+            return request.execute()
+
+    def _list_history(self, service, start_history_id: str, label: str = "SENT") -> Tuple[List[str], List[str], str]:
+        """Collect message ids added to and deleted from a label since a historyId"""
+        added = {}
+        deleted = set()
+        latest_history_id = start_history_id
+        page_token = None
+
+        while True:
+            results = self._execute(service.users().history().list(
+                userId="me",
+                startHistoryId=start_history_id,
+                labelId=label,
+                historyTypes=["messageAdded", "messageDeleted"],
+                maxResults=GMAIL_MAX_PAGE_SIZE,
+                pageToken=page_token
+            ), "history.list")
+
+            for record in results.get("history", []):
+                for item in record.get("messagesAdded", []):
+                    message = item["message"]
+                    if label in message.get("labelIds", [label]):
+                        added[message["id"]] = True
+                        deleted.discard(message["id"])
+                for item in record.get("messagesDeleted", []):
+                    added.pop(item["message"]["id"], None)
+                    deleted.add(item["message"]["id"])
+
+            latest_history_id = str(results.get("historyId", latest_history_id))
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
+
+        return list(added), list(deleted), latest_history_id
+
+    def _fetch_emails(self, service, message_ids: List[str], batched: bool) -> Tuple[List[EmailBase], List[str]]:
+        """Fetch and parse messages, also returning the ids that still failed after retrying"""
+        if batched:
+            messages, failed = self._batch_get_messages(service, message_ids)
+        else:
+            messages, failed = self._get_messages(service, message_ids)
+
+        parsed_emails = []
+        for msg_detail in messages:
+            try:
+                with EMAIL_PARSE_SECONDS.time():
                     parsed = parse_email(msg_detail)
-                    parsed_emails.append(EmailBase(**parsed))
+                parsed_emails.append(EmailBase(**parsed))
+            except Exception as e:
+                logger.error(f"Error parsing email {msg_detail.get('id')}: {str(e)}")
+                continue
+
+        return parsed_emails, failed
+
+    def _list_message_ids(self, service, max_results: int, label: str = "SENT") -> List[str]:
+        """Page through messages.list until max_results ids are collected"""
+        message_ids = []
+        page_token = None
+
+        while len(message_ids) < max_results:
+            page_size = min(max_results - len(message_ids), GMAIL_MAX_PAGE_SIZE)
+            results = self._execute(service.users().messages().list(
+                userId="me", labelIds=[label], maxResults=page_size, pageToken=page_token
+            ), "messages.list")
+
+            message_ids.extend(msg["id"] for msg in results.get("messages", []))
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
+
+        return message_ids[:max_results]
+
+    def _get_messages(self, service, message_ids: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Fetch messages one round trip at a time, retrying throttled and 5xx responses"""
+        messages = []
+        failed = []
+        for message_id in message_ids:
+            for attempt in range(settings.gmail_max_retries + 1):
+                try:
+                    messages.append(self._execute(service.users().messages().get(
+                        userId="me", id=message_id
+                    ), "messages.get"))
+                    break
                 except Exception as e:
-                    logger.error(f"Error parsing email {msg['id']}: {str(e)}")
-                    continue
+                    retryable = self._retryable(e)
+                    if retryable and attempt < settings.gmail_max_retries:
+                        time.sleep(self._backoff_delay(attempt))
+                        continue
+                    logger.error(f"Error fetching email {message_id}: {str(e)}")
+                    if retryable:
+                        failed.append(message_id)
+                    break
+        return messages, failed
 
-            return parsed_emails
+    def _batch_get_messages(self, service, message_ids: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Fetch messages through Gmail batch requests, keeping list order.
 
-        except Exception as e:
-            logger.error(f"Error fetching emails: {str(e)}")
-            raise Exception(f"Failed to fetch emails: {str(e)}")
+        Calls inside a batch fail on their own (Gmail throttles busy batches
+        with per-message 429s), so those are sent again in a later batch after
+        a backoff. Returns the fetched messages and the ids still failing.
+        """
+        batch_size = max(1, min(settings.gmail_batch_size, GMAIL_MAX_BATCH_SIZE))
+        fetched = {}
+        remaining = list(message_ids)
+
+        for attempt in range(settings.gmail_max_retries + 1):
+            if attempt:
+                time.sleep(self._backoff_delay(attempt - 1))
+            retry = []
+
+            def on_response(request_id, response, exception):
+                if exception is None:
+                    fetched[request_id] = response
+                elif self._retryable(exception):
+                    retry.append(request_id)
+                else:
+                    logger.error(f"Error fetching email {request_id}: {str(exception)}")
+
+            for start in range(0, len(remaining), batch_size):
+                batch = service.new_batch_http_request(callback=on_response)
+                for message_id in remaining[start:start + batch_size]:
+                    batch.add(
+                        service.users().messages().get(userId="me", id=message_id),
+                        request_id=message_id
+                    )
+                self._execute(batch, "batch")
+
+            remaining = retry
+            if not remaining:
+                break
+
+        if remaining:
+            logger.error(f"{len(remaining)} emails still failing after {settings.gmail_max_retries} retries")
+        return [fetched[message_id] for message_id in message_ids if message_id in fetched], remaining
+
+    @staticmethod
+    def _retryable(exception: Exception) -> bool:
+        """Throttling, 5xx and transport errors; a 4xx such as a deleted message's 404 won't change on retry"""
+        if not isinstance(exception, HttpError):
+            return True
+        status = exception.resp.status
+        return status in RETRY_STATUS_CODES or (status == 403 and any(reason in str(exception) for reason in RATE_LIMIT_REASONS))
+
+    @staticmethod
+    def _backoff_delay(attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(settings.gmail_backoff_max, settings.gmail_backoff_base * 2 ** attempt))
 
 
 email_service = EmailService()
@@ -0,0 +1,401 @@
+import os
+import json
+import sqlite3
+import threading
+import logging
+from datetime import datetime, timezone
+from email.utils import getaddresses
+from typing import Dict, List, Optional, Tuple
+from ..config import settings
+from ..models.schemas import EmailBase, EmailSummary
+
+logger = logging.getLogger(__name__)
+
+# Bump when the tables below change; older stores are dropped and resynced from Gmail.
+# New tables alone don't need a bump: CREATE IF NOT EXISTS adds them to existing stores.
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sync_state (
+        mailbox TEXT PRIMARY KEY,
+        history_id TEXT NOT NULL,
+        depth INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS messages (
+        pk INTEGER PRIMARY KEY,
+        mailbox TEXT NOT NULL,
+        id TEXT NOT NULL,
+        thread_id TEXT,
+        date INTEGER,
+        subject TEXT,
+        to_addr TEXT,
+        cc_addr TEXT,
+        from_addr TEXT,
+        labels TEXT NOT NULL DEFAULT '[]',
+        matter_id INTEGER,
+        body TEXT NOT NULL,
+        UNIQUE (mailbox, id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_messages_mailbox_date ON messages (mailbox, date DESC);
+    CREATE INDEX IF NOT EXISTS idx_messages_mailbox_thread ON messages (mailbox, thread_id);
+    CREATE INDEX IF NOT EXISTS idx_messages_mailbox_matter ON messages (mailbox, matter_id, date DESC);
+
+    -- One row per To/Cc address so recipient filters use an index instead of LIKE scans
+    CREATE TABLE IF NOT EXISTS recipients (
+        message_pk INTEGER NOT NULL REFERENCES messages (pk) ON DELETE CASCADE,
+        mailbox TEXT NOT NULL,
+        address TEXT NOT NULL,
+        domain TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_recipients_address ON recipients (mailbox, address);
+    CREATE INDEX IF NOT EXISTS idx_recipients_domain ON recipients (mailbox, domain);
+    CREATE INDEX IF NOT EXISTS idx_recipients_message ON recipients (message_pk);
+
+    -- Messages the last sync couldn't fetch (e.g. rate limited); the next sync fetches them again
+    CREATE TABLE IF NOT EXISTS pending_messages (
+        mailbox TEXT NOT NULL,
+        id TEXT NOT NULL,
+        PRIMARY KEY (mailbox, id)
+    );
+
+    -- Summaries precomputed by the background poller, served without calling Gmail or the LLM
+    CREATE TABLE IF NOT EXISTS summaries (
+        message_pk INTEGER PRIMARY KEY REFERENCES messages (pk) ON DELETE CASCADE,
+        summary TEXT NOT NULL,
+        summarized_at TEXT NOT NULL
+    );
+
+    -- Full-text index over the messages table, kept in step by triggers
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+        subject, body, to_addr, cc_addr,
+        content='messages', content_rowid='pk'
+    );
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts (rowid, subject, body, to_addr, cc_addr)
+        VALUES (new.pk, new.subject, new.body, new.to_addr, new.cc_addr);
+    END;
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, subject, body, to_addr, cc_addr)
+        VALUES ('delete', old.pk, old.subject, old.body, old.to_addr, old.cc_addr);
+    END;
+    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF subject, body, to_addr, cc_addr ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, subject, body, to_addr, cc_addr)
+        VALUES ('delete', old.pk, old.subject, old.body, old.to_addr, old.cc_addr);
+        INSERT INTO messages_fts (rowid, subject, body, to_addr, cc_addr)
+        VALUES (new.pk, new.subject, new.body, new.to_addr, new.cc_addr);
+    END;
+"""
+
+MESSAGE_COLUMNS = "m.id, m.thread_id, m.date, m.subject, m.to_addr, m.cc_addr, m.from_addr, m.labels, m.matter_id, m.body"
+
+
+def _fts_phrase(text: str) -> str:
+    """Quote each word so user input is matched literally rather than parsed as FTS5 syntax"""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+def _to_millis(value: Optional[datetime]) -> Optional[int]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+class EmailStore:
+    """SQLite copy of each mailbox's SENT messages plus its Gmail sync checkpoint"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                # The store is a cache of Gmail, so an old layout is dropped and resynced
+                if version:
+                    logger.info(f"Upgrading email store from schema {version} to {SCHEMA_VERSION}")
+                conn.executescript("""
+                    DROP TABLE IF EXISTS messages_fts;
+                    DROP TABLE IF EXISTS recipients;
+                    DROP TABLE IF EXISTS messages;
+                    DROP TABLE IF EXISTS sync_state;
+                """)
+            conn.executescript(SCHEMA)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._conn = conn
+        return self._conn
+
+    def get_checkpoint(self, mailbox: str) -> Tuple[Optional[str], int]:
+        """Return the last synced historyId and full-sync depth for a mailbox"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT history_id, depth FROM sync_state WHERE mailbox = ?", (mailbox,)
+            ).fetchone()
+        return (row[0], row[1]) if row else (None, 0)
+
+    def pending_ids(self, mailbox: str) -> List[str]:
+        """Message ids an earlier sync failed to fetch"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id FROM pending_messages WHERE mailbox = ?", (mailbox,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def store_batch(self, mailbox: str, emails: List[EmailBase]):
+        """Insert or update one fetched batch of a sync; matters and summaries of known messages are kept"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                self._insert(conn, mailbox, emails)
+
+    def finish_full_sync(self, mailbox: str, message_ids: List[str], history_id: str, depth: int,
+                         pending_ids: List[str] = ()):
+        """Complete a full resync whose batches were stored: drop messages it didn't list and take the checkpoint.
+
+        pending_ids are the listed messages it couldn't fetch.
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS listed_ids (id TEXT PRIMARY KEY)")
+                conn.execute("DELETE FROM listed_ids")
+                conn.executemany("INSERT OR IGNORE INTO listed_ids (id) VALUES (?)", [(i,) for i in message_ids])
+                conn.execute(
+                    "DELETE FROM messages WHERE mailbox = ? AND id NOT IN (SELECT id FROM listed_ids)", (mailbox,)
+                )
+                conn.execute("DELETE FROM listed_ids")
+                self._set_pending(conn, mailbox, pending_ids)
+                self._set_checkpoint(conn, mailbox, history_id, depth)
+
+    def apply_changes(self, mailbox: str, deleted_ids: List[str], history_id: str, pending_ids: List[str] = ()):
+        """Finish one incremental history sync whose added messages were stored, and advance the checkpoint.
+
+        pending_ids replaces the mailbox's pending list: the messages this sync
+        (including ones retried from the list) still couldn't fetch.
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "DELETE FROM messages WHERE mailbox = ? AND id = ?",
+                    [(mailbox, message_id) for message_id in deleted_ids]
+                )
+                self._set_pending(conn, mailbox, pending_ids)
+                conn.execute(
+                    "UPDATE sync_state SET history_id = ?, updated_at = ? WHERE mailbox = ?",
+                    (history_id, datetime.now(timezone.utc).isoformat(), mailbox)
+                )
+
+    def set_matters(self, mailbox: str, matters: Dict[str, int]):
+        """Record the matter each message was billed to"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                self._update_matters(conn, mailbox, matters)
+
+    def set_summaries(self, mailbox: str, summaries: Dict[str, EmailSummary]):
+        """Store precomputed summaries by message id"""
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                self._insert_summaries(conn, mailbox, [
+                    (message_id, summary.model_dump_json(), now) for message_id, summary in summaries.items()
+                ])
+
+    def recent_summaries(self, mailbox: str, limit: int) -> List[Tuple[EmailBase, Optional[EmailSummary]]]:
+        """Newest messages paired with their precomputed summary, or None if not summarized yet"""
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT {MESSAGE_COLUMNS}, s.summary FROM messages m "
+                "LEFT JOIN summaries s ON s.message_pk = m.pk "
+                "WHERE m.mailbox = ? ORDER BY m.date DESC LIMIT ?",
+                (mailbox, limit)
+            ).fetchall()
+        return [
+            (self._row_to_email(row[:-1]), EmailSummary.model_validate_json(row[-1]) if row[-1] else None)
+            for row in rows
+        ]
+
+    def unsummarized_emails(self, mailbox: str, limit: int) -> List[EmailBase]:
+        """The newest messages (up to limit) that have no precomputed summary"""
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT {MESSAGE_COLUMNS} FROM "
+                "(SELECT * FROM messages WHERE mailbox = ? ORDER BY date DESC LIMIT ?) m "
+                "WHERE NOT EXISTS (SELECT 1 FROM summaries s WHERE s.message_pk = m.pk) ORDER BY m.date DESC",
+                (mailbox, limit)
+            ).fetchall()
+        return [self._row_to_email(row) for row in rows]
+
+    def thread_emails(self, mailbox: str, thread_ids: List[str]) -> List[EmailBase]:
+        """Every stored message of the given threads"""
+        thread_ids = list(dict.fromkeys(thread_ids))
+        if not thread_ids:
+            return []
+        placeholders = ",".join("?" * len(thread_ids))
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT {MESSAGE_COLUMNS} FROM messages m WHERE m.mailbox = ? AND m.thread_id IN ({placeholders}) "
+                "ORDER BY m.date DESC",
+                (mailbox, *thread_ids)
+            ).fetchall()
+        return [self._row_to_email(row) for row in rows]
+
+    def recent_emails(self, mailbox: str, limit: int) -> List[EmailBase]:
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT {MESSAGE_COLUMNS} FROM messages m WHERE m.mailbox = ? ORDER BY m.date DESC LIMIT ?",
+                (mailbox, limit)
+            ).fetchall()
+        return [self._row_to_email(row) for row in rows]
+
+    def search(
+        self,
+        mailbox: str,
+        query: Optional[str] = None,
+        subject: Optional[str] = None,
+        recipient: Optional[str] = None,
+        matter_id: Optional[int] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> List[EmailBase]:
+        """Filter stored messages, newest first.
+
+        query matches words anywhere in the subject, body or recipients and
+        subject only in the subject. A recipient starting with "@" matches a
+        whole domain. date_to is exclusive.
+        """
+        joins = []
+        where = ["m.mailbox = ?"]
+        params: list = []
+
+        match = []
+        if query and query.split():
+            match.append(_fts_phrase(query))
+        if subject and subject.split():
+            match.append(f"subject : ({_fts_phrase(subject)})")
+        if match:
+            joins.append("JOIN messages_fts f ON f.rowid = m.pk")
+            where.append("messages_fts MATCH ?")
+
+        if recipient:
+            recipient = recipient.strip().lower()
+            column = "domain" if recipient.startswith("@") else "address"
+            where.append(f"m.pk IN (SELECT message_pk FROM recipients WHERE mailbox = ? AND {column} = ?)")
+            params.extend([mailbox, recipient.lstrip("@")])
+        if matter_id is not None:
+            where.append("m.matter_id = ?")
+            params.append(matter_id)
+        if date_from is not None:
+            where.append("m.date >= ?")
+            params.append(_to_millis(date_from))
+        if date_to is not None:
+            where.append("m.date < ?")
+            params.append(_to_millis(date_to))
+
+        sql = (
+            f"SELECT {MESSAGE_COLUMNS} FROM messages m {' '.join(joins)} "
+            f"WHERE {' AND '.join(where)} ORDER BY m.date DESC LIMIT ? OFFSET ?"
+        )
+        params = [mailbox] + ([" AND ".join(match)] if match else []) + params + [limit, offset]
+
+        with self._lock:
+            rows = self._connect().execute(sql, params).fetchall()
+        return [self._row_to_email(row) for row in rows]
+
+    def _insert(self, conn: sqlite3.Connection, mailbox: str, emails: List[EmailBase]):
+        emails = [email for email in emails if email.id]
+        conn.executemany(
+            "INSERT INTO messages (mailbox, id, thread_id, date, subject, to_addr, cc_addr, from_addr, labels, body) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (mailbox, id) DO UPDATE SET thread_id = excluded.thread_id, date = excluded.date, "
+            "subject = excluded.subject, to_addr = excluded.to_addr, cc_addr = excluded.cc_addr, "
+            "from_addr = excluded.from_addr, labels = excluded.labels, body = excluded.body",
+            [
+                (
+                    mailbox, email.id, email.thread_id, _to_millis(email.date),
+                    email.subject, email.to, email.cc, email.from_, json.dumps(email.labels), email.body
+                )
+                for email in emails
+            ]
+        )
+
+        pks = {}
+        for email in emails:
+            pks[email.id] = conn.execute(
+                "SELECT pk FROM messages WHERE mailbox = ? AND id = ?", (mailbox, email.id)
+            ).fetchone()[0]
+        conn.executemany("DELETE FROM recipients WHERE message_pk = ?", [(pk,) for pk in pks.values()])
+        conn.executemany(
+            "INSERT INTO recipients (message_pk, mailbox, address, domain) VALUES (?, ?, ?, ?)",
+            [
+                (pks[email.id], mailbox, address, address.rpartition("@")[2])
+                for email in emails
+                for address in self._addresses(email)
+            ]
+        )
+
+    def _update_matters(self, conn: sqlite3.Connection, mailbox: str, matters: Dict[str, int]):
+        conn.executemany(
+            "UPDATE messages SET matter_id = ? WHERE mailbox = ? AND id = ?",
+            [(matter_id, mailbox, message_id) for message_id, matter_id in matters.items()]
+        )
+
+    def _insert_summaries(self, conn: sqlite3.Connection, mailbox: str, rows: List[Tuple[str, str, str]]):
+        """Insert (message_id, summary JSON, summarized_at) for messages present in the mailbox"""
+        conn.executemany(
+            "INSERT OR REPLACE INTO summaries (message_pk, summary, summarized_at) "
+            "SELECT pk, ?, ? FROM messages WHERE mailbox = ? AND id = ?",
+            [(summary, summarized_at, mailbox, message_id) for message_id, summary, summarized_at in rows]
+        )
+
+    def _set_checkpoint(self, conn: sqlite3.Connection, mailbox: str, history_id: str, depth: int):
+        conn.execute(
+            "INSERT OR REPLACE INTO sync_state (mailbox, history_id, depth, updated_at) VALUES (?, ?, ?, ?)",
+            (mailbox, history_id, depth, datetime.now(timezone.utc).isoformat())
+        )
+
+    def _set_pending(self, conn: sqlite3.Connection, mailbox: str, pending_ids: List[str]):
+        conn.execute("DELETE FROM pending_messages WHERE mailbox = ?", (mailbox,))
+        conn.executemany(
+            "INSERT OR IGNORE INTO pending_messages (mailbox, id) VALUES (?, ?)",
+            [(mailbox, message_id) for message_id in pending_ids]
+        )
+
+    @staticmethod
+    def _addresses(email: EmailBase) -> List[str]:
+        headers = [value for value in (email.to, email.cc) if value]
+        return list(dict.fromkeys(
+            address.strip().lower() for _, address in getaddresses(headers) if "@" in address
+        ))
+
+    def _row_to_email(self, row) -> EmailBase:
+        message_id, thread_id, date, subject, to, cc, from_, labels, matter_id, body = row
+        return EmailBase(
+            id=message_id,
+            thread_id=thread_id,
+            date=datetime.fromtimestamp(date / 1000, tz=timezone.utc) if date is not None else None,
+            subject=subject,
+            to=to,
+            cc=cc,
+            from_=from_,
+            labels=json.loads(labels),
+            matter_id=matter_id,
+            body=body
+        )
+
+
+email_store = EmailStore(settings.email_store_path)
@@ -0,0 +1,336 @@
+import os
+import socket
+import asyncio
+import uuid
+import logging
+from collections import OrderedDict
+from contextlib import aclosing
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from ..config import settings
+from ..models.schemas import EmailBase, EmailSummary, JobStage, JobStatus
+from ..utils.thread_iter import iterate_in_thread
+from .clio_service import clio_service
+from .credential_store import DEFAULT_USER_ID
+from .email_service import email_service
+from .job_store import job_store
+from .matter_resolver import matter_resolver
+from .push_ledger import push_ledger
+from .summarizer_service import summarizer_service
+from .thread_aggregator import thread_aggregator
+
+logger = logging.getLogger(__name__)
+
+# Per-item errors kept on a job; the rest are only logged
+MAX_JOB_ERRORS = 50
+
+
+class JobService:
+    """Job queue drained by a pool of asyncio workers.
+
+    With job_backend=memory the queue and job state live in this process. With
+    job_backend=sqlite they live in the shared job store, so jobs submitted by
+    the web process can be run by any `python -m backend.worker` process.
+    """
+
+    def __init__(self):
+        self.jobs: Dict[str, JobStatus] = OrderedDict()
+        self.store = job_store if settings.job_backend == "sqlite" else None
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._runners: Dict[str, Callable[..., Awaitable[None]]] = {"push": self._run_push_pipeline}
+
+    def start(self):
+        if self.store is not None:
+            # The web process may leave all jobs to separate worker processes
+            self._workers = [
+                asyncio.create_task(self._store_worker(), name=f"job-worker-{i}")
+                for i in range(max(0, settings.job_workers))
+            ]
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{i}")
+            for i in range(max(1, settings.job_workers))
+        ]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def get(self, job_id: str) -> Optional[JobStatus]:
+        if self.store is not None:
+            return self.store.get(job_id)
+        return self.jobs.get(job_id)
+
+    def submit_push(self, max_results: int = 10, repush_changed: bool = False,
+                    user_id: str = DEFAULT_USER_ID) -> JobStatus:
+        """Queue a fetch -> summarize -> push run for one user"""
+        job = self._create_job("push", ["fetch", "summarize", "push"], user_id)
+        self._enqueue(job, max_results=max_results, repush_changed=repush_changed)
+        return job
+
+    def _create_job(self, kind: str, stages: List[str], user_id: str) -> JobStatus:
+        now = datetime.now(timezone.utc)
+        job = JobStatus(
+            job_id=uuid.uuid4().hex,
+            kind=kind,
+            user_id=user_id,
+            status="queued",
+            stages={stage: JobStage() for stage in stages},
+            created_at=now,
+            updated_at=now
+        )
+        if self.store is None:
+            self.jobs[job.job_id] = job
+            while len(self.jobs) > settings.job_history_size:
+                self.jobs.popitem(last=False)
+        return job
+
+    def _enqueue(self, job: JobStatus, **params: Any):
+        if self.store is not None:
+            self.store.add(job, params)
+            self.store.prune(settings.job_history_size)
+            return
+        if self._queue is None:
+            raise RuntimeError("Job workers are not running")
+        self._queue.put_nowait((job, params))
+
+    async def _worker(self):
+        while True:
+            job, params = await self._queue.get()
+            job.status = "running"
+            try:
+                await self._run(job, params)
+            finally:
+                self._queue.task_done()
+
+    async def _store_worker(self):
+        """Claim queued jobs from the shared store, idling between polls when there are none"""
+        while True:
+            # Claimed on the loop thread: a claim finishing in a thread after cancellation would strand the job
+            claimed = self.store.claim(self.worker_id)
+            if claimed is None:
+                await asyncio.sleep(settings.job_poll_interval_seconds)
+                continue
+            job, params = claimed
+            logger.info(f"Worker {self.worker_id} claimed job {job.job_id}")
+            await self._run(job, params)
+
+    async def _run(self, job: JobStatus, params: Dict[str, Any]):
+        self._touch(job)
+        try:
+            await self._runners[job.kind](job, **params)
+            job.status = "completed"
+        except asyncio.CancelledError:
+            if self.store is not None:
+                # Shutting down mid-job: hand it back so another worker picks it up
+                job.status = "queued"
+            raise
+        except Exception as e:
+            errors = e.exceptions if isinstance(e, BaseExceptionGroup) else [e]
+            for error in errors:
+                self._add_error(job, str(error))
+            logger.error(f"Job {job.job_id} failed: {'; '.join(str(error) for error in errors)}")
+            job.status = "failed"
+        finally:
+            self._touch(job)
+
+    async def _run_push_pipeline(self, job: JobStatus, max_results: int, repush_changed: bool):
+        """Fetch, summarize and push as overlapping stages joined by bounded queues.
+
+        Summarization starts on the first Gmail page while later pages are still
+        downloading, and pushes start as soon as the first summaries are ready.
+        """
+        token = await clio_service.get_valid_token(job.user_id)
+        if not token:
+            raise Exception("User not authenticated with Clio")
+
+        try:
+            await matter_resolver.refresh(token, job.user_id)
+        except Exception as e:
+            # A stale matter index still resolves most emails; don't fail the push over it
+            logger.warning(f"Matter index refresh failed: {str(e)}")
+
+        summarizers = max(1, settings.job_summarize_workers)
+        pages: asyncio.Queue = asyncio.Queue(maxsize=settings.job_stage_queue_size)
+        pushes: asyncio.Queue = asyncio.Queue(maxsize=settings.job_stage_queue_size)
+
+        async def fetch():
+            # One worker thread runs the whole Gmail page loop, so its client stays on that thread
+            iterator = iterate_in_thread(email_service.iter_sent_emails(max_results, user_id=job.user_id))
+            try:
+                async with aclosing(iterator):
+                    async for page in iterator:
+                        job.stages["fetch"].processed += len(page)
+                        self._touch(job)
+                        await pages.put(page)
+            finally:
+                for _ in range(summarizers):
+                    await pages.put(None)
+
+        async def summarize():
+            while (page := await pages.get()) is not None:
+                batch = await self._summarize_page(job, page, repush_changed)
+                if batch:
+                    await pushes.put(batch)
+
+        async def summarize_all():
+            try:
+                await asyncio.gather(*(summarize() for _ in range(summarizers)))
+            finally:
+                await pushes.put(None)
+
+        async def push():
+            while (batch := await pushes.get()) is not None:
+                await self._push_batch(job, batch, token)
+
+        async with asyncio.TaskGroup() as group:
+            group.create_task(fetch())
+            group.create_task(summarize_all())
+            group.create_task(push())
+
+    async def _summarize_page(self, job: JobStatus, page: List[EmailBase], repush_changed: bool) -> list:
+        """Drop already-billed emails and summarize the rest into (emails, summary, entry_key) entries.
+
+        With aggregate_threads on, the emails of one thread, matter and day
+        become a single entry: new emails are grouped with that thread's
+        already-billed ones (from this page or the synced mailbox). Otherwise
+        every email is its own entry. Which Clio activity an entry updates is
+        decided at push time, see _push_batch.
+        """
+        stage = job.stages["summarize"]
+        pushed = push_ledger.lookup(email.id for email in page if email.id)
+        candidates = page if repush_changed else [email for email in page if email.id not in pushed]
+        stage.skipped += len(page) - len(candidates)
+        if not candidates:
+            return []
+
+        candidate_ids = {id(email) for email in candidates}
+        if settings.aggregate_threads:
+            members = await asyncio.to_thread(self._thread_members, page, candidates, job.user_id)
+            email_groups = [
+                group for group in thread_aggregator.group(members, job.user_id)
+                if any(id(email) in candidate_ids for email in group.emails)
+            ]
+            summaries = await thread_aggregator.summarize(email_groups)
+            groups = [group.emails for group in email_groups]
+            entry_keys = [push_ledger.entry_key(group.thread_id, group.matter_id, group.day) for group in email_groups]
+        else:
+            groups = [[email] for email in candidates]
+            summaries = await summarizer_service.summarize_emails([email.body for email in candidates])
+            summaries = [
+                summary if isinstance(summary, Exception)
+                else summary.model_copy(update={"date": thread_aggregator.local_day(email)})
+                for email, summary in zip(candidates, matter_resolver.apply(candidates, summaries, job.user_id))
+            ]
+            entry_keys = [None] * len(groups)
+        email_service.record_matters(
+            [email for emails in groups for email in emails],
+            [summary for emails, summary in zip(groups, summaries) for _ in emails],
+            job.user_id
+        )
+
+        batch = []
+        for emails, summary, entry_key in zip(groups, summaries, entry_keys):
+            new_emails = sum(1 for email in emails if id(email) in candidate_ids)
+            if isinstance(summary, Exception):
+                stage.failed += new_emails
+                self._add_error(job, f"Error summarizing email {emails[0].id}: {str(summary)}")
+                continue
+            stage.processed += new_emails
+            batch.append((emails, summary, entry_key))
+
+        self._touch(job)
+        return batch
+
+    def _thread_members(self, page: List[EmailBase], candidates: List[EmailBase], user_id: str) -> List[EmailBase]:
+        """The candidates plus the other emails of their threads, from this page and the synced mailbox"""
+        thread_ids = {email.thread_id for email in candidates if email.thread_id}
+        members = list(candidates)
+        seen = {email.id for email in candidates if email.id}
+        others = [email for email in page if email.thread_id in thread_ids]
+        others += email_service.thread_emails(list(thread_ids), user_id)
+        for email in others:
+            if email.id and email.id not in seen:
+                seen.add(email.id)
+                members.append(email)
+        return members
+
+    def _merge_entry(self, existing: EmailSummary, summary: EmailSummary) -> Optional[EmailSummary]:
+        """Add a summary's time onto an existing time entry; expenses stay separate entries"""
+        if existing.type != "TimeEntry" or summary.type != "TimeEntry":
+            return None
+        duration = round((existing.duration or 0) + (summary.duration or 0), 2)
+        return existing.model_copy(update={"summary": f"{existing.summary} {summary.summary}", "duration": duration})
+
+    def _resolve_batch(self, job: JobStatus, batch: list) -> list:
+        """Pair each entry with the Clio activity it updates, from the ledger as it stands now.
+
+        Runs in the single push stage just before the push, after earlier batches
+        have been recorded, so a thread spanning several pages gets one create
+        followed by updates even though its pages were summarized concurrently.
+        """
+        pushed = push_ledger.lookup(email.id for emails, _, _ in batch for email in emails if email.id)
+        entries = push_ledger.lookup_entries(entry_key for _, _, entry_key in batch if entry_key)
+
+        resolved = []
+        for emails, summary, entry_key in batch:
+            previous = next((pushed[email.id] for email in emails if email.id in pushed), None)
+            if previous and previous[0] == push_ledger.summary_hash(summary):
+                job.stages["push"].skipped += 1
+                continue
+            activity_id = previous[1] if previous else None
+            if activity_id is None and entry_key in entries:
+                # The thread already has an entry for this matter and day, but its billed emails aren't
+                # available to regroup, so the new emails are added onto that entry
+                merged = self._merge_entry(entries[entry_key][1], summary)
+                if merged is not None:
+                    activity_id, summary = entries[entry_key][0], merged
+            resolved.append((emails, summary, activity_id, entry_key))
+        return resolved
+
+    async def _push_batch(self, job: JobStatus, batch: list, token):
+        stage = job.stages["push"]
+        batch = self._resolve_batch(job, batch)
+        if not batch:
+            self._touch(job)
+            return
+        results = await clio_service.push_activities(
+            [summary for _, summary, _, _ in batch],
+            token,
+            activity_ids=[activity_id for _, _, activity_id, _ in batch]
+        )
+
+        ledger_entries = []
+        thread_entries = []
+        for (emails, summary, _, entry_key), (response, error) in zip(batch, results):
+            if error:
+                stage.failed += 1
+                self._add_error(job, error)
+                continue
+            stage.processed += 1
+            job.activities_created += 1
+            activity_id = clio_service.activity_id(response)
+            ledger_entries.extend((email.id, summary, activity_id) for email in emails if email.id)
+            if entry_key and activity_id:
+                thread_entries.append((entry_key, summary, activity_id))
+
+        push_ledger.record(ledger_entries)
+        push_ledger.record_entries(thread_entries)
+        self._touch(job)
+
+    def _add_error(self, job: JobStatus, error: str):
+        if len(job.errors) < MAX_JOB_ERRORS:
+            job.errors.append(error)
+
+    def _touch(self, job: JobStatus):
+        job.updated_at = datetime.now(timezone.utc)
+        if self.store is not None:
+            self.store.save(job)
+
+
+job_service = JobService()
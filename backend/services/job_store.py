@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from typing import Any, Dict, Optional, Tuple
+from ..config import settings
+from ..models.schemas import JobStatus
+
+logger = logging.getLogger(__name__)
+
+# Recorded on jobs whose worker stopped updating them
+LOST_WORKER_ERROR = "Job abandoned: its worker stopped responding"
+
+
+class JobStore:
+    """Queue and state of background jobs in a SQLite WAL file shared by every worker process.
+
+    Each row holds the job's JobStatus as JSON next to indexed status and
+    timestamp columns. Workers claim the oldest queued job inside a
+    BEGIN IMMEDIATE transaction, so two processes never claim the same job.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Autocommit mode so claim() can issue its own BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    user_id TEXT,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    worker TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+            """)
+            self._conn = conn
+        return self._conn
+
+    def add(self, job: JobStatus, params: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            self._connect().execute(
+                "INSERT INTO jobs (job_id, kind, user_id, status, params, state, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.job_id, job.kind, job.user_id, job.status, json.dumps(params), job.model_dump_json(), now, now)
+            )
+
+    def claim(self, worker: str) -> Optional[Tuple[JobStatus, Dict[str, Any]]]:
+        """Mark the oldest queued job as running on this worker and return it with its parameters"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._fail_stale(conn)
+                row = conn.execute(
+                    "SELECT job_id, params, state FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                job = JobStatus.model_validate_json(row[2])
+                job.status = "running"
+                conn.execute(
+                    "UPDATE jobs SET status = ?, state = ?, worker = ?, updated_at = ? WHERE job_id = ?",
+                    (job.status, job.model_dump_json(), worker, time.time(), job.job_id)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return job, json.loads(row[1])
+
+    def save(self, job: JobStatus):
+        with self._lock:
+            self._connect().execute(
+                "UPDATE jobs SET status = ?, state = ?, updated_at = ? WHERE job_id = ?",
+                (job.status, job.model_dump_json(), time.time(), job.job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[JobStatus]:
+        with self._lock:
+            row = self._connect().execute("SELECT state FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return JobStatus.model_validate_json(row[0]) if row else None
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs in each status"""
+        with self._lock:
+            return dict(self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def prune(self, keep: int):
+        """Delete the oldest finished jobs beyond the newest `keep`"""
+        with self._lock:
+            self._connect().execute(
+                "DELETE FROM jobs WHERE status IN ('completed', 'failed') AND job_id NOT IN "
+                "(SELECT job_id FROM jobs WHERE status IN ('completed', 'failed') ORDER BY created_at DESC LIMIT ?)",
+                (keep,)
+            )
+
+    def _fail_stale(self, conn: sqlite3.Connection):
+        cutoff = time.time() - settings.job_stale_seconds
+        for job_id, state in conn.execute(
+            "SELECT job_id, state FROM jobs WHERE status = 'running' AND updated_at < ?", (cutoff,)
+        ).fetchall():
+            job = JobStatus.model_validate_json(state)
+            job.status = "failed"
+            job.errors.append(LOST_WORKER_ERROR)
+            conn.execute(
+                "UPDATE jobs SET status = ?, state = ?, updated_at = ? WHERE job_id = ?",
+                (job.status, job.model_dump_json(), time.time(), job_id)
+            )
+            logger.warning(f"Job {job_id} failed: {LOST_WORKER_ERROR}")
+
+
+job_store = JobStore(settings.job_store_path)
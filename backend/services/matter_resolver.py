@@ -0,0 +1,290 @@
+import os
+import re
+import time
+import sqlite3
+import asyncio
+import threading
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from email.utils import getaddresses
+from typing import Dict, List, Optional, Set, Tuple, Union
+from ..config import settings
+from ..models.schemas import EmailBase, EmailSummary, TokenData
+from .clio_service import clio_service
+
+logger = logging.getLogger(__name__)
+
+_SUBJECT_TOKEN = re.compile(r"[\w][\w\-./]*[\w]|\w")
+_WORD = re.compile(r"\w+")
+
+CONTACT_FIELDS = "id,name,email_addresses{address},updated_at"
+MATTER_FIELDS = "id,display_number,description,status,client{id,name},updated_at"
+# Closed matters stay in the table but are never resolved to
+ACTIVE_STATUSES = {"open", "pending"}
+# Bump when the tables below change; older indexes are dropped and resynced from Clio
+SCHEMA_VERSION = 2
+
+
+def _name_key(name: str) -> Tuple[str, ...]:
+    return tuple(_WORD.findall(name.casefold()))
+
+
+class MatterIndex:
+    """In-memory lookup tables built from the synced matters and contacts"""
+
+    def __init__(self):
+        self.by_number: Dict[str, int] = {}
+        self.by_address: Dict[str, Set[int]] = defaultdict(set)
+        self.by_domain: Dict[str, Set[int]] = defaultdict(set)
+        self.by_name: Dict[Tuple[str, ...], Set[int]] = defaultdict(set)
+        self.longest_name = 0
+        self.matters = 0
+
+
+class MatterResolver:
+    """Resolves an email's Clio matter from its recipients and subject.
+
+    Each user's Clio matters and contacts are synced incrementally
+    (updated_since) into SQLite and loaded into that user's dictionaries, so
+    resolution never calls Clio or the LLM. Signals are tried from most to least specific: a matter number
+    in the subject, an exact client email address, the client's domain and
+    the client's name in the subject. An ambiguous signal is narrowed by the
+    ones after it; an email that stays ambiguous is left unresolved.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._sync_locks: Dict[str, asyncio.Lock] = {}
+        self._sync_loop = None
+        self._indexes: Dict[str, MatterIndex] = {}
+        self._last_sync: Dict[str, float] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                # The index is a cache of Clio, so an old layout is dropped and resynced
+                conn.executescript("""
+                    DROP TABLE IF EXISTS matters;
+                    DROP TABLE IF EXISTS contacts;
+                    DROP TABLE IF EXISTS contact_emails;
+                    DROP TABLE IF EXISTS sync_state;
+                """)
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS matters (
+                    user_id TEXT NOT NULL,
+                    id INTEGER NOT NULL,
+                    display_number TEXT,
+                    description TEXT,
+                    status TEXT,
+                    client_id INTEGER,
+                    client_name TEXT,
+                    updated_at TEXT,
+                    PRIMARY KEY (user_id, id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_matters_client ON matters (user_id, client_id);
+                CREATE TABLE IF NOT EXISTS contacts (
+                    user_id TEXT NOT NULL,
+                    id INTEGER NOT NULL,
+                    name TEXT,
+                    updated_at TEXT,
+                    PRIMARY KEY (user_id, id)
+                );
+                CREATE TABLE IF NOT EXISTS contact_emails (
+                    user_id TEXT NOT NULL,
+                    contact_id INTEGER NOT NULL,
+                    address TEXT NOT NULL,
+                    PRIMARY KEY (user_id, contact_id, address)
+                );
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    user_id TEXT NOT NULL,
+                    resource TEXT NOT NULL,
+                    synced_at TEXT NOT NULL,
+                    PRIMARY KEY (user_id, resource)
+                );
+            """)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._conn = conn
+        return self._conn
+
+    async def refresh(self, token: TokenData, user_id: str, force: bool = False) -> bool:
+        """Pull the user's matters and contacts changed since their last sync; returns False if still fresh"""
+        loop = asyncio.get_running_loop()
+        if self._sync_loop is not loop:
+            self._sync_locks = {}
+            self._sync_loop = loop
+        sync_lock = self._sync_locks.setdefault(user_id, asyncio.Lock())
+
+        async with sync_lock:
+            last_sync = self._last_sync.get(user_id)
+            age = None if last_sync is None else time.monotonic() - last_sync
+            if not force and age is not None and age < settings.matter_sync_interval_seconds:
+                return False
+
+            for resource, fields in (("contacts", CONTACT_FIELDS), ("matters", MATTER_FIELDS)):
+                # Take the timestamp before listing so records edited mid-sync are fetched next time
+                started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+                params = {"fields": fields, "limit": 200}
+                since = await asyncio.to_thread(self._synced_at, user_id, resource)
+                if since:
+                    params["updated_since"] = since
+                records = await clio_service.list_records(token, resource, params)
+                await asyncio.to_thread(self._store, user_id, resource, records, started_at)
+                logger.info(f"Synced {len(records)} changed Clio {resource} for user {user_id}")
+
+            self._last_sync[user_id] = time.monotonic()
+            await asyncio.to_thread(self._rebuild_index, user_id)
+            return True
+
+    def resolve(self, email: EmailBase, user_id: str) -> Optional[int]:
+        index = self._get_index(user_id)
+        narrowed = None
+        for candidates in self._signals(index, email):
+            if not candidates:
+                continue
+            combined = candidates if narrowed is None else (narrowed & candidates) or narrowed
+            if len(combined) == 1:
+                return next(iter(combined))
+            narrowed = combined
+        return None
+
+    def apply(self, emails: List[EmailBase], summaries: List[Union[EmailSummary, Exception]],
+              user_id: str) -> List[Union[EmailSummary, Exception]]:
+        """Return the summaries with matter_id replaced wherever the email resolves to one of the user's matters"""
+        resolved = []
+        for email, summary in zip(emails, summaries):
+            matter_id = None if isinstance(summary, Exception) else self.resolve(email, user_id)
+            if matter_id is not None and matter_id != summary.matter_id:
+                # Copy rather than mutate: the summary object may be shared with the cache
+                summary = summary.model_copy(update={"matter_id": matter_id})
+            resolved.append(summary)
+        return resolved
+
+    def stats(self, user_id: str) -> Dict[str, int]:
+        index = self._get_index(user_id)
+        return {
+            "active_matters": index.matters,
+            "matter_numbers": len(index.by_number),
+            "addresses": len(index.by_address),
+            "domains": len(index.by_domain),
+            "names": len(index.by_name),
+        }
+
+    def _signals(self, index: MatterIndex, email: EmailBase):
+        subject = (email.subject or "").casefold()
+        yield {index.by_number[token] for token in _SUBJECT_TOKEN.findall(subject) if token in index.by_number}
+
+        addresses = [
+            address.strip().lower()
+            for _, address in getaddresses([value for value in (email.to, email.cc) if value])
+            if "@" in address
+        ]
+        yield set().union(*(index.by_address.get(address, ()) for address in addresses))
+        yield set().union(*(index.by_domain.get(address.rpartition("@")[2], ()) for address in addresses))
+
+        # Every word n-gram of the subject up to the longest client name is one dict lookup
+        words = _WORD.findall(subject)
+        found = set()
+        for start in range(len(words)):
+            for end in range(start + 1, min(len(words), start + index.longest_name) + 1):
+                found |= index.by_name.get(tuple(words[start:end]), set())
+        yield found
+
+    def _get_index(self, user_id: str) -> MatterIndex:
+        index = self._indexes.get(user_id)
+        if index is None:
+            index = self._rebuild_index(user_id)
+        return index
+
+    def _rebuild_index(self, user_id: str) -> MatterIndex:
+        index = MatterIndex()
+        public_domains = {domain.lower() for domain in settings.matter_public_domains}
+        with self._lock:
+            conn = self._connect()
+            matters = conn.execute(
+                "SELECT id, display_number, status, client_id, client_name FROM matters WHERE user_id = ?", (user_id,)
+            ).fetchall()
+            addresses = defaultdict(list)
+            for contact_id, address in conn.execute(
+                "SELECT contact_id, address FROM contact_emails WHERE user_id = ?", (user_id,)
+            ):
+                addresses[contact_id].append(address)
+
+        for matter_id, display_number, status, client_id, client_name in matters:
+            if (status or "").lower() not in ACTIVE_STATUSES:
+                continue
+            index.matters += 1
+            if display_number:
+                index.by_number[display_number.casefold()] = matter_id
+            for address in addresses.get(client_id, []):
+                index.by_address[address].add(matter_id)
+                domain = address.rpartition("@")[2]
+                if domain not in public_domains:
+                    index.by_domain[domain].add(matter_id)
+            name = _name_key(client_name or "")
+            if name:
+                index.by_name[name].add(matter_id)
+                index.longest_name = max(index.longest_name, len(name))
+
+        # Swap in one assignment so concurrent resolves see either index, never a partial one
+        self._indexes[user_id] = index
+        return index
+
+    def _synced_at(self, user_id: str, resource: str) -> Optional[str]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT synced_at FROM sync_state WHERE user_id = ? AND resource = ?", (user_id, resource)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _store(self, user_id: str, resource: str, records: List[dict], synced_at: str):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                if resource == "contacts":
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO contacts (user_id, id, name, updated_at) VALUES (?, ?, ?, ?)",
+                        [(user_id, record["id"], record.get("name"), record.get("updated_at")) for record in records]
+                    )
+                    conn.executemany(
+                        "DELETE FROM contact_emails WHERE user_id = ? AND contact_id = ?",
+                        [(user_id, record["id"]) for record in records]
+                    )
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO contact_emails (user_id, contact_id, address) VALUES (?, ?, ?)",
+                        [
+                            (user_id, record["id"], email["address"].strip().lower())
+                            for record in records
+                            for email in record.get("email_addresses") or []
+                            if email.get("address")
+                        ]
+                    )
+                else:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO matters "
+                        "(user_id, id, display_number, description, status, client_id, client_name, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [
+                            (
+                                user_id, record["id"], record.get("display_number"), record.get("description"),
+                                record.get("status"), (record.get("client") or {}).get("id"),
+                                (record.get("client") or {}).get("name"), record.get("updated_at")
+                            )
+                            for record in records
+                        ]
+                    )
+                conn.execute(
+                    "INSERT OR REPLACE INTO sync_state (user_id, resource, synced_at) VALUES (?, ?, ?)",
+                    (user_id, resource, synced_at)
+                )
+
+
+matter_resolver = MatterResolver(settings.matter_index_path)
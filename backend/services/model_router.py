@@ -0,0 +1,156 @@
+import re
+import threading
+from collections import Counter, deque
+from typing import Any, Dict, NamedTuple, Optional
+from ..config import settings
+from ..utils.body_reducer import estimate_tokens
+from ..utils.metrics import MODEL_ROUTES, TOGETHER_COST
+from .email_classifier import AMOUNT, EXPENSE_KEYWORD, RECEIPT
+
+# Latency samples kept per tier for the percentiles in stats()
+LATENCY_WINDOW = 1000
+# An explicit mention of time worked: "2.5 hours", "45 mins", "billable time", "time spent"
+TIME_WORKED = re.compile(
+    r"\b\d+(?:\.\d+)?\s*(?:hours?|hrs?|minutes?|mins?)\b|\b(?:billable (?:time|hours)|time spent|bill (?:for )?(?:my|our) time)\b",
+    re.IGNORECASE,
+)
+
+
+class Route(NamedTuple):
+    tier: str
+    model: str
+    max_tokens: int
+    reason: str
+
+
+class ModelRouter:
+    """Chooses the model and output budget for each Together prompt.
+
+    Short, clear-cut emails go to the small model (together_model) with a
+    max_tokens budget sized to the email; long emails and ones that could be
+    either time or an expense go to together_large_model. Output from the
+    small model that doesn't parse is retried once on the large one. Request
+    latency, tokens and cost are recorded per tier.
+    """
+
+    def __init__(self):
+        self._routes = Counter()
+        self._latencies: Dict[str, deque] = {}
+        self._usage: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+
+    def route(self, email_body: str) -> Route:
+        """Pick the tier for one email's prompt"""
+        return self._record(self._choose(email_body))
+
+    def model_for(self, email_body: str) -> str:
+        """The model route() picks for the email, without counting a route (for cache keys)"""
+        return self._choose(email_body).model
+
+    def batchable(self, email_body: str) -> bool:
+        """Whether the email may share a batched prompt, which always goes to the small model"""
+        return self._choose(email_body).tier != "large"
+
+    def route_batch(self, count: int) -> Route:
+        """Batched prompts only hold emails batchable() lets through, so they always use the small model"""
+        max_tokens = settings.together_batch_output_tokens_per_email * count
+        if not settings.together_routing:
+            return self._record(Route("default", settings.together_model, max_tokens, "disabled"))
+        return self._record(Route("small", settings.together_model, max_tokens, "batch"))
+
+    def escalate(self, route: Route) -> Optional[Route]:
+        """The large-model route, with its full output budget, to retry on after unusable small-model output"""
+        if route.tier != "small":
+            return None
+        return self._record(Route("large", settings.together_large_model,
+                                  settings.together_large_max_output_tokens, "escalated"))
+
+    def record_response(self, route: Route, seconds: float, response_json: Dict[str, Any]):
+        """Add one completed request's latency, tokens and cost to its tier"""
+        usage = response_json.get("usage") or {}
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        cost = (prompt_tokens + completion_tokens) * self._price(route.model) / 1_000_000
+        TOGETHER_COST.inc(cost, tier=route.tier)
+        with self._lock:
+            self._latencies.setdefault(route.tier, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+            totals = self._usage.setdefault(route.tier, Counter())
+            totals["requests"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["cost_usd"] += cost
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            routes = dict(self._routes)
+            latencies = {tier: sorted(samples) for tier, samples in self._latencies.items()}
+            usage = {tier: dict(totals) for tier, totals in self._usage.items()}
+
+        tiers = {}
+        for tier, totals in usage.items():
+            samples = latencies.get(tier, [])
+            tiers[tier] = {
+                **totals,
+                "cost_usd": round(totals.get("cost_usd", 0.0), 6),
+                "latency_p50_ms": self._percentile(samples, 50),
+                "latency_p95_ms": self._percentile(samples, 95),
+            }
+        return {
+            "enabled": settings.together_routing,
+            "models": {"small": settings.together_model, "large": settings.together_large_model},
+            "routes": {f"{tier}:{reason}": count for (tier, reason), count in sorted(routes.items())},
+            "tiers": tiers,
+        }
+
+    def _choose(self, email_body: str) -> Route:
+        if not settings.together_routing:
+            return Route("default", settings.together_model, 500, "disabled")
+
+        tokens = estimate_tokens(email_body)
+        if tokens > settings.together_small_max_input_tokens:
+            return self._large(tokens, "long")
+        if self._ambiguous(email_body):
+            return self._large(tokens, "ambiguous")
+        return self._small(tokens, "short")
+
+    def _small(self, tokens: int, reason: str) -> Route:
+        return Route("small", settings.together_model,
+                     self._max_tokens(tokens, settings.together_small_max_output_tokens), reason)
+
+    def _large(self, tokens: int, reason: str) -> Route:
+        return Route("large", settings.together_large_model,
+                     self._max_tokens(tokens, settings.together_large_max_output_tokens), reason)
+
+    def _max_tokens(self, tokens: int, cap: int) -> int:
+        """A summary grows a little with the email: a base budget plus a share of the input, capped per tier"""
+        budget = settings.together_output_tokens_base + tokens * settings.together_output_tokens_per_input_token
+        return min(cap, int(budget))
+
+    def _ambiguous(self, email_body: str) -> bool:
+        """Conflicting amounts, or expense wording next to explicit time worked: time vs expense is a judgement call"""
+        amounts = {amount.replace(",", "") for amount in AMOUNT.findall(email_body)}
+        if len(amounts) > 1:
+            return True
+        expense = EXPENSE_KEYWORD.search(email_body) or RECEIPT.search(email_body)
+        return bool(expense and TIME_WORKED.search(email_body))
+
+    def _price(self, model: str) -> float:
+        if model == settings.together_large_model:
+            return settings.together_large_price_per_million
+        return settings.together_small_price_per_million
+
+    def _record(self, route: Route) -> Route:
+        MODEL_ROUTES.inc(tier=route.tier, reason=route.reason)
+        with self._lock:
+            self._routes[(route.tier, route.reason)] += 1
+        return route
+
+    @staticmethod
+    def _percentile(sorted_samples: list, pct: float) -> float:
+        if not sorted_samples:
+            return 0.0
+        index = max(0, -(-len(sorted_samples) * pct // 100) - 1)
+        return round(sorted_samples[int(index)] * 1000, 2)
+
+
+model_router = ModelRouter()
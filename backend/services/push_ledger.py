@@ -0,0 +1,119 @@
+import os
+import hashlib
+import sqlite3
+import threading
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from ..config import settings
+from ..models.schemas import EmailSummary
+
+# Stay under SQLite's default limit on bound parameters per statement
+LOOKUP_CHUNK_SIZE = 500
+
+
+class PushLedger:
+    """Records which Gmail message produced which Clio activity, and which activity
+    holds each thread's entry for a matter and day"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pushes (
+                    message_id TEXT PRIMARY KEY,
+                    summary_hash TEXT NOT NULL,
+                    activity_id TEXT,
+                    activity_type TEXT,
+                    pushed_at TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    entry_key TEXT PRIMARY KEY,
+                    activity_id TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    pushed_at TEXT NOT NULL
+                )
+            """)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def summary_hash(summary: EmailSummary) -> str:
+        # Undated summaries hash as they did before EmailSummary had a date
+        exclude = {"date"} if summary.date is None else None
+        return hashlib.sha256(summary.model_dump_json(exclude=exclude).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def entry_key(thread_id: str, matter_id: Optional[int], day: Optional[date]) -> str:
+        return f"{thread_id}|{matter_id}|{day.isoformat() if day else ''}"
+
+    def lookup(self, message_ids: Iterable[str]) -> Dict[str, Tuple[str, Optional[str]]]:
+        """Map already-pushed message ids to (summary_hash, activity_id) via the primary key index"""
+        message_ids = list(dict.fromkeys(message_ids))
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(message_ids), LOOKUP_CHUNK_SIZE):
+                chunk = message_ids[start:start + LOOKUP_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                for message_id, summary_hash, activity_id in conn.execute(
+                    f"SELECT message_id, summary_hash, activity_id FROM pushes WHERE message_id IN ({placeholders})",
+                    chunk
+                ):
+                    found[message_id] = (summary_hash, activity_id)
+        return found
+
+    def lookup_entries(self, entry_keys: Iterable[str]) -> Dict[str, Tuple[str, EmailSummary]]:
+        """Map entry keys of already-pushed thread entries to (activity_id, summary)"""
+        entry_keys = list(dict.fromkeys(entry_keys))
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(entry_keys), LOOKUP_CHUNK_SIZE):
+                chunk = entry_keys[start:start + LOOKUP_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                for entry_key, activity_id, summary in conn.execute(
+                    f"SELECT entry_key, activity_id, summary FROM entries WHERE entry_key IN ({placeholders})",
+                    chunk
+                ):
+                    found[entry_key] = (activity_id, EmailSummary.model_validate_json(summary))
+        return found
+
+    def record_entries(self, entries: List[Tuple[str, EmailSummary, str]]):
+        """Store (entry_key, summary, activity_id) for pushed thread entries"""
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO entries (entry_key, activity_id, summary, pushed_at) VALUES (?, ?, ?, ?)",
+                    [(entry_key, activity_id, summary.model_dump_json(), now) for entry_key, summary, activity_id in entries]
+                )
+
+    def record(self, entries: List[Tuple[str, EmailSummary, Optional[str]]]):
+        """Store (message_id, summary, activity_id) for successful pushes"""
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO pushes (message_id, summary_hash, activity_id, activity_type, pushed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (message_id, self.summary_hash(summary), activity_id, summary.type, now)
+                        for message_id, summary, activity_id in entries
+                    ]
+                )
+
+
+push_ledger = PushLedger(settings.push_ledger_path)
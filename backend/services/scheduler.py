@@ -0,0 +1,188 @@
+import time
+import zlib
+import random
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set
+from ..config import settings
+from ..utils.metrics import POLL_SECONDS
+from .clio_service import clio_service
+from .credential_store import credential_store
+from .email_service import email_service
+from .matter_resolver import matter_resolver
+from .summarizer_service import summarizer_service
+
+logger = logging.getLogger(__name__)
+
+# How often the list of connected mailboxes is re-read from the credential store
+USER_REFRESH_SECONDS = 60
+
+
+class PollScheduler:
+    """Polls every connected mailbox in the background and precomputes its summaries.
+
+    Each user has a fixed slot in the poll interval, derived from a hash of the
+    user id, plus random jitter, so polls are spread evenly over the interval
+    instead of all firing at once. A user is always handled by the same worker
+    task, and a credential store lock stops other processes from polling the
+    same mailbox at the same time.
+    """
+
+    def __init__(self):
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        self._planner: Optional[asyncio.Task] = None
+        self._next_run: Dict[str, float] = {}
+        self._pending: Set[str] = set()
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.summarized = 0
+
+    @property
+    def running(self) -> bool:
+        return self._planner is not None
+
+    def start(self):
+        workers = max(1, settings.scheduler_workers)
+        self._queues = [asyncio.Queue() for _ in range(workers)]
+        self._workers = [
+            asyncio.create_task(self._worker(queue), name=f"poll-worker-{i}")
+            for i, queue in enumerate(self._queues)
+        ]
+        self._planner = asyncio.create_task(self._plan(), name="poll-planner")
+        logger.info(f"Polling connected mailboxes every {settings.scheduler_interval_seconds:g}s on {workers} workers")
+
+    async def stop(self):
+        """Stop planning, drop queued polls and give running ones scheduler_drain_seconds to finish"""
+        if self._planner is None:
+            return
+        self._planner.cancel()
+        await asyncio.gather(self._planner, return_exceptions=True)
+        self._planner = None
+
+        for queue in self._queues:
+            while not queue.empty():
+                self._pending.discard(queue.get_nowait())
+            queue.put_nowait(None)
+
+        _, unfinished = await asyncio.wait(self._workers, timeout=settings.scheduler_drain_seconds)
+        for worker in unfinished:
+            worker.cancel()
+        if unfinished:
+            logger.warning(f"Cancelled {len(unfinished)} mailbox polls still running after the drain timeout")
+            await asyncio.gather(*unfinished, return_exceptions=True)
+        self._workers = []
+        self._next_run.clear()
+        self._pending.clear()
+
+    async def poll(self, user_id: str) -> int:
+        """Sync one mailbox and summarize its new emails; returns how many were summarized"""
+        owner = await asyncio.to_thread(
+            credential_store.acquire_lock, f"poll:{user_id}", settings.scheduler_lock_seconds
+        )
+        if owner is None:
+            # Another process is polling this mailbox right now
+            self.skipped += 1
+            return 0
+
+        start = time.perf_counter()
+        status = "error"
+        try:
+            summarized = await self._poll(user_id)
+            status = "ok"
+            self.summarized += summarized
+            return summarized
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.runs += 1
+            POLL_SECONDS.observe(time.perf_counter() - start, status=status)
+            await asyncio.to_thread(credential_store.release_lock, f"poll:{user_id}", owner)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "running": self.running,
+            "users": len(self._next_run),
+            "queued": len(self._pending),
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "summarized": self.summarized,
+        }
+
+    async def _poll(self, user_id: str) -> int:
+        depth = settings.scheduler_poll_depth
+        await asyncio.to_thread(email_service.sync_sent_emails, depth, user_id=user_id)
+        emails = await asyncio.to_thread(email_service.unsummarized_emails, depth, user_id)
+        if not emails:
+            return 0
+
+        token = await clio_service.get_valid_token(user_id)
+        if token:
+            try:
+                await matter_resolver.refresh(token, user_id)
+            except Exception as e:
+                logger.warning(f"Matter index refresh failed: {str(e)}")
+
+        summaries = await summarizer_service.summarize_emails([email.body for email in emails])
+        summaries = matter_resolver.apply(emails, summaries, user_id)
+        await asyncio.to_thread(email_service.save_summaries, emails, summaries, user_id)
+        email_service.record_matters(emails, summaries, user_id)
+
+        failed = sum(1 for summary in summaries if isinstance(summary, Exception))
+        if failed:
+            logger.warning(f"Poll for {user_id}: {failed} of {len(emails)} summaries failed, retrying next poll")
+        return len(emails) - failed
+
+    async def _plan(self):
+        """Queue each user on its worker whenever its slot comes round"""
+        refreshed_at = -USER_REFRESH_SECONDS
+        users: List[str] = []
+        while True:
+            now = time.time()
+            if now - refreshed_at >= USER_REFRESH_SECONDS:
+                try:
+                    users = await asyncio.to_thread(credential_store.users, "gmail")
+                    refreshed_at = now
+                except Exception as e:
+                    logger.error(f"Could not list connected mailboxes: {str(e)}")
+                for user_id in set(self._next_run) - set(users):
+                    del self._next_run[user_id]
+
+            for user_id in users:
+                due = self._next_run.setdefault(user_id, self._next_slot(user_id, now))
+                if due <= now and user_id not in self._pending:
+                    self._pending.add(user_id)
+                    self._queues[self._shard(user_id)].put_nowait(user_id)
+                    self._next_run[user_id] = self._next_slot(user_id, now)
+
+            next_due = min(self._next_run.values(), default=now + USER_REFRESH_SECONDS)
+            await asyncio.sleep(min(max(next_due - time.time(), 0.01), USER_REFRESH_SECONDS))
+
+    async def _worker(self, queue: asyncio.Queue):
+        while (user_id := await queue.get()) is not None:
+            try:
+                summarized = await self.poll(user_id)
+                logger.info(f"Polled mailbox for {user_id}: {summarized} new summaries")
+            except Exception as e:
+                logger.error(f"Polling mailbox for {user_id} failed: {str(e)}")
+            finally:
+                self._pending.discard(user_id)
+
+    def _next_slot(self, user_id: str, now: float) -> float:
+        """The user's next wall-clock slot after now, plus jitter"""
+        interval = settings.scheduler_interval_seconds
+        # crc32 rather than hash() so every process agrees on the slot
+        offset = zlib.crc32(user_id.encode("utf-8")) / 2 ** 32 * interval
+        slot = now - now % interval + offset
+        if slot <= now:
+            slot += interval
+        return slot + random.uniform(0, settings.scheduler_jitter_seconds)
+
+    def _shard(self, user_id: str) -> int:
+        return zlib.crc32(user_id.encode("utf-8")) % len(self._queues)
+
+
+poll_scheduler = PollScheduler()
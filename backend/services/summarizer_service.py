@@ -1,51 +1,108 @@
+import asyncio
+import httpx
 import requests
 import json
+import time
+import re
 import logging
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, AsyncIterator, List, Optional, Set, Tuple, Union
 from ..config import settings
 from ..models.schemas import EmailSummary
+from ..utils.body_reducer import estimate_tokens, reduce_body
+from ..utils.dedup import cluster
+from ..utils.llm_json import parse_json
+from ..utils.metrics import (
+    LLM_JSON_PARSES, SUMMARIZE_SECONDS, TOGETHER_REQUEST_SECONDS, TOGETHER_TRUNCATED, record_together_usage
+)
+from ..utils.rate_limiter import TokenBucket
+from .email_classifier import email_classifier
+from .model_router import Route, model_router
+from .summary_cache import summary_cache
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever _create_prompt changes so cached summaries from the old prompt are not reused
+PROMPT_VERSION = "3"
+
+# matter_id is resolved locally from recipients and subject (see matter_resolver), not asked of the model
+FIELD_INSTRUCTIONS = """- summary: a professional billing summary of the email.
+- type: either "TimeEntry" or "ExpenseEntry".
+  - Use "ExpenseEntry" if the email discusses client expenses (e.g. court fees, postage, etc.).
+  - Use "TimeEntry" if the email is about legal work, client communication, or tasks performed.
+- rate (only for TimeEntry): hourly rate or per-task rate if mentioned, default 200.
+- duration (only for TimeEntry): estimated time in hours (e.g. 0.5 for 30 minutes), default 1.0.
+- price (only for ExpenseEntry): the cost of the expense.
+- quantity (only for ExpenseEntry): number of items or units billed, default to 1.
+- expense_type (only for ExpenseEntry): choose either "Disbursement" or "Expense Recovery".
+"""
+
+# matter_id and date are filled in locally; a matter_id from the model is still accepted
+SUMMARY_FIELDS = set(EmailSummary.model_fields) - {"date"}
+# Phrases in a 400 body that mean the model can't do JSON mode
+JSON_MODE_ERRORS = ("response_format", "json_object", "json mode", "schema")
+NUMBER_FIELDS = ("duration", "rate", "price", "quantity", "matter_id")
+NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def _summary_schema() -> Dict[str, Any]:
+    """EmailSummary's JSON schema without the locally resolved matter_id and date, for Together's JSON mode"""
+    schema = EmailSummary.model_json_schema()
+    for field in ("matter_id", "date"):
+        schema["properties"].pop(field, None)
+    schema["required"] = [field for field in schema.get("required", []) if field not in ("matter_id", "date")]
+    return schema
+
+
+SUMMARY_SCHEMA = _summary_schema()
+
+
 class SummarizerService:
     def __init__(self):
         self.api_key = settings.together_api_key
         self.model = settings.together_model
         self.url = "https://api.together.xyz/v1/chat/completions"
+        self.timeout = settings.together_timeout
+        self.concurrency = max(1, settings.together_concurrency)
+        self.rate_limiter = TokenBucket(settings.together_requests_per_second, settings.together_burst)
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+        self._json_mode_rejected: Set[str] = set()
     
     def summarize_email(self, email_body: str) -> EmailSummary:
         if not self.api_key:
             raise ValueError("TOGETHER_API_KEY not configured")
+
+        email_body = self._reduce_body(email_body)
+        classified = self._classify(email_body)
+        if classified is not None:
+            return classified
+
+        cache_key = self._cache_key(email_body)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
         
         prompt = self._create_prompt(email_body)
+        output = ""
         
         try:
-            response = requests.post(
-                self.url,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": self.model,
-                    "messages": [
-                        {"role": "system", "content": "You are a helpful legal assistant."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    "max_tokens": 500,
-                    "temperature": 0.3
-                },
-                timeout=30
-            )
-            
-            response.raise_for_status()
-            output = response.json()["choices"][0]["message"]["content"].strip()
-            
-            # Clean and parse JSON response
-            output = self._clean_json_response(output)
-            summary_data = json.loads(output)
-            
-            return EmailSummary(**summary_data)
+            with SUMMARIZE_SECONDS.time(mode="sync"):
+                route = model_router.route(email_body)
+                try:
+                    output = self._complete(prompt, route, json_mode=True)
+                    summary = self._parse_summary(output)
+                except ValueError as e:
+                    # Unparseable, incomplete or cut off at max_tokens
+                    route = model_router.escalate(route)
+                    if route is None:
+                        raise
+                    logger.info(f"Unusable output from the small model ({str(e)}), retrying on {route.model}")
+                    output = self._complete(prompt, route, json_mode=True)
+                    summary = self._parse_summary(output)
+            self._set_cached(cache_key, summary)
+            return summary
             
         except requests.RequestException as e:
             logger.error(f"API request failed: {str(e)}")
@@ -56,46 +113,430 @@ class SummarizerService:
         except Exception as e:
             logger.error(f"Unexpected error: {str(e)}")
             raise
+
+    async def summarize_email_async(self, email_body: str) -> EmailSummary:
+        """Non-blocking summarize_email on the shared connection pool"""
+        email_body = self._reduce_body(email_body)
+        classified = self._classify(email_body)
+        if classified is not None:
+            return classified
+
+        cache_key = self._cache_key(email_body)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+
+        return await self._summarize_uncached_async(email_body, cache_key)
+
+    async def _summarize_uncached_async(self, email_body: str, cache_key: str) -> EmailSummary:
+        prompt = self._create_prompt(email_body)
+        output = ""
+
+        try:
+            with SUMMARIZE_SECONDS.time(mode="single"):
+                route = model_router.route(email_body)
+                try:
+                    output = await self._complete_async(prompt, route, json_mode=True)
+                    summary = self._parse_summary(output)
+                except ValueError as e:
+                    # Unparseable, incomplete or cut off at max_tokens
+                    route = model_router.escalate(route)
+                    if route is None:
+                        raise
+                    logger.info(f"Unusable output from the small model ({str(e)}), retrying on {route.model}")
+                    output = await self._complete_async(prompt, route, json_mode=True)
+                    summary = self._parse_summary(output)
+            self._set_cached(cache_key, summary)
+            return summary
+
+        except httpx.HTTPError as e:
+            logger.error(f"API request failed: {str(e)}")
+            raise Exception(f"Failed to summarize email: {str(e)}")
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid JSON response: {output}")
+            raise ValueError(f"Invalid response format: {str(e)}")
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            raise
+
+    async def summarize_emails(self, email_bodies: List[str]) -> List[Union[EmailSummary, Exception]]:
+        """Summarize many emails concurrently; failures are returned in place of their summary"""
+        results = [None] * len(email_bodies)
+        async for i, summary in self.iter_summaries(email_bodies):
+            results[i] = summary
+        return results
+
+    async def iter_summaries(self, email_bodies: List[str]) -> AsyncIterator[Tuple[int, Union[EmailSummary, Exception]]]:
+        """Yield (index, summary or exception) as each email finishes.
+
+        Emails the local classifier is confident about and cached emails are
+        answered first. With together_batch_prompts on, the remaining short
+        emails are packed several to a prompt. At most
+        `concurrency` prompts are in flight, so pending work stays bounded.
+        Near-duplicate emails (the same cover letter to several recipients)
+        with the same amounts, dates and names are summarized once and each
+        copy gets its own copy of the summary.
+        """
+        email_bodies = [self._reduce_body(body) for body in email_bodies]
+        pending = []
+        for i, body in enumerate(email_bodies):
+            known = self._classify(body)
+            if known is None:
+                known = self._get_cached(self._cache_key(body))
+            if known is not None:
+                yield i, known
+            else:
+                pending.append(i)
+
+        copies: Dict[int, List[int]] = {}
+        if settings.summary_dedup_enabled and len(pending) > 1:
+            representatives = cluster([email_bodies[i] for i in pending], settings.summary_dedup_similarity)
+            for i, j in zip(pending, representatives):
+                if pending[j] != i:
+                    copies.setdefault(pending[j], []).append(i)
+            pending = [pending[j] for j in sorted(set(representatives))]
+            if copies:
+                logger.info(f"Deduplicated {sum(len(c) for c in copies.values())} of {len(email_bodies)} emails")
+
+        if settings.together_batch_prompts:
+            groups = self._pack_batches([email_bodies[i] for i in pending])
+            groups = [[pending[j] for j in group] for group in groups]
+        else:
+            groups = [[i] for i in pending]
+
+        async def run(group: List[int]):
+            bodies = [email_bodies[i] for i in group]
+            if len(bodies) == 1:
+                return group, await self._summarize_each(bodies)
+            return group, await self._summarize_batch_or_fallback(bodies)
+
+        queued = iter(groups)
+        running = set()
+        try:
+            while True:
+                for group in queued:
+                    running.add(asyncio.ensure_future(run(group)))
+                    if len(running) >= self.concurrency:
+                        break
+                if not running:
+                    break
+
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    group, summaries = task.result()
+                    for i, summary in zip(group, summaries):
+                        yield i, summary
+                        for copy in copies.get(i, []):
+                            yield copy, summary if isinstance(summary, Exception) else summary.model_copy()
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def summarize_batch_async(self, email_bodies: List[str]) -> List[EmailSummary]:
+        """Summarize several emails with a single prompt that returns a JSON array"""
+        return await self._summarize_batch([self._reduce_body(body) for body in email_bodies])
+
+    async def _summarize_batch(self, email_bodies: List[str]) -> List[EmailSummary]:
+        prompt = self._create_batch_prompt(email_bodies)
+        route = model_router.route_batch(len(email_bodies))
+        output = ""
+
+        try:
+            with SUMMARIZE_SECONDS.time(mode="batch"):
+                output = await self._complete_async(prompt, route)
+                summaries = self._parse_summaries(output, "array")
+                if len(summaries) != len(email_bodies):
+                    raise ValueError(f"Expected {len(email_bodies)} summaries, got {len(summaries)}")
+
+        except httpx.HTTPError as e:
+            logger.error(f"API request failed: {str(e)}")
+            raise Exception(f"Failed to summarize emails: {str(e)}")
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid JSON response: {output}")
+            raise ValueError(f"Invalid response format: {str(e)}")
+
+        for body, summary in zip(email_bodies, summaries):
+            self._set_cached(self._cache_key(body), summary)
+        return summaries
+
+    async def _summarize_batch_or_fallback(self, email_bodies: List[str]) -> List[Union[EmailSummary, Exception]]:
+        try:
+            return await self._summarize_batch(email_bodies)
+        except Exception as e:
+            logger.warning(f"Batch of {len(email_bodies)} emails failed ({str(e)}), retrying one by one")
+            return await self._summarize_each(email_bodies)
+
+    async def _summarize_each(self, email_bodies: List[str]) -> List[Union[EmailSummary, Exception]]:
+        return await asyncio.gather(
+            *(self._summarize_uncached_async(body, self._cache_key(body)) for body in email_bodies),
+            return_exceptions=True
+        )
+
+    def _pack_batches(self, email_bodies: List[str]) -> List[List[int]]:
+        """Group short emails into prompts within the token budget.
+
+        Long emails and ones the router sends to the large model (e.g. ambiguous
+        time vs expense) go alone, so they are routed one by one.
+        """
+        groups = []
+        current = []
+        current_tokens = 0
+
+        for i, body in enumerate(email_bodies):
+            tokens = estimate_tokens(body)
+            if tokens > settings.together_batch_short_email_tokens or not model_router.batchable(body):
+                groups.append([i])
+                continue
+
+            if current and (current_tokens + tokens > settings.together_batch_token_budget
+                            or len(current) >= settings.together_batch_max_emails):
+                groups.append(current)
+                current = []
+                current_tokens = 0
+
+            current.append(i)
+            current_tokens += tokens
+
+        if current:
+            groups.append(current)
+        return groups
+
+    async def _complete_async(self, prompt: str, route: Route, json_mode: bool = False) -> str:
+        """Send one chat completion through the pool and return the message text"""
+        if not self.api_key:
+            raise ValueError("TOGETHER_API_KEY not configured")
+
+        json_mode = json_mode and self._json_mode_supported(route.model)
+        client, semaphore = self._get_client()
+        async with semaphore:
+            await self.rate_limiter.acquire()
+            start = time.perf_counter()
+            status = "error"
+            try:
+                response = await client.post(self.url, json=self._create_request(prompt, route, json_mode))
+                status = response.status_code
+            finally:
+                seconds = time.perf_counter() - start
+                TOGETHER_REQUEST_SECONDS.observe(seconds, tier=route.tier, status=status)
+
+        if json_mode and self._rejected_json_mode(route.model, response):
+            return await self._complete_async(prompt, route)
+        response.raise_for_status()
+        return self._message_text(response.json(), route, seconds)
+
+    def _complete(self, prompt: str, route: Route, json_mode: bool = False) -> str:
+        """Blocking chat completion for summarize_email"""
+        json_mode = json_mode and self._json_mode_supported(route.model)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = requests.post(
+                self.url,
+                headers=self._headers(),
+                json=self._create_request(prompt, route, json_mode),
+                timeout=self.timeout
+            )
+            status = response.status_code
+        finally:
+            seconds = time.perf_counter() - start
+            TOGETHER_REQUEST_SECONDS.observe(seconds, tier=route.tier, status=status)
+
+        if json_mode and self._rejected_json_mode(route.model, response):
+            return self._complete(prompt, route)
+        response.raise_for_status()
+        return self._message_text(response.json(), route, seconds)
+
+    def _json_mode_supported(self, model: str) -> bool:
+        return (settings.together_json_mode and model not in self._json_mode_rejected
+                and model in settings.together_json_mode_models)
+
+    def _rejected_json_mode(self, model: str, response) -> bool:
+        """When Together says the model doesn't support JSON mode, stop asking for it and tell the caller to resend"""
+        if response.status_code != 400:
+            return False
+        # Other 400s, e.g. a prompt over the context length, would fail the same way without JSON mode
+        error = response.text.lower()
+        if not any(phrase in error for phrase in JSON_MODE_ERRORS):
+            return False
+        logger.warning(f"Together rejected JSON mode for {model}, sending plain prompts from now on")
+        self._json_mode_rejected.add(model)
+        return True
+
+    def _message_text(self, response_json: Dict[str, Any], route: Route, seconds: float) -> str:
+        record_together_usage(response_json, route.tier)
+        model_router.record_response(route, seconds, response_json)
+        choice = response_json["choices"][0]
+        if choice.get("finish_reason") == "length":
+            TOGETHER_TRUNCATED.inc(tier=route.tier)
+            raise ValueError(f"Output cut off at max_tokens={route.max_tokens}")
+        return choice["message"]["content"].strip()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _get_client(self):
+        """Return the pooled client and concurrency semaphore for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                self._close_stale_client(self._client, self._loop)
+            self._client = httpx.AsyncClient(
+                headers=self._headers(),
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency
+                )
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+        return self._client, self._semaphore
+
+    @staticmethod
+    def _close_stale_client(client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop):
+        """Close a client left by an earlier event loop; its connections can only be closed on that loop"""
+        if loop.is_closed():
+            logger.warning("Together client outlived its event loop; call aclose() before the loop closes")
+        elif loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        else:
+            # The old loop is idle, but this thread is busy running the new one
+            closer = threading.Thread(target=loop.run_until_complete, args=(client.aclose(),), daemon=True)
+            closer.start()
+            closer.join()
+
+    def _reduce_body(self, email_body: str) -> str:
+        """Strip quoted history, signatures and disclaimers before the body reaches the prompt or cache key"""
+        if not settings.summarizer_reduce_bodies:
+            return email_body
+        reduced = reduce_body(email_body, settings.summarizer_max_input_tokens)
+        logger.debug(f"Reduced email body from {reduced.original_bytes} to {reduced.reduced_bytes} bytes")
+        return reduced.text
+
+    def _classify(self, email_body: str):
+        if not settings.classifier_enabled:
+            return None
+        return email_classifier.classify(email_body)
+
+    def _cache_key(self, email_body: str) -> str:
+        # Keyed by the routed model, so a summary from one tier isn't served for another
+        return summary_cache.make_key(email_body, model_router.model_for(email_body), PROMPT_VERSION)
+
+    def _get_cached(self, cache_key: str):
+        if not settings.summary_cache_enabled:
+            return None
+        return summary_cache.get(cache_key)
+
+    def _set_cached(self, cache_key: str, summary: EmailSummary):
+        if settings.summary_cache_enabled:
+            summary_cache.set(cache_key, summary)
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _create_request(self, prompt: str, route: Route, json_mode: bool = False) -> Dict[str, Any]:
+        request = {
+            "model": route.model,
+            "messages": [
+                {"role": "system", "content": "You are a helpful legal assistant."},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": route.max_tokens,
+            "temperature": 0.3
+        }
+        if json_mode:
+            request["response_format"] = {"type": "json_object", "schema": SUMMARY_SCHEMA}
+        return request
+
+    def _parse_summary(self, output: str) -> EmailSummary:
+        return self._parse_summaries(output, "object")[0]
+
+    def _parse_summaries(self, output: str, kind: str) -> List[EmailSummary]:
+        """Parse the first JSON object (or array of objects) in the output, counting the outcome in metrics"""
+        outcome = "failed"
+        truncated = False
+        try:
+            parsed = parse_json(output, kind)
+            truncated = parsed.truncated
+            items = parsed.value if kind == "array" else [parsed.value]
+            if truncated and items:
+                items[-1] = self._cut_off_item(items[-1], parsed.cut_key)
+            outcome = "invalid"
+            summaries = [self._to_summary(item) for item in items]
+            outcome = "repaired" if parsed.repaired else "ok"
+            return summaries
+        finally:
+            # Truncation is its own label so it is counted whatever the outcome
+            LLM_JSON_PARSES.inc(kind=kind, outcome=outcome, truncated="true" if truncated else "false")
+
+    def _cut_off_item(self, item: Any, cut_key: Optional[str]) -> Dict[str, Any]:
+        """The object the output ended in, without its cut-off member; rejected unless summary and type are complete"""
+        if not isinstance(item, dict) or cut_key in ("summary", "type") or not item.get("summary") or not item.get("type"):
+            raise ValueError("Output was cut off before the summary and type were complete")
+        return {key: value for key, value in item.items() if key != cut_key}
+
+    def _to_summary(self, summary_data: Dict[str, Any]) -> EmailSummary:
+        """Fit a parsed object to EmailSummary: drop unknown keys, normalise the type and pull numbers out of text"""
+        if not isinstance(summary_data, dict):
+            raise ValueError(f"Expected a JSON object, got {type(summary_data).__name__}")
+
+        data = {key: value for key, value in summary_data.items() if key in SUMMARY_FIELDS and value is not None}
+        data["type"] = self._entry_type(data)
+        for field in NUMBER_FIELDS:
+            if field in data:
+                data[field] = self._number(field, data[field])
+        if data.get("matter_id") is None:
+            data["matter_id"] = settings.default_matter_id
+        return EmailSummary(**data)
+
+    def _entry_type(self, data: Dict[str, Any]) -> str:
+        """"TimeEntry" or "ExpenseEntry", accepting loose spellings and guessing from the fields when missing"""
+        name = re.sub(r"[^a-z]", "", str(data.get("type", "")).lower())
+        if name.startswith("time"):
+            return "TimeEntry"
+        if name.startswith("expense"):
+            return "ExpenseEntry"
+        return "ExpenseEntry" if "price" in data and "duration" not in data else "TimeEntry"
+
+    def _number(self, field: str, value: Any):
+        """Numbers the model wrote as text, e.g. "$1,250.00" or "30 minutes"; None if there is no number"""
+        if isinstance(value, str):
+            match = NUMBER.search(value.replace(",", ""))
+            if match is None:
+                return None
+            number = float(match.group())
+            if field == "duration" and "min" in value.lower():
+                number /= 60
+            value = number
+        if field in ("quantity", "matter_id") and isinstance(value, float):
+            value = round(value)
+        return value
     
     def _create_prompt(self, email_body: str) -> str:
         return f"""
 You are a helpful legal assistant. Given the email below, return a JSON object with the following fields:
-- summary: a professional billing summary of the email.
-- type: either "TimeEntry" or "ExpenseEntry".
-  - Use "ExpenseEntry" if the email discusses client expenses (e.g. court fees, postage, etc.).
-  - Use "TimeEntry" if the email is about legal work, client communication, or tasks performed.
-- rate (only for TimeEntry): hourly rate or per-task rate if mentioned, default 200.
-- duration (only for TimeEntry): estimated time in hours (e.g. 0.5 for 30 minutes), default 1.0.
-- price (only for ExpenseEntry): the cost of the expense.
-- quantity (only for ExpenseEntry): number of items or units billed, default to 1.
-- expense_type (only for ExpenseEntry): choose either "Disbursement" or "Expense Recovery".
-- matter_id : the id of the case if not defualt 12060094
-
+{FIELD_INSTRUCTIONS}
 Email:
 {email_body}
 
 Return only valid JSON:
 """
-    
-    def _clean_json_response(self, output: str) -> str:
-        """Clean the response to extract valid JSON"""
-        # Remove markdown formatting if present
-        if "```json" in output:
-            start = output.find("```json") + 7
-            end = output.find("```", start)
-            output = output[start:end].strip()
-        elif "```" in output:
-            start = output.find("```") + 3
-            end = output.find("```", start)
-            output = output[start:end].strip()
-        
-        # Find JSON object boundaries
-        start = output.find("{")
-        end = output.rfind("}") + 1
-        
-        if start != -1 and end != -1:
-            output = output[start:end]
-        
-        return output
 
-summarizer_service = SummarizerService()
\ No newline at end of file
+    def _create_batch_prompt(self, email_bodies: List[str]) -> str:
+        emails = "\n\n".join(
+            f"Email {i}:\n{body}" for i, body in enumerate(email_bodies, start=1)
+        )
+        return f"""
+You are a helpful legal assistant. Given the {len(email_bodies)} emails below, return a JSON array with exactly {len(email_bodies)} objects, one per email and in the same order. Each object has the following fields:
+{FIELD_INSTRUCTIONS}
+{emails}
+
+Return only a valid JSON array:
+"""
+
+summarizer_service = SummarizerService()
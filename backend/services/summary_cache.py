@@ -0,0 +1,151 @@
+import os
+import re
+import time
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+from ..config import settings
+from ..models.schemas import EmailSummary
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Disk eviction scans the table, so only run it every this many writes
+EVICT_EVERY = 100
+
+
+def normalize_body(email_body: str) -> str:
+    """Collapse formatting-only differences so resent or re-wrapped bodies share a key"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", email_body)).strip()
+
+
+class SummaryCache:
+    """Two-tier cache of parsed summaries: an in-memory LRU in front of SQLite"""
+
+    def __init__(self, path: str, memory_size: int, max_entries: int, ttl_seconds: float):
+        self.path = path
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._writes = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(email_body: str, model: str, prompt_version: str) -> str:
+        digest = hashlib.sha256()
+        for part in (model, prompt_version, normalize_body(email_body)):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS summaries (
+                    key TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_summaries_accessed ON summaries (accessed_at);
+            """)
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[EmailSummary]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                summary, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return summary.model_copy()
+                del self._memory[key]
+
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT summary, created_at FROM summaries WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            with conn:
+                conn.execute("UPDATE summaries SET accessed_at = ? WHERE key = ?", (now, key))
+            summary = EmailSummary.model_validate_json(row[0])
+            self._remember(key, summary, row[1])
+            self.disk_hits += 1
+            return summary.model_copy()
+
+    def set(self, key: str, summary: EmailSummary):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO summaries (key, summary, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, summary.model_dump_json(), now, now)
+                )
+            self._remember(key, summary.model_copy(), now)
+
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict_disk(conn, now)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    def _remember(self, key: str, summary: EmailSummary, created_at: float):
+        self._memory[key] = (summary, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, conn: sqlite3.Connection, now: float):
+        with conn:
+            expired = conn.execute(
+                "DELETE FROM summaries WHERE created_at < ?", (now - self.ttl_seconds,)
+            ).rowcount
+            overflow = conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM summaries WHERE key IN "
+                    "(SELECT key FROM summaries ORDER BY accessed_at LIMIT ?)",
+                    (overflow,)
+                )
+        if expired or overflow > 0:
+            logger.info(f"Summary cache evicted {expired} expired and {max(overflow, 0)} least recently used entries")
+
+
+summary_cache = SummaryCache(
+    settings.summary_cache_path,
+    memory_size=settings.summary_cache_memory_size,
+    max_entries=settings.summary_cache_max_entries,
+    ttl_seconds=settings.summary_cache_ttl_seconds
+)
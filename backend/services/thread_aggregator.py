@@ -0,0 +1,156 @@
+import math
+import threading
+import logging
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+from zoneinfo import ZoneInfo
+from ..config import settings
+from ..models.schemas import EmailBase, EmailSummary
+from ..utils.body_reducer import ReducedBody, reduce_body
+from .matter_resolver import matter_resolver
+from .summarizer_service import summarizer_service
+
+logger = logging.getLogger(__name__)
+
+# Never squeeze one message of a thread below this many tokens in the combined prompt
+MIN_TOKENS_PER_MESSAGE = 100
+
+
+class EmailGroup(NamedTuple):
+    """Sent emails billed as one activity: same thread, same matter, same day"""
+    thread_id: str
+    matter_id: Optional[int]
+    day: Optional[date]
+    emails: List[EmailBase]
+
+
+class ThreadAggregator:
+    """Turns a run of sent emails into one billing entry per thread, matter and day.
+
+    Each group is summarized with a single LLM call over the combined messages,
+    and its duration is computed locally from when the messages were sent and
+    how much was written, instead of the model's per-email guess.
+    """
+
+    def __init__(self):
+        self.emails = 0
+        self.groups = 0
+        self._lock = threading.Lock()
+
+    def group(self, emails: List[EmailBase], user_id: str) -> List[EmailGroup]:
+        """Group emails by Gmail thread, the user's resolved matter and local day, keeping first-seen order"""
+        groups: Dict[Tuple, List[EmailBase]] = OrderedDict()
+        for email in emails:
+            thread_id = email.thread_id or email.id or str(id(email))
+            groups.setdefault((thread_id, matter_resolver.resolve(email, user_id), self.local_day(email)), []).append(email)
+
+        result = [
+            EmailGroup(thread_id, matter_id, day, sorted(members, key=self._sent_at))
+            for (thread_id, matter_id, day), members in groups.items()
+        ]
+        with self._lock:
+            self.emails += len(emails)
+            self.groups += len(result)
+        return result
+
+    async def summarize(self, groups: List[EmailGroup]) -> List[Union[EmailSummary, Exception]]:
+        """One consolidated summary per group; failures are returned in place of their summary"""
+        summaries = await summarizer_service.summarize_emails([self.combined_body(group) for group in groups])
+        return [
+            summary if isinstance(summary, Exception) else self._finalize(group, summary)
+            for group, summary in zip(groups, summaries)
+        ]
+
+    def combined_body(self, group: EmailGroup) -> str:
+        """The text summarized for a group.
+
+        A single email is passed through unchanged so it shares cache entries
+        with the per-email path. A thread is reduced message by message (so each
+        keeps its own quoted history out) and the parts are labelled in order.
+        """
+        if len(group.emails) == 1:
+            return group.emails[0].body
+
+        tz = ZoneInfo(settings.aggregate_timezone)
+        budget = max(MIN_TOKENS_PER_MESSAGE, settings.summarizer_max_input_tokens // len(group.emails))
+        parts = [f"A thread of {len(group.emails)} emails sent on the same matter on the same day."]
+        for i, email in enumerate(group.emails, start=1):
+            reduced = reduce_body(email.body, budget)
+            header = f"Email {i} of {len(group.emails)}"
+            if email.date:
+                header += f", sent {email.date.astimezone(tz):%H:%M}"
+            if email.to:
+                header += f" to {email.to}"
+            if email.subject:
+                header += f", subject: {email.subject}"
+            parts.append(f"{header}\n{reduced.text}")
+        return "\n\n".join(parts)
+
+    def estimate_duration(self, emails: List[EmailBase]) -> float:
+        """Hours of work for a group of emails, rounded up to the billing increment.
+
+        Every message costs its writing time (words / words per minute, with a
+        floor). Messages sent within the session gap of each other count as one
+        sitting, billed as the longer of their total writing time and the
+        span of the sitting plus the first message's writing time.
+        """
+        # Each sitting is [start, end, total writing minutes, first message's writing minutes]
+        sessions = []
+        gap = settings.aggregate_session_gap_minutes * 60
+        for email in sorted(emails, key=self._sent_at):
+            effort = self._writing_minutes(reduce_body(email.body, record_stats=False))
+            last = sessions[-1] if sessions else None
+            if last and last[1] and email.date and (email.date - last[1]).total_seconds() <= gap:
+                last[1] = email.date
+                last[2] += effort
+            else:
+                sessions.append([email.date, email.date, effort, effort])
+
+        minutes = sum(self._session_minutes(*session) for session in sessions)
+        increment = settings.aggregate_billing_increment
+        return round(max(1, math.ceil(minutes / 60 / increment - 1e-9)) * increment, 2)
+
+    def local_day(self, email: EmailBase) -> Optional[date]:
+        """The day the email was sent in aggregate_timezone, which is the day it is billed on"""
+        if email.date is None:
+            return None
+        return email.date.astimezone(ZoneInfo(settings.aggregate_timezone)).date()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "emails": self.emails,
+                "groups": self.groups,
+                "calls_saved": self.emails - self.groups,
+                "emails_per_group": self.emails / self.groups if self.groups else 0.0,
+            }
+
+    def _finalize(self, group: EmailGroup, summary: EmailSummary) -> EmailSummary:
+        update = {}
+        if group.matter_id is not None:
+            update["matter_id"] = group.matter_id
+        if group.day is not None:
+            update["date"] = group.day
+        if summary.type == "TimeEntry":
+            update["duration"] = self.estimate_duration(group.emails)
+        # Copy rather than mutate: the summary object may be shared with the cache
+        return summary.model_copy(update=update) if update else summary
+
+    @staticmethod
+    def _writing_minutes(reduced: ReducedBody) -> float:
+        words = len(reduced.text.split())
+        return max(settings.aggregate_min_minutes_per_email, words / settings.aggregate_words_per_minute)
+
+    @staticmethod
+    def _session_minutes(start: Optional[datetime], end: Optional[datetime], effort: float, first_effort: float) -> float:
+        if start is None or end is None:
+            return effort
+        return max(effort, (end - start).total_seconds() / 60 + first_effort)
+
+    @staticmethod
+    def _sent_at(email: EmailBase) -> float:
+        return email.date.timestamp() if email.date else math.inf
+
+
+thread_aggregator = ThreadAggregator()
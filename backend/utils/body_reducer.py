@@ -0,0 +1,167 @@
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+# Reply headers: "On Mon, Jan 1, 2024 at 9:00 AM Jane Doe <jane@example.com> wrote:"
+REPLY_HEADER = re.compile(r"^\s*On\s.{1,300}\swrote:\s*$", re.IGNORECASE | re.DOTALL)
+# Outlook / Apple Mail separators that start the quoted original
+ORIGINAL_MESSAGE = re.compile(r"^\s*-{2,}\s*Original Message\s*-{2,}\s*$", re.IGNORECASE)
+UNDERSCORE_RULE = re.compile(r"^\s*_{10,}\s*$")
+OUTLOOK_FROM = re.compile(r"^\s*\*?From:\*?\s", re.IGNORECASE)
+OUTLOOK_HEADER = re.compile(r"^\s*\*?(Sent|Date|To|Subject|Cc):\*?\s", re.IGNORECASE)
+# RFC 3676 signature delimiter and mobile client footers
+SIGNATURE_DELIMITER = re.compile(r"^--\s?$")
+# A bare "--" can also be a divider in the body; it only starts the signature below a
+# sign-off or when at most this many non-blank lines follow it
+SIGNATURE_MAX_LINES = 8
+MOBILE_FOOTER = re.compile(r"^\s*Sent from my \w+", re.IGNORECASE)
+DISCLAIMER = re.compile(
+    r"confidentiality notice|privileged (and|&) confidential|intended (solely |only )?for the (use of the )?"
+    r"(individual|addressee|recipient)|received this (e-?mail|message|communication) in error|"
+    r"notify the sender immediately|attorney[- ]client privilege|not the intended recipient",
+    re.IGNORECASE
+)
+# A body paragraph can mention privilege; a disclaimer is either below the sign-off or piles up these phrases
+DISCLAIMER_MIN_PHRASES = 2
+SIGN_OFF = re.compile(
+    r"^\s*((best|kind|warm|warmest)\s+)?(regards|wishes|thanks|thank you|many thanks|cheers|sincerely|best)\b[\s,.!]*$",
+    re.IGNORECASE
+)
+BLANK_RUNS = re.compile(r"\n{3,}")
+
+TRUNCATION_MARKER = " [truncated]"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text, rounded up)"""
+    return -(-len(text) // 4)
+
+
+class ReducedBody(NamedTuple):
+    text: str
+    original_bytes: int
+    reduced_bytes: int
+    truncated: bool
+
+
+class ReductionStats:
+    """Running totals of how much text body reduction kept away from the model"""
+
+    def __init__(self):
+        self.emails = 0
+        self.original_bytes = 0
+        self.reduced_bytes = 0
+        self.truncated = 0
+        self._lock = threading.Lock()
+
+    def record(self, reduced: ReducedBody):
+        with self._lock:
+            self.emails += 1
+            self.original_bytes += reduced.original_bytes
+            self.reduced_bytes += reduced.reduced_bytes
+            self.truncated += int(reduced.truncated)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "emails": self.emails,
+                "original_bytes": self.original_bytes,
+                "reduced_bytes": self.reduced_bytes,
+                "bytes_saved": self.original_bytes - self.reduced_bytes,
+                "truncated": self.truncated,
+                "reduction_ratio": 1 - self.reduced_bytes / self.original_bytes if self.original_bytes else 0.0,
+            }
+
+
+reduction_stats = ReductionStats()
+
+
+def _quote_start(lines: List[str]) -> Optional[int]:
+    """Index of the first line of quoted history, if any"""
+    for i, line in enumerate(lines):
+        if ORIGINAL_MESSAGE.match(line):
+            return i
+
+        # Reply headers are often wrapped over two lines
+        if line.lstrip().lower().startswith("on "):
+            for end in (i + 1, i + 2):
+                if REPLY_HEADER.match(" ".join(lines[i:end])):
+                    return i
+
+        # Outlook pastes a From/Sent/To/Subject block, sometimes under an underscore rule
+        if OUTLOOK_FROM.match(line):
+            following = [l for l in lines[i + 1:i + 5] if l.strip()]
+            if sum(1 for l in following if OUTLOOK_HEADER.match(l)) >= 2:
+                return i - 1 if i and UNDERSCORE_RULE.match(lines[i - 1]) else i
+    return None
+
+
+def _strip_signature(lines: List[str]) -> List[str]:
+    signed_off = False
+    for i, line in enumerate(lines):
+        if SIGNATURE_DELIMITER.match(line):
+            following = sum(1 for l in lines[i + 1:] if l.strip())
+            if signed_off or following <= SIGNATURE_MAX_LINES:
+                return lines[:i]
+        elif SIGN_OFF.match(line):
+            signed_off = True
+    return [line for line in lines if not MOBILE_FOOTER.match(line)]
+
+
+def _is_disclaimer(paragraph: str, after_sign_off: bool) -> bool:
+    phrases = {match.group(0).lower() for match in DISCLAIMER.finditer(paragraph)}
+    return len(phrases) >= (1 if after_sign_off else DISCLAIMER_MIN_PHRASES)
+
+
+def _strip_disclaimers(text: str) -> str:
+    """Drop legal boilerplate paragraphs.
+
+    Below the last sign-off ("Regards," etc.) one disclaimer phrase is enough;
+    above it a paragraph needs several, so a sentence about privilege in the
+    body itself is kept.
+    """
+    paragraphs = re.split(r"\n\s*\n", text)
+    sign_off = max(
+        (i for i, p in enumerate(paragraphs) if any(SIGN_OFF.match(line) for line in p.split("\n"))),
+        default=len(paragraphs)
+    )
+    return "\n\n".join(p for i, p in enumerate(paragraphs) if not _is_disclaimer(p, i > sign_off))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep the head of the text within max_tokens, cutting on a word boundary"""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars - len(TRUNCATION_MARKER))
+    if cut <= 0:
+        cut = max_chars - len(TRUNCATION_MARKER)
+    return text[:cut].rstrip() + TRUNCATION_MARKER
+
+
+def reduce_body(body: str, max_tokens: Optional[int] = None, record_stats: bool = True) -> ReducedBody:
+    """Drop quoted history, signatures and disclaimers, then fit the token budget"""
+    original_bytes = len(body.encode("utf-8"))
+    lines = body.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+
+    quote_start = _quote_start(lines)
+    if quote_start is not None:
+        lines = lines[:quote_start]
+    lines = [line for line in lines if not line.lstrip().startswith(">")]
+    lines = _strip_signature(lines)
+
+    text = _strip_disclaimers("\n".join(lines))
+    text = BLANK_RUNS.sub("\n\n", text).strip()
+    if not text:
+        # Never hand the model an empty email; fall back to the original
+        text = body.strip()
+
+    truncated = False
+    if max_tokens and estimate_tokens(text) > max_tokens:
+        text = truncate_to_tokens(text, max_tokens)
+        truncated = True
+
+    reduced = ReducedBody(text, original_bytes, len(text.encode("utf-8")), truncated)
+    if record_stats:
+        reduction_stats.record(reduced)
+    return reduced
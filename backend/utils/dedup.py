@@ -0,0 +1,112 @@
+import re
+import hashlib
+import unicodedata
+from typing import Dict, List, Optional
+
+_WORD = re.compile(r"\w+")
+# Numbers (amounts, dates, matter numbers) and capitalised words (names, months)
+_DETAIL = re.compile(r"\d(?:[\d,./:-]*\d)?|\b[A-Z][\w'’-]*")
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 2
+# Below this many words SimHash is too noisy to trust; only exact copies are merged
+MIN_NEAR_DUPLICATE_WORDS = 12
+
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(unicodedata.normalize("NFKC", text).casefold())
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def exact_fingerprint(text: str) -> str:
+    """Hash of the body's words, ignoring case, punctuation and wrapping"""
+    return hashlib.sha256(" ".join(_words(text)).encode("utf-8")).hexdigest()
+
+
+def details(text: str) -> str:
+    """Hash of the body's numbers and capitalised words, which a shared summary would get wrong if they differed"""
+    found = sorted(set(_DETAIL.findall(unicodedata.normalize("NFKC", text))))
+    return hashlib.sha256(" ".join(found).encode("utf-8")).hexdigest()
+
+
+def simhash(words: List[str]) -> int:
+    """64-bit SimHash over word shingles; similar texts differ in few bits"""
+    weights = [0] * SIMHASH_BITS
+    shingles = max(1, len(words) - SHINGLE_SIZE + 1)
+    for i in range(shingles):
+        value = _hash64(" ".join(words[i:i + SHINGLE_SIZE]))
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def max_distance(similarity: float) -> int:
+    """Convert a 0-1 similarity threshold into the allowed SimHash Hamming distance"""
+    similarity = min(max(similarity, 0.0), 1.0)
+    return int((1 - similarity) * SIMHASH_BITS)
+
+
+class NearDuplicateIndex:
+    """Clusters bodies by exact fingerprint, then by SimHash within a Hamming distance.
+
+    A near-duplicate only joins a cluster when its amounts, dates and names
+    match the representative's too, so letters that differ in just those
+    aren't given the same summary. Candidates are found with banded LSH: fingerprints are split into
+    distance + 1 bands, and any two within the distance must share a band
+    exactly (pigeonhole), so only same-bucket pairs are compared.
+    """
+
+    def __init__(self, similarity: float):
+        self.distance = max_distance(similarity)
+        bands = min(self.distance + 1, SIMHASH_BITS)
+        width = SIMHASH_BITS // bands
+        self._bands = [(i * width, SIMHASH_BITS if i == bands - 1 else (i + 1) * width) for i in range(bands)]
+        self._exact: Dict[str, int] = {}
+        self._buckets: Dict[tuple, List[int]] = {}
+        self._fingerprints: Dict[int, int] = {}
+        self._details: Dict[int, str] = {}
+
+    def add(self, key: int, text: str) -> Optional[int]:
+        """Index text under key; return the key of an earlier near-duplicate, if any"""
+        exact = exact_fingerprint(text)
+        if exact in self._exact:
+            return self._exact[exact]
+        self._exact[exact] = key
+
+        words = _words(text)
+        if len(words) < MIN_NEAR_DUPLICATE_WORDS:
+            return None
+
+        fingerprint = simhash(words)
+        detail = details(text)
+        band_keys = [(i, fingerprint >> start & ((1 << (end - start)) - 1)) for i, (start, end) in enumerate(self._bands)]
+        for band_key in band_keys:
+            for candidate in self._buckets.get(band_key, []):
+                if (self._details[candidate] == detail
+                        and bin(fingerprint ^ self._fingerprints[candidate]).count("1") <= self.distance):
+                    self._exact[exact] = candidate
+                    return candidate
+
+        self._fingerprints[key] = fingerprint
+        self._details[key] = detail
+        for band_key in band_keys:
+            self._buckets.setdefault(band_key, []).append(key)
+        return None
+
+
+def cluster(texts: List[str], similarity: float) -> List[int]:
+    """Map each text to the index of its cluster representative (itself if unique)"""
+    index = NearDuplicateIndex(similarity)
+    representatives = []
+    for i, text in enumerate(texts):
+        duplicate_of = index.add(i, text)
+        representatives.append(i if duplicate_of is None else duplicate_of)
+    return representatives
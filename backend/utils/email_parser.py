@@ -1,5 +1,21 @@
 import base64
-from bs4 import BeautifulSoup
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from ..config import settings
+
+# Elements whose text never reaches the reader
+SKIPPED_TAGS = {"script", "style", "template"}
+# Elements whose whitespace-only text is kept verbatim
+PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}
+ASCII_SPACES = str.maketrans("", "", " \n\t\x0c\r")
+# Void elements never have content, so they are not tracked as open
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem",
+    "meta", "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame",
+    "image", "isindex", "nextid", "spacer",
+}
+# Feed HTML in pieces so extraction can stop once enough text is collected
+FEED_CHUNK_SIZE = 16384
 
 def decode_base64(data):
     try:
@@ -7,9 +23,114 @@ def decode_base64(data):
     except Exception:
         return ""
 
-def strip_html_tags(html):
-    soup = BeautifulSoup(html, "html.parser")
-    return soup.get_text(separator="\n").strip()
+class HTMLTextExtractor(HTMLParser):
+    """Streaming HTML-to-text that never builds a tree.
+
+    Produces the same text as BeautifulSoup's get_text(separator="\n"): text
+    nodes joined by newlines, with script, style and template content dropped.
+    """
+
+    def __init__(self, max_chars=None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts = []
+        self.pending = []
+        self.length = 0
+        self.open_tags = []
+        self.closed_void_tags = []
+        self.skip_depth = 0
+        self.preserve_depth = 0
+
+    @property
+    def done(self):
+        return bool(self.max_chars) and self.length >= self.max_chars
+
+    def flush(self):
+        """Close the current text node; the parser may deliver one node in several pieces"""
+        if not self.pending:
+            return
+        data = "".join(self.pending)
+        self.pending = []
+        # Like BeautifulSoup, collapse whitespace-only runs between tags
+        if not self.preserve_depth and not data.translate(ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+        self.parts.append(data)
+
+    def handle_starttag(self, tag, attrs):
+        self.flush()
+        if tag in VOID_TAGS:
+            self.closed_void_tags.append(tag)
+            return
+        self.open_tags.append(tag)
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.flush()
+        if tag in self.closed_void_tags:
+            self.closed_void_tags.remove(tag)
+
+    def handle_endtag(self, tag):
+        # The end tag of an already-closed void element is swallowed without splitting the text
+        if tag in self.closed_void_tags:
+            self.closed_void_tags.remove(tag)
+            return
+        self.flush()
+        # An end tag closes the most recent matching element and everything opened inside it
+        if tag not in self.open_tags:
+            return
+        while self.open_tags:
+            closed = self.open_tags.pop()
+            if closed in SKIPPED_TAGS:
+                self.skip_depth -= 1
+            elif closed in PRESERVE_WHITESPACE_TAGS:
+                self.preserve_depth -= 1
+            if closed == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.skip_depth and not self.done:
+            self.pending.append(data)
+            self.length += len(data)
+
+    def handle_comment(self, data):
+        self.flush()
+
+    def handle_decl(self, decl):
+        self.flush()
+
+    def handle_pi(self, data):
+        self.flush()
+
+    def unknown_decl(self, data):
+        # BeautifulSoup keeps CDATA sections even inside skipped elements
+        self.flush()
+        if data.startswith("CDATA[") and not self.done:
+            self.parts.append(data[6:])
+            self.length += len(data) - 6
+
+    def get_text(self):
+        self.flush()
+        text = "\n".join(self.parts)
+        if self.max_chars:
+            text = text[:self.max_chars]
+        return text
+
+def strip_html_tags(html, max_chars=None):
+    if max_chars is None:
+        max_chars = settings.email_html_max_chars
+
+    extractor = HTMLTextExtractor(max_chars)
+    for start in range(0, len(html), FEED_CHUNK_SIZE):
+        extractor.feed(html[start:start + FEED_CHUNK_SIZE])
+        if extractor.done:
+            break
+    else:
+        extractor.close()
+
+    return extractor.get_text().strip()
 
 def extract_body_recursive(payload):
     """
@@ -41,13 +162,22 @@ def parse_email(message):
 
     subject = next((h["value"] for h in headers if h["name"] == "Subject"), None)
     to = next((h["value"] for h in headers if h["name"] == "To"), None)
+    cc = next((h["value"] for h in headers if h["name"] == "Cc"), None)
     from_ = next((h["value"] for h in headers if h["name"] == "From"), None)
     body = extract_body_recursive(payload)
 
+    internal_date = message.get("internalDate")
+    date = datetime.fromtimestamp(int(internal_date) / 1000, tz=timezone.utc) if internal_date else None
+
     return {
+        "id": message.get("id"),
+        "thread_id": message.get("threadId"),
+        "date": date,
         "subject": subject,
         "to": to,
+        "cc": cc,
         "from": from_,
+        "labels": message.get("labelIds", []),
         "body": body.strip()
     }
 
@@ -1,33 +1,227 @@
 import os
+import sys
+import json
 import pickle
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import Flow, InstalledAppFlow
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from ..config import settings
+from ..services.credential_store import DEFAULT_USER_ID, credential_store
+
+logger = logging.getLogger(__name__)
 
 CLIENT_SECRET_FILE = settings.google_client_secret_file
 SCOPES = settings.google_scopes_list
 redirect_uri = "http://localhost:8000/"  # ← MUST MATCH Google Console
+# Token file written by earlier single-user versions; imported once for the default user
+LEGACY_TOKEN_FILE = "token.pkl"
+# Credential store entry holding a user's in-progress web OAuth state
+OAUTH_STATE_PROVIDER = "gmail_oauth"
+
+
+class GmailAuthRequired(Exception):
+    """The user has no stored Gmail credentials and has to connect through /gmail/login"""
+
+    def __init__(self, user_id: str):
+        super().__init__(f"Gmail is not connected for user {user_id}")
+        self.user_id = user_id
+
+_refresh_locks = {}
+_refresh_locks_guard = threading.Lock()
+
+
+def _refresh_lock(user_id: str) -> threading.Lock:
+    with _refresh_locks_guard:
+        return _refresh_locks.setdefault(user_id, threading.Lock())
+
+
+def _save_credentials(user_id: str, creds: Credentials):
+    credential_store.set(user_id, "gmail", json.loads(creds.to_json()))
+
+
+def _load_credentials(user_id: str):
+    data = credential_store.get(user_id, "gmail")
+    if data is None:
+        return None
+    return Credentials.from_authorized_user_info(data, SCOPES)
 
-def get_gmail_service():
-    creds = None
+
+def _needs_refresh(creds: Credentials) -> bool:
+    # google-auth keeps expiry as naive UTC
+    if creds.expiry is None:
+        return not creds.valid
+    margin = timedelta(seconds=settings.token_refresh_margin_seconds)
+    return creds.expiry - margin <= datetime.utcnow()
+
+
+def _import_legacy_token(user_id: str):
+    if user_id != DEFAULT_USER_ID or not os.path.exists(LEGACY_TOKEN_FILE):
+        return None
+    with open(LEGACY_TOKEN_FILE, "rb") as token:
+        creds = pickle.load(token)
+    _save_credentials(user_id, creds)
+    logger.info(f"Imported {LEGACY_TOKEN_FILE} into the credential store for {user_id}")
+    return creds
+
+
+def _run_local_flow(user_id: str) -> Credentials:
+    """Connect Gmail from a terminal: `python -m backend.utils.gmail_auth [user_id]`.
+
+    Opens a browser and listens on localhost:8000, so it can't run inside the
+    web server; browsers connect through /gmail/login instead.
+    """
     print("SCOPES BEING USED:", SCOPES)
     print("Redirect URI being used:", redirect_uri)
-    
-    if os.path.exists("token.pkl"):
-        with open("token.pkl", "rb") as token:
-            creds = pickle.load(token)
-    else:
-        flow = InstalledAppFlow.from_client_secrets_file(
-            CLIENT_SECRET_FILE,
-            SCOPES
-        )
-        # Using redirect_uri_trailing_slash=True uses http://localhost:8000/
-        creds = flow.run_local_server(
-            port=8000,
-            redirect_uri_trailing_slash=True  # matches http://localhost:8000/
-        )
-        with open("token.pkl", "wb") as token:
-            pickle.dump(creds, token)
-
-    service = build("gmail", "v1", credentials=creds)
-    return service
+    flow = InstalledAppFlow.from_client_secrets_file(
+        CLIENT_SECRET_FILE,
+        SCOPES
+    )
+    # Using redirect_uri_trailing_slash=True uses http://localhost:8000/
+    creds = flow.run_local_server(
+        port=8000,
+        redirect_uri_trailing_slash=True  # matches http://localhost:8000/
+    )
+    _save_credentials(user_id, creds)
+    return creds
+
+
+def _web_flow(state: str = None) -> Flow:
+    return Flow.from_client_secrets_file(
+        CLIENT_SECRET_FILE, scopes=SCOPES, state=state, redirect_uri=settings.gmail_redirect_uri
+    )
+
+
+def authorization_url(user_id: str) -> str:
+    """Start the browser OAuth flow for a user and return Google's consent URL"""
+    flow = _web_flow()
+    # Offline access with forced consent so Google always returns a refresh token
+    url, state = flow.authorization_url(access_type="offline", prompt="consent", include_granted_scopes="true")
+    credential_store.set(user_id, OAUTH_STATE_PROVIDER, {
+        "state": state,
+        "code_verifier": flow.code_verifier,
+    })
+    return url
+
+
+def exchange_code(user_id: str, code: str, state: str) -> Credentials:
+    """Finish the browser OAuth flow: check the state, trade the code for tokens and store them"""
+    pending = credential_store.get(user_id, OAUTH_STATE_PROVIDER)
+    if pending is None or pending.get("state") != state:
+        raise ValueError("OAuth state does not match a login started by this user")
+    credential_store.delete(user_id, OAUTH_STATE_PROVIDER)
+
+    flow = _web_flow(state)
+    flow.code_verifier = pending.get("code_verifier")
+    flow.fetch_token(code=code)
+    creds = flow.credentials
+    _save_credentials(user_id, creds)
+    gmail_client_factory.forget(user_id)
+    logger.info(f"Connected Gmail for {user_id}")
+    return creds
+
+
+class GmailClientFactory:
+    """Hands out Gmail API clients without rebuilding them per request.
+
+    The discovery document is read and parsed once. Each user has one shared
+    Credentials object, refreshed in place shortly before it expires, so
+    existing clients pick up the new token without being rebuilt. googleapiclient
+    and httplib2 are not thread-safe, so every thread gets its own client and
+    AuthorizedHttp, whose connection is kept alive between calls.
+    """
+
+    def __init__(self):
+        self._discovery = None
+        self._credentials: Dict[str, Credentials] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def discovery_document(self) -> dict:
+        if self._discovery is None:
+            document = get_static_doc("gmail", "v1")
+            if document is None:
+                raise Exception("The Gmail discovery document is missing from google-api-python-client")
+            self._discovery = json.loads(document)
+        return self._discovery
+
+    def service(self, user_id: str = DEFAULT_USER_ID):
+        """This thread's Gmail client for the user, with credentials fresh for at least the refresh margin"""
+        creds = self.credentials(user_id)
+        services = self._local.__dict__.setdefault("services", {})
+        cached = services.get(user_id)
+        if cached is None or cached[0] is not creds:
+            http = AuthorizedHttp(creds, http=httplib2.Http(timeout=settings.gmail_http_timeout))
+            cached = (creds, build_from_document(self.discovery_document(), http=http))
+            services[user_id] = cached
+        return cached[1]
+
+    def credentials(self, user_id: str = DEFAULT_USER_ID) -> Credentials:
+        with self._lock:
+            creds = self._credentials.get(user_id)
+            if creds is None:
+                creds = _load_credentials(user_id) or _import_legacy_token(user_id)
+                if creds is None:
+                    raise GmailAuthRequired(user_id)
+                self._credentials[user_id] = creds
+        if creds.refresh_token and _needs_refresh(creds):
+            self._refresh(user_id, creds)
+        return creds
+
+    def forget(self, user_id: str):
+        """Drop the user's cached credentials so the next call loads newly stored ones"""
+        with self._lock:
+            self._credentials.pop(user_id, None)
+
+    def _refresh(self, user_id: str, creds: Credentials):
+        """Refresh the shared Credentials in place.
+
+        A per-user thread lock and a credential store lock make sure only one
+        thread across all workers calls Google's token endpoint; everyone else
+        copies the winner's token out of the store.
+        """
+        with _refresh_lock(user_id):
+            if self._adopt_stored_token(user_id, creds) or not _needs_refresh(creds):
+                return
+
+            lock_name = f"gmail-refresh:{user_id}"
+            owner = credential_store.acquire_lock(lock_name, settings.token_refresh_lock_seconds)
+            if owner is None:
+                # Another worker is refreshing; the current token is still valid for the margin
+                return
+            try:
+                creds.refresh(Request())
+                _save_credentials(user_id, creds)
+                logger.info(f"Refreshed Gmail token for {user_id}")
+            finally:
+                credential_store.release_lock(lock_name, owner)
+
+    def _adopt_stored_token(self, user_id: str, creds: Credentials) -> bool:
+        stored = _load_credentials(user_id)
+        if stored is None or stored.token == creds.token or _needs_refresh(stored):
+            return False
+        creds.token = stored.token
+        creds.expiry = stored.expiry
+        return True
+
+
+gmail_client_factory = GmailClientFactory()
+
+
+def get_gmail_credentials(user_id: str = DEFAULT_USER_ID) -> Credentials:
+    return gmail_client_factory.credentials(user_id)
+
+
+def get_gmail_service(user_id: str = DEFAULT_USER_ID):
+    return gmail_client_factory.service(user_id)
+
+
+if __name__ == "__main__":
+    _run_local_flow(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_USER_ID)
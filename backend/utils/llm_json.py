@@ -0,0 +1,203 @@
+import re
+import json
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+# Bare words that stand for JSON literals (Python and JavaScript spellings)
+LITERALS = {
+    "true": "true", "True": "true",
+    "false": "false", "False": "false",
+    "null": "null", "None": "null", "NaN": "null", "undefined": "null",
+}
+NUMBER = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?")
+# Characters that end an unquoted key or value
+DELIMITERS = frozenset(',:{}[]"\n')
+CLOSERS = {"{": "}", "[": "]"}
+
+
+class ParsedJson(NamedTuple):
+    value: Any
+    repaired: bool
+    # The output ended before the value was closed
+    truncated: bool = False
+    # In truncated output, the object member whose value was cut short or never written
+    cut_key: Optional[str] = None
+
+
+def extract_json(text: str, kind: str = "object") -> tuple:
+    """Find the first balanced JSON object (or array) in model output in a single scan.
+
+    Returns (fragment, truncated). Surrounding prose and Markdown fences are
+    skipped; quotes are tracked so braces inside strings don't count. When the
+    output ends before the value is closed (e.g. cut off at max_tokens), the
+    rest of the text is returned with truncated=True.
+    """
+    opener = "{" if kind == "object" else "["
+    start = text.find(opener)
+    if start == -1:
+        raise json.JSONDecodeError(f"No JSON {kind} in model output", text, 0)
+
+    depth = 0
+    quote = None
+    escaped = False
+    for i in range(start, len(text)):
+        c = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == quote:
+                quote = None
+        elif c == '"' or c == "'":
+            quote = c
+        elif c == "{" or c == "[":
+            depth += 1
+        elif c == "}" or c == "]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1], False
+    return text[start:], True
+
+
+def repair_json(fragment: str, truncated: bool = False) -> str:
+    """Rewrite common model mistakes into valid JSON in one pass.
+
+    Handles single-quoted strings, raw newlines and \\' escapes inside strings,
+    unquoted keys and values, Python/JavaScript literals, trailing commas and,
+    for truncated output, dangling keys, half-written values and unclosed
+    strings, objects and arrays.
+    """
+    return _repair(fragment, truncated)[0]
+
+
+def parse_json(text: str, kind: str = "object") -> ParsedJson:
+    """Parse the first JSON object or array in model output, repairing it only if it doesn't parse as is"""
+    fragment, truncated = extract_json(text, kind)
+    if not truncated:
+        try:
+            return ParsedJson(json.loads(fragment), False)
+        except json.JSONDecodeError:
+            pass
+    repaired, cut_key = _repair(fragment, truncated)
+    return ParsedJson(json.loads(repaired), True, truncated, cut_key)
+
+
+def _repair(fragment: str, truncated: bool) -> Tuple[str, Optional[str]]:
+    """repair_json, also returning the key whose value truncation cut off"""
+    tokens: List[str] = []
+    stack: List[str] = []
+    n = len(fragment)
+    i = 0
+    open_string = False
+    while i < n:
+        c = fragment[i]
+        if c == '"' or c == "'":
+            i, closed = _read_string(fragment, i, tokens)
+            open_string = not closed
+            continue
+        if c.isalnum() or c == "-" or c == "_":
+            j = i
+            while j < n and fragment[j] not in DELIMITERS:
+                j += 1
+            if j < n or not truncated:
+                # A number or literal, else an unquoted key or value; at the end of
+                # truncated output it may be half-written, so it is dropped
+                word = fragment[i:j].rstrip()
+                tokens.append(word if NUMBER.fullmatch(word) else LITERALS.get(word) or json.dumps(word))
+            i = j
+            continue
+        if c == ",":
+            j = i + 1
+            while j < n and fragment[j].isspace():
+                j += 1
+            if j == n or fragment[j] in "}]":
+                i += 1
+                continue
+        elif c in CLOSERS:
+            stack.append(CLOSERS[c])
+        elif c == "}" or c == "]":
+            if stack:
+                stack.pop()
+        tokens.append(c)
+        i += 1
+
+    cut_key = None
+    if truncated:
+        cut_key = _drop_dangling(tokens, stack, open_string)
+        tokens.extend(reversed(stack))
+    return "".join(tokens), cut_key
+
+
+def _read_string(text: str, start: int, tokens: List[str]) -> Tuple[int, bool]:
+    """Append the string starting at text[start] as a double-quoted JSON string.
+
+    Returns the index after it and whether its closing quote was found.
+    """
+    quote = text[start]
+    chunks = ['"']
+    i = start + 1
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c == "\\" and i + 1 < n:
+            # \' is not a JSON escape
+            chunks.append("'" if text[i + 1] == "'" else text[i:i + 2])
+            i += 2
+            continue
+        if c == quote:
+            tokens.append("".join(chunks) + '"')
+            return i + 1, True
+        if c == '"':
+            chunks.append('\\"')
+        elif c == "\n":
+            chunks.append("\\n")
+        elif c == "\t":
+            chunks.append("\\t")
+        elif c != "\r" and c != "\\":  # a backslash here ends truncated output
+            chunks.append(c)
+        i += 1
+    tokens.append("".join(chunks) + '"')
+    return i, False
+
+
+def _drop_dangling(tokens: List[str], stack: List[str], open_string: bool) -> Optional[str]:
+    """Trim the tail of truncated output back to the last complete value.
+
+    Returns the key of the object member whose value was cut short (a string
+    the output ended inside, which is kept) or never written (which is
+    dropped along with its key), if the output ended inside one.
+    """
+    cut_key = None
+    colon = False
+    while tokens:
+        last = tokens[-1]
+        if last.isspace() or last == ",":
+            tokens.pop()
+        elif last == ":":
+            tokens.pop()
+            colon = True
+        elif last in ("{", "["):
+            # Opened and never filled; keep it, the stack closes it
+            return cut_key
+        elif last.startswith('"') and stack and stack[-1] == "}" and _previous(tokens) in ("{", ","):
+            # A key with no value
+            if colon:
+                cut_key = json.loads(last)
+            tokens.pop()
+        else:
+            if open_string and _previous(tokens) == ":":
+                cut_key = json.loads(_previous(tokens, 2))
+            return cut_key
+        # Whatever is left ends in a complete token
+        open_string = False
+    return cut_key
+
+
+def _previous(tokens: List[str], back: int = 1) -> str:
+    """The token `back` places before the last one, ignoring whitespace"""
+    for token in reversed(tokens[:-1]):
+        if not token.isspace():
+            back -= 1
+            if back == 0:
+                return token
+    return ""
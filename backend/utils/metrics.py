@@ -0,0 +1,199 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+from ..config import settings
+
+# Seconds; covers a parse (sub-millisecond) up to a slow LLM call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Starlette appends "; charset=utf-8" to text/* media types
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not settings.metrics_enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    """Fixed-bucket histogram; observations only touch one counter array under a lock"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [counts per bucket + overflow, sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        if not settings.metrics_enabled:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the duration of the block, including blocks that raise"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+GMAIL_FETCH_SECONDS = metrics.histogram(
+    "billing_gmail_fetch_seconds", "Time to fetch and parse a list of sent emails"
+)
+GMAIL_REQUEST_SECONDS = metrics.histogram(
+    "billing_gmail_request_seconds", "Gmail API round trips by call", ["call"]
+)
+EMAIL_PARSE_SECONDS = metrics.histogram(
+    "billing_email_parse_seconds", "Time to parse one Gmail message",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+)
+SUMMARIZE_SECONDS = metrics.histogram(
+    "billing_summarize_seconds", "LLM summarization of one email or one batched prompt", ["mode"]
+)
+TOGETHER_REQUEST_SECONDS = metrics.histogram(
+    "billing_together_request_seconds", "Together chat completion requests by model tier and HTTP status",
+    ["tier", "status"]
+)
+LLM_JSON_PARSES = metrics.counter(
+    "billing_llm_json_parses_total",
+    "Model outputs parsed into summaries, by JSON kind, outcome (ok, repaired, failed, invalid) and whether "
+    "the output was cut off",
+    ["kind", "outcome", "truncated"]
+)
+TOGETHER_TOKENS = metrics.counter(
+    "billing_together_tokens_total", "Tokens reported in Together usage, by model tier and kind", ["tier", "kind"]
+)
+TOGETHER_TRUNCATED = metrics.counter(
+    "billing_together_truncated_total", "Completions cut off at max_tokens, by model tier", ["tier"]
+)
+TOGETHER_COST = metrics.counter(
+    "billing_together_cost_usd_total", "Estimated Together spend in USD, by model tier", ["tier"]
+)
+MODEL_ROUTES = metrics.counter(
+    "billing_model_routes_total", "Prompts routed to each model tier, by reason", ["tier", "reason"]
+)
+CLIO_REQUEST_SECONDS = metrics.histogram(
+    "billing_clio_request_seconds", "Clio activity requests by method and HTTP status", ["method", "status"]
+)
+POLL_SECONDS = metrics.histogram(
+    "billing_poll_seconds", "Scheduled mailbox polls (sync and summarize) by outcome", ["status"],
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+)
+
+
+def record_together_usage(response_json: Dict[str, object], tier: str = "default"):
+    """Count prompt and completion tokens from a Together chat completion response"""
+    usage = response_json.get("usage") or {}
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            TOGETHER_TOKENS.inc(usage[kind], tier=tier, kind=kind[:-len("_tokens")])
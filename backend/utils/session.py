@@ -0,0 +1,38 @@
+import hmac
+import uuid
+import hashlib
+from fastapi import Request, Response
+from ..config import settings
+from ..services.credential_store import DEFAULT_USER_ID
+
+# Long enough to outlive a Clio refresh token
+COOKIE_MAX_AGE = 365 * 24 * 3600
+
+
+def _signature(user_id: str) -> str:
+    secret = (settings.session_secret or settings.clio_client_secret).encode("utf-8")
+    return hmac.new(secret, user_id.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def current_user_id(request: Request) -> str:
+    """FastAPI dependency: the user named by a validly signed session cookie, else the default user"""
+    cookie = request.cookies.get(settings.session_cookie_name)
+    if cookie:
+        user_id, _, signature = cookie.rpartition(".")
+        if user_id and hmac.compare_digest(signature, _signature(user_id)):
+            return user_id
+    return DEFAULT_USER_ID
+
+
+def new_user_id() -> str:
+    return uuid.uuid4().hex
+
+
+def set_user_cookie(response: Response, user_id: str):
+    response.set_cookie(
+        settings.session_cookie_name,
+        f"{user_id}.{_signature(user_id)}",
+        max_age=COOKIE_MAX_AGE,
+        httponly=True,
+        samesite="lax"
+    )
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import concurrent.futures
+from typing import AsyncIterator, Iterable, TypeVar
+
+T = TypeVar("T")
+
+_DONE = object()
+# How often a producer blocked on a full queue checks whether the consumer has gone away
+_STOP_POLL_SECONDS = 0.5
+
+
+async def iterate_in_thread(items: Iterable[T], maxsize: int = 1) -> AsyncIterator[T]:
+    """Run a blocking iterator start to finish on one worker thread and yield its items.
+
+    Unlike awaiting to_thread(next, ...) per item, every step runs on the same
+    thread, so clients that aren't thread-safe (a Gmail service over httplib2)
+    stay on the thread that created them. At most maxsize items are read ahead.
+    Close the generator (contextlib.aclosing) to stop the thread early.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, maxsize))
+    stopped = threading.Event()
+
+    def put(item, error=None) -> bool:
+        future = asyncio.run_coroutine_threadsafe(queue.put((item, error)), loop)
+        while not stopped.is_set():
+            try:
+                future.result(timeout=_STOP_POLL_SECONDS)
+                return True
+            except concurrent.futures.TimeoutError:
+                continue
+        future.cancel()
+        return False
+
+    def produce():
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(_DONE, e)
+            return
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        put(_DONE)
+
+    producer = asyncio.ensure_future(asyncio.to_thread(produce))
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                break
+            yield item
+        await producer
+    finally:
+        stopped.set()
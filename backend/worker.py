@@ -0,0 +1,99 @@
+"""Standalone job worker processes for JOB_BACKEND=sqlite.
+
+    JOB_BACKEND=sqlite JOB_WORKERS=0 uvicorn backend.main:app --workers 2
+    JOB_BACKEND=sqlite python -m backend.worker --processes 8
+
+The web processes only queue jobs; each worker process runs JOB_WORKERS
+asyncio workers that claim jobs from the shared SQLite job store, so the
+fetch, parse and summarize pipeline uses every core of the host.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+from typing import Callable, Optional
+
+from .config import settings
+from .services.clio_service import clio_service
+from .services.job_service import job_service
+from .services.summarizer_service import summarizer_service
+
+logger = logging.getLogger(__name__)
+
+
+async def serve(configure: Optional[Callable[[], None]] = None):
+    """Run this process's job workers until SIGTERM or SIGINT, then requeue unfinished jobs"""
+    if configure is not None:
+        configure()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    job_service.start()
+    logger.info(f"Worker {job_service.worker_id} running {len(job_service._workers)} job workers")
+    try:
+        await stop.wait()
+    finally:
+        await job_service.stop()
+        await summarizer_service.aclose()
+        await clio_service.aclose()
+
+
+def run_process(configure: Optional[Callable[[], None]] = None):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(configure))
+
+
+def start_processes(count: int, configure: Optional[Callable[[], None]] = None) -> list:
+    """Spawn worker processes; configure (a picklable function) runs in each before its workers start"""
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_process, args=(configure,), name=f"billing-worker-{i}")
+        for i in range(count)
+    ]
+    for process in processes:
+        process.start()
+    return processes
+
+
+def stop_processes(processes: list, timeout: float = 30):
+    for process in processes:
+        if process.is_alive():
+            os.kill(process.pid, signal.SIGTERM)
+    for process in processes:
+        process.join(timeout)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend.worker", description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="worker processes to run (default: one per core)")
+    args = parser.parse_args(argv)
+
+    if settings.job_backend != "sqlite":
+        print("Worker processes need JOB_BACKEND=sqlite so they share jobs with the web process", file=sys.stderr)
+        return 2
+    if args.processes == 1:
+        run_process()
+        return 0
+
+    processes = start_processes(args.processes)
+    # Forward Ctrl-C / SIGTERM to the children and wait for them to requeue their jobs
+    signal.signal(signal.SIGTERM, lambda *_: stop_processes(processes))
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        stop_processes(processes)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
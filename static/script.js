@@ -13,6 +13,10 @@ class BillingApp {
 
     bindEvents() {
         // Button event listeners
+        document.getElementById('gmail-login-btn').addEventListener('click', () => {
+            window.location.href = '/gmail/login';
+        });
+
         document.getElementById('clio-login-btn').addEventListener('click', () => {
             window.location.href = '/clio/login';
         });
@@ -114,6 +118,9 @@ class BillingApp {
 
         try {
             const response = await fetch('/api/emails');
+            if (response.status === 401) {
+                throw new Error('Gmail is not connected, use "Connect Gmail" first');
+            }
             if (!response.ok) {
                 throw new Error(`HTTP ${response.status}: ${response.statusText}`);
             }
@@ -183,29 +190,71 @@ class BillingApp {
     }
 
     async generateSummaries() {
-        this.showLoading(true);
         this.showStatus('Generating AI summaries...', 'info');
+        document.getElementById('summarize-btn').disabled = true;
+
+        this.currentSummaries = [];
+        document.getElementById('summary-list').innerHTML = '';
+        this.switchTab('summaries');
 
         try {
-            const response = await fetch('/api/summaries');
+            const response = await fetch('/api/summaries/stream');
+            if (response.status === 401) {
+                throw new Error('Gmail is not connected, use "Connect Gmail" first');
+            }
             if (!response.ok) {
                 throw new Error(`HTTP ${response.status}: ${response.statusText}`);
             }
 
-            const summaries = await response.json();
-            this.currentSummaries = summaries;
-            this.renderSummaries(summaries);
-            this.switchTab('summaries');
+            // Each line of the response is one finished summary
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { done, value } = await reader.read();
+                buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (line.trim()) {
+                        this.addSummary(JSON.parse(line));
+                    }
+                }
+
+                if (done) break;
+            }
 
-            this.showStatus(`✅ Generated ${summaries.length} summaries`, 'success');
+            if (this.currentSummaries.length === 0) {
+                this.renderSummaries([]);
+            }
+            // Summaries the background poller already made arrive first, without waiting on the LLM
+            const precomputed = this.currentSummaries.filter(item => item.precomputed).length;
+            const generated = this.currentSummaries.length - precomputed;
+            this.showStatus(
+                precomputed ? `✅ Loaded ${precomputed} precomputed and generated ${generated} summaries`
+                            : `✅ Generated ${generated} summaries`,
+                'success'
+            );
         } catch (error) {
             console.error('Error generating summaries:', error);
             this.showStatus(`❌ Failed to generate summaries: ${error.message}`, 'error');
         } finally {
-            this.showLoading(false);
+            document.getElementById('summarize-btn').disabled = false;
         }
     }
 
+    addSummary(item) {
+        if (!item.summary) {
+            throw new Error(item.error || 'Invalid summary');
+        }
+
+        this.currentSummaries.push(item);
+        document.getElementById('summary-list').insertAdjacentHTML('beforeend', this.renderSummaryItem(item));
+        this.showStatus(`Generating AI summaries... ${this.currentSummaries.length} ready`, 'info');
+    }
+
     renderSummaries(summaries) {
         const summaryList = document.getElementById('summary-list');
 
@@ -219,35 +268,37 @@ class BillingApp {
             return;
         }
 
-        summaryList.innerHTML = summaries.map(item => {
-            if (item.summary.error) {
-                return `
-                    <div class="summary-item">
-                        <div class="email-header">
-                            <div class="email-subject">${item.subject || 'No Subject'}</div>
-                            <div class="email-to">To: ${item.to || 'Unknown'}</div>
-                        </div>
-                        <div class="summary-content" style="background: #fed7d7; border-color: #f56565;">
-                            <strong>❌ Error:</strong> ${item.summary.error}
-                        </div>
-                    </div>
-                `;
-            }
+        summaryList.innerHTML = summaries.map(item => this.renderSummaryItem(item)).join('');
+    }
 
+    renderSummaryItem(item) {
+        if (item.summary.error) {
             return `
                 <div class="summary-item">
                     <div class="email-header">
                         <div class="email-subject">${item.subject || 'No Subject'}</div>
                         <div class="email-to">To: ${item.to || 'Unknown'}</div>
                     </div>
-                    <div class="summary-type ${item.summary.type.toLowerCase().replace('entry', '-entry')}">${item.summary.type}</div>
-                    <div class="summary-content">
-                        <strong>Summary:</strong> ${item.summary.summary}
+                    <div class="summary-content" style="background: #fed7d7; border-color: #f56565;">
+                        <strong>❌ Error:</strong> ${item.summary.error}
                     </div>
-                    ${this.renderSummaryDetails(item.summary)}
                 </div>
             `;
-        }).join('');
+        }
+
+        return `
+            <div class="summary-item">
+                <div class="email-header">
+                    <div class="email-subject">${item.subject || 'No Subject'}</div>
+                    <div class="email-to">To: ${item.to || 'Unknown'}</div>
+                </div>
+                <div class="summary-type ${item.summary.type.toLowerCase().replace('entry', '-entry')}">${item.summary.type}</div>
+                <div class="summary-content">
+                    <strong>Summary:</strong> ${item.summary.summary}
+                </div>
+                ${this.renderSummaryDetails(item.summary)}
+            </div>
+        `;
     }
 
     renderSummaryDetails(summary) {
@@ -301,14 +352,16 @@ class BillingApp {
                 throw new Error(`HTTP ${response.status}: ${response.statusText}`);
             }
 
-            const result = await response.json();
+            const job = await this.waitForJob(await response.json());
+            const skipped = job.stages.summarize.skipped + job.stages.push.skipped;
+            const skippedMsg = skipped ? ` (${skipped} already pushed)` : '';
 
-            if (result.status === 'success') {
-                this.showStatus(`✅ Successfully pushed ${result.activities_created.length} activities to Clio`, 'success');
+            if (job.status === 'completed' && job.stages.push.failed === 0) {
+                this.showStatus(`✅ Successfully pushed ${job.activities_created} activities to Clio${skippedMsg}`, 'success');
             } else {
                 let errorMsg = 'Failed to push to Clio';
-                if (result.errors && result.errors.length > 0) {
-                    errorMsg += ': ' + result.errors.join(', ');
+                if (job.errors && job.errors.length > 0) {
+                    errorMsg += ': ' + job.errors.join(', ');
                 }
                 this.showStatus(`❌ ${errorMsg}`, 'error');
             }
@@ -320,6 +373,25 @@ class BillingApp {
         }
     }
 
+    async waitForJob(job) {
+        while (job.status === 'queued' || job.status === 'running') {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+
+            const response = await fetch(`/jobs/${job.job_id}`);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+            }
+            job = await response.json();
+
+            const stages = job.stages;
+            this.showStatus(
+                `Pushing to Clio... fetched ${stages.fetch.processed}, summarized ${stages.summarize.processed}, pushed ${stages.push.processed}`,
+                'info'
+            );
+        }
+        return job;
+    }
+
     truncateText(text, maxLength) {
         if (text.length <= maxLength) return text;
         return text.substring(0, maxLength) + '...';